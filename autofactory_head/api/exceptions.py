@@ -8,3 +8,13 @@ class ActivationFailed(APIException):
 
 class BadRequest(APIException):
     status_code = status.HTTP_400_BAD_REQUEST
+
+
+class Overloaded(APIException):
+    """ Сервер не успевает обработать запросы. Клиент повторяет запрос через wait секунд (заголовок Retry-After) """
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Сервер перегружен, повторите запрос позже'
+
+    def __init__(self, wait: int, detail=None):
+        self.wait = wait
+        super().__init__(detail)
@@ -0,0 +1,48 @@
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from api.routers import get_task_routers
+from tasks.task_services import claim_task_job, run_task_job, wait_task_jobs
+
+
+class Command(BaseCommand):
+    help = 'Обрабатывает отложенные задания на создание заданий, переданные с параметром async'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Количество потоков обработки')
+        parser.add_argument('--timeout', type=int, default=5,
+                            help='Время ожидания новых заданий в секундах, после которого база опрашивается заново')
+        parser.add_argument('--once', action='store_true', help='Обработать накопленные задания и завершиться')
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        workers = [threading.Thread(target=self.work, args=(stop, options), daemon=True)
+                   for _ in range(options['workers'])]
+        for worker in workers:
+            worker.start()
+
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            stop.set()
+            for worker in workers:
+                worker.join()
+
+    def work(self, stop: threading.Event, options: dict) -> None:
+        try:
+            while not stop.is_set():
+                close_old_connections()
+                job = claim_task_job()
+                if job is None:
+                    if options['once']:
+                        break
+                    wait_task_jobs(options['timeout'])
+                    continue
+
+                run_task_job(job, get_task_routers(job.api_version))
+                self.stdout.write(f'{job.type_task} {job.guid}: {job.status}')
+        finally:
+            connection.close()
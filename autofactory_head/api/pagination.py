@@ -0,0 +1,125 @@
+import base64
+import json
+from typing import Iterator
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import QuerySet, Q
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.serializers import Serializer
+
+from api.exceptions import BadRequest
+
+
+class KeysetPagination(BasePagination):
+    """ Постраничная выдача по ключу (дата создания, гуид). Следующая страница читается по индексу
+    от последней записи предыдущей, поэтому время ответа не зависит от номера страницы.
+    Включается параметрами cursor либо limit, без них список отдается целиком как раньше """
+
+    ordering = ('creation_date', 'guid')
+    page_size = 1000
+    max_page_size = 5000
+
+    def __init__(self):
+        self.next_cursor = None
+
+    def paginate_queryset(self, queryset: QuerySet, request, view=None) -> list | None:
+        if 'cursor' not in request.query_params and 'limit' not in request.query_params:
+            return None
+
+        limit = self.get_limit(request.query_params.get('limit'))
+        page = list(get_keyset_page(queryset, self.ordering, request.query_params.get('cursor'), limit + 1))
+        if len(page) > limit:
+            page = page[:limit]
+            self.next_cursor = encode_cursor(page[-1], self.ordering)
+        return page
+
+    def get_paginated_response(self, data) -> Response:
+        return Response({'next': self.next_cursor, 'results': data})
+
+    def get_limit(self, value: str | None) -> int:
+        if not value:
+            return self.page_size
+        try:
+            limit = int(value)
+        except ValueError:
+            raise BadRequest('Некорректный размер страницы')
+        if limit < 1:
+            raise BadRequest('Некорректный размер страницы')
+        return min(limit, self.max_page_size)
+
+    def get_streaming_response(self, queryset: QuerySet, serializer_class: type(Serializer)) -> StreamingHttpResponse:
+        """ Выгрузка всего списка одним ответом JSON, сформированным по страницам """
+        response = StreamingHttpResponse(stream_keyset_pages(queryset, serializer_class, self.ordering,
+                                                             self.page_size), content_type='application/json')
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+
+def encode_cursor(instance, ordering: tuple) -> str:
+    """ Курсор страницы: значения ключа последней записи. Дата хранится с микросекундами,
+    иначе записи, созданные в одну миллисекунду, попадали бы на страницу повторно """
+    creation_date, *values = [getattr(instance, field) for field in ordering]
+    values = [creation_date.isoformat(), *map(str, values)]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor: str, ordering: tuple) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise BadRequest('Некорректный курсор')
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise BadRequest('Некорректный курсор')
+    if not all(isinstance(value, str) for value in values):
+        raise BadRequest('Некорректный курсор')
+    try:
+        creation_date = parse_datetime(values[0])
+    except ValueError:
+        creation_date = None
+    if creation_date is None:
+        raise BadRequest('Некорректный курсор')
+    return [creation_date, *values[1:]]
+
+
+def get_keyset_page(queryset: QuerySet, ordering: tuple, cursor: str | None, limit: int) -> QuerySet:
+    """ Страница записей после курсора в порядке ключа """
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        try:
+            queryset = queryset.filter(get_keyset_filter(ordering, decode_cursor(cursor, ordering)))
+        except ValidationError:
+            raise BadRequest('Некорректный курсор')
+    return queryset[:limit]
+
+
+def get_keyset_filter(ordering: tuple, values: list) -> Q:
+    """ Условие "ключ записи больше values" в порядке полей ordering """
+    keyset_filter = Q()
+    equal = {}
+    for field, value in zip(ordering, values):
+        keyset_filter |= Q(**equal, **{f'{field}__gt': value})
+        equal[field] = value
+    return keyset_filter
+
+
+def stream_keyset_pages(queryset: QuerySet, serializer_class: type(Serializer), ordering: tuple,
+                        page_size: int) -> Iterator[str]:
+    """ Массив JSON по частям. В памяти одновременно находится не больше одной страницы записей """
+    yield '['
+    cursor = None
+    separator = ''
+    while True:
+        page = list(get_keyset_page(queryset, ordering, cursor, page_size))
+        if not page:
+            break
+        for item in serializer_class(page, many=True).data:
+            yield separator + json.dumps(item, cls=DjangoJSONEncoder, ensure_ascii=False)
+            separator = ','
+        if len(page) < page_size:
+            break
+        cursor = encode_cursor(page[-1], ordering)
+    yield ']'
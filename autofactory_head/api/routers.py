@@ -0,0 +1,74 @@
+from functools import cache
+from types import MappingProxyType
+
+from api.v1 import routers as routers_v1
+from api.v3 import routers as routers_v3
+from api.v4 import routers as routers_v4
+from tasks.task_services import RouterTask, RouterContent, get_model_filter, TASK_FILTER_FLAGS
+
+
+@cache
+def get_task_registry() -> MappingProxyType:
+    """ Роутеры заданий по версиям API. Каждая версия расширяет роутеры предыдущей,
+    реестр собирается один раз при старте и не изменяется """
+    task_routers_v1 = routers_v1.get_task_router()
+    task_routers_v3 = task_routers_v1 | routers_v3.get_task_router()
+    task_routers_v4 = task_routers_v3 | routers_v4.get_task_router()
+
+    registry = MappingProxyType({
+        'v1': MappingProxyType(task_routers_v1),
+        'v3': MappingProxyType(task_routers_v3),
+        'v4': MappingProxyType(task_routers_v4),
+    })
+    for task_router in task_routers_v4.values():
+        get_model_filter(task_router.task, TASK_FILTER_FLAGS)
+    return registry
+
+
+@cache
+def get_content_registry() -> MappingProxyType:
+    """ Роутеры содержимого заданий """
+    registry = MappingProxyType(routers_v1.get_content_router())
+    for content_router in registry.values():
+        get_model_filter(content_router.object_model)
+    return registry
+
+
+def get_task_routers(api_version: str) -> MappingProxyType:
+    """ Роутеры заданий указанной версии API """
+    return get_task_registry()[api_version]
+
+
+def describe_task_router(task_router: RouterTask) -> dict:
+    """ Описание роутера задания для просмотра реестра """
+    model_filter = get_model_filter(task_router.task, TASK_FILTER_FLAGS)
+    return {
+        'task': task_router.task._meta.label,
+        'create_function': _get_name(task_router.create_function),
+        'read_serializer': _get_name(task_router.read_serializer),
+        'write_serializer': _get_name(task_router.write_serializer),
+        'answer_serializer': _get_name(task_router.answer_serializer),
+        'change_content_function': _get_name(task_router.change_content_function),
+        'change_properties_function': _get_name(task_router.change_properties_function),
+        'custom_methods': sorted(task_router.custom_methods or ()),
+        'etag_models': None if task_router.etag_models is None else [model._meta.label
+                                                                     for model in task_router.etag_models],
+        'filter_fields': dict(sorted(model_filter.types.items())),
+    }
+
+
+def describe_content_router(content_router: RouterContent) -> dict:
+    """ Описание роутера содержимого для просмотра реестра """
+    return {
+        'object_model': content_router.object_model._meta.label,
+        'content_model': content_router.content_model._meta.label,
+        'object_key_name': content_router.object_key_name,
+        'serializer': _get_name(content_router.serializer),
+        'filter_fields': dict(sorted(get_model_filter(content_router.object_model).types.items())),
+    }
+
+
+def _get_name(value) -> str | None:
+    if value is None:
+        return None
+    return f'{value.__module__}.{value.__qualname__}'
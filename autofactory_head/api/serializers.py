@@ -7,6 +7,7 @@ from catalogs.models import (Client, Department, Device, Direction, Line, Log, O
 from factory_core.models import Shift, ShiftProduct
 from packing.marking_services import get_base64_string
 from packing.models import MarkingOperation
+from tasks.models import TaskJob
 from users.models import Setting, UserElement
 from warehouse_management.models import PalletContent, Pallet, StorageCell, StorageArea
 
@@ -157,6 +158,14 @@ class LogSerializer(serializers.ModelSerializer):
         model = Log
 
 
+class TaskJobSerializer(serializers.ModelSerializer):
+    job = serializers.UUIDField(source='guid')
+
+    class Meta:
+        fields = ('job', 'type_task', 'status', 'result', 'error', 'creating_date', 'start_date', 'finish_date')
+        model = TaskJob
+
+
 class SettingSerializer(serializers.ModelSerializer):
     pallet_passport_template_base64 = serializers.SerializerMethodField()
     reg_exp = serializers.SerializerMethodField()
@@ -241,6 +250,12 @@ class RegularExpressionSerializer(serializers.ModelSerializer):
         model = RegularExpression
 
 
+class RegularExpressionChangeSerializer(serializers.ModelSerializer):
+    class Meta:
+        fields = ('id', 'value', 'type_expression')
+        model = RegularExpression
+
+
 class AggregationsSerializer(serializers.Serializer):
     aggregation_code = serializers.CharField(required=False)
     product = serializers.CharField(required=False)
@@ -1,4 +1,30 @@
+from django.apps import apps
+from django.db import connection
+
+from api.exceptions import BadRequest
+from api.serializers import (ProductSerializer, UnitSerializer, LineSerializer, RegularExpressionChangeSerializer,
+                             StorageSerializer)
+from api.v3.serializers import StorageAreaSerializer
+from catalogs.models import CatalogChange
+from catalogs.signals import CATALOG_MODELS
 from packing.models import MarkingOperation
+from warehouse_management.serializers import StorageCellsSerializer
+
+CATALOG_SERIALIZERS = {
+    'products': ProductSerializer,
+    'units': UnitSerializer,
+    'lines': LineSerializer,
+    'regexps': RegularExpressionChangeSerializer,
+    'storages': StorageSerializer,
+    'cells': StorageCellsSerializer,
+    'areas': StorageAreaSerializer,
+}
+
+CATALOG_PREFETCH = {
+    'products': ('units',),
+    'lines': ('products',),
+    'cells': ('storage_area',),
+}
 
 
 def confirm_marks_unloading(operations: list) -> None:
@@ -8,3 +34,36 @@ def confirm_marks_unloading(operations: list) -> None:
         operation = MarkingOperation.objects.get(guid=guid)
         operation.unloaded = True
         operation.save()
+
+
+def get_catalog_changes(since: str | None) -> dict:
+    """ Объекты справочников, добавленные либо измененные после версии since, и идентификаторы удаленных.
+    Без версии возвращаются справочники целиком. Версия ответа передается в since следующего запроса """
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            raise BadRequest('Некорректная версия')
+
+    with connection.cursor() as cursor:
+        # Все транзакции, не зафиксированные к этому моменту, получат идентификатор изменения не меньше версии
+        cursor.execute('SELECT txid_snapshot_xmin(txid_current_snapshot())')
+        version = cursor.fetchone()[0]
+
+    changes, deleted = {'version': version}, {}
+    for catalog, label in CATALOG_MODELS.items():
+        queryset = apps.get_model(label).objects.prefetch_related(*CATALOG_PREFETCH.get(catalog, ()))
+        if since is not None:
+            catalog_changes = (CatalogChange.objects.filter(catalog=catalog, change_id__gte=since)
+                               .values_list('object_id', 'deleted'))
+            changed_ids = []
+            deleted[catalog] = []
+            for object_id, is_deleted in catalog_changes:
+                (deleted[catalog] if is_deleted else changed_ids).append(object_id)
+            queryset = queryset.filter(pk__in=changed_ids)
+
+        changes[catalog] = CATALOG_SERIALIZERS[catalog](queryset, many=True).data
+
+    if since is not None:
+        changes['deleted'] = deleted
+    return changes
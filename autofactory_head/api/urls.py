@@ -3,7 +3,7 @@ from django.urls import path, re_path, include
 from .views import (DepartmentList, DeviceViewSet, DirectionListCreateView, LineListCreateView, LogCreateViewSet,
                     MarksViewSet, OrganizationList,
                     ProductViewSet, RegExpList, StorageList, TypeFactoryOperationViewSet,
-                    UnitsCreateListSet, UserRetrieve)
+                    UnitsCreateListSet, UserRetrieve, TaskJobRetrieve, RoutersList, CatalogChangesList)
 
 urlpatterns = [
     re_path(r'v[1-9]/regexp/$', RegExpList.as_view()),
@@ -24,6 +24,9 @@ urlpatterns = [
     re_path(r'v[1-9]/units/$', UnitsCreateListSet.as_view()),
     re_path(r'v[1-9]/marks/add/', MarksViewSet.as_view({'post': 'add_marks'})),
     re_path(r'v[1-9]/marks/remove/', MarksViewSet.as_view({'post': 'remove_marks'})),
+    re_path(r'v[1-9]/routers/$', RoutersList.as_view()),
+    re_path(r'v[1-9]/catalog/changes/$', CatalogChangesList.as_view()),
+    re_path(r'v[1-9]/jobs/(?P<pk>[0-9a-f-]+)/$', TaskJobRetrieve.as_view()),
 
     path('v1/', include('api.v1.urls')),
     path('v2/', include('api.v2.urls')),
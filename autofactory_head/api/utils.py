@@ -1,8 +1,19 @@
+import hashlib
+import json
 import time
-from typing import Callable
+from typing import Callable, Iterable
+
 from django.core.cache import cache
+from django.db import connection, models
+from django.http import JsonResponse
+from rest_framework import status
 from rest_framework.exceptions import APIException
 from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from catalogs.models import CatalogChange
+from catalogs.signals import CATALOG_MODELS
+from tasks.models import Task, TaskTombstone
 
 
 def cache_api(request, body: dict, function: Callable, *args, **kwargs):
@@ -30,3 +41,87 @@ def cache_api(request, body: dict, function: Callable, *args, **kwargs):
         return Response(cache_data['body'], status=cache_data['status_code'])
     else:
         return function(request, *args, **kwargs)
+
+
+def check_api_access(request) -> JsonResponse | None:
+    """ Аутентификация и проверка прав для представлений вне DRF по настройкам REST_FRAMEWORK.
+    Возвращает ответ с ошибкой либо None, если доступ разрешен """
+    view = APIView()
+    view.args, view.kwargs, view.headers = (), {}, {}
+    drf_request = view.initialize_request(request)
+    try:
+        view.initial(drf_request)
+    except APIException as e:
+        return JsonResponse({'detail': e.detail}, status=e.status_code)
+
+    request.user = drf_request.user
+    return None
+
+
+def get_changes_etag(request, etag_models: Iterable[type(models.Model)]) -> str | None:
+    """ ETag ответа по отметкам изменений моделей, из которых он строится, адресу запроса и пользователю.
+    Отметки читаются до выборки данных одним запросом без блокировок. None - изменения моделей, возможно,
+    еще не зафиксированы, и ответ нельзя пометить """
+    markers = get_change_markers(etag_models)
+    if markers is None:
+        return None
+    key = json.dumps([request.get_full_path(), request.user.pk, markers])
+    return f'"{hashlib.md5(key.encode()).hexdigest()}"'
+
+
+def get_change_markers(etag_models: Iterable[type(models.Model)]) -> dict[str, int] | None:
+    """ Последние идентификаторы изменений моделей. Задание отмечает изменение в change_id строки,
+    удаление - в TaskTombstone, справочник - в журнале CatalogChange. Идентификатор изменения - номер транзакции,
+    поэтому отметка надежна, только если ни одна транзакция с меньшим номером не выполняется: ее изменения
+    зафиксируются позже и не увеличат отметку """
+    catalogs = {label: catalog for catalog, label in CATALOG_MODELS.items()}
+    names, queries, params = [], [], []
+    for model in etag_models:
+        label = model._meta.label
+        if issubclass(model, Task):
+            names += [label, f'{label}:deleted']
+            queries += [f'SELECT max(change_id) FROM {model._meta.db_table}',
+                        f'SELECT max(change_id) FROM {TaskTombstone._meta.db_table} WHERE task_model = %s']
+            params.append(model._meta.label_lower)
+        elif label in catalogs:
+            names.append(label)
+            queries.append(f'SELECT max(change_id) FROM {CatalogChange._meta.db_table} WHERE catalog = %s')
+            params.append(catalogs[label])
+        else:
+            raise ValueError(f'Изменения модели {label} не отмечаются')
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT txid_current_snapshot()::text, {", ".join(f"({query})" for query in queries)}',
+                       params)
+        snapshot, *values = cursor.fetchone()
+
+    markers = {name: value or 0 for name, value in zip(names, values)}
+    in_progress = [int(txid) for txid in snapshot.split(':')[2].split(',') if txid]
+    if any(txid <= max(markers.values()) for txid in in_progress):
+        return None
+    return markers
+
+
+def is_not_modified(request, etag: str) -> bool:
+    """ Клиент уже получил ответ с этим ETag """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    return etag in tags or '*' in tags
+
+
+class VersionedListMixin:
+    """ Условный GET списка: при совпадении If-None-Match ответ 304 без выборки и сериализации.
+    Ответ зависит от модели queryset, остальные модели, из которых он строится, перечисляются в version_models """
+    version_models: tuple[type(models.Model), ...] = ()
+
+    def list(self, request, *args, **kwargs):
+        etag = get_changes_etag(request, (self.queryset.model, *self.version_models))
+        if etag and is_not_modified(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        response = super().list(request, *args, **kwargs)
+        if etag:
+            response['ETag'] = etag
+        return response
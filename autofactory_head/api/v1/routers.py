@@ -62,7 +62,8 @@ def get_task_router() -> dict[str: RouterTask]:
                                    create_function=create_shipment_operation,
                                    read_serializer=ShipmentOperationReadSerializer,
                                    write_serializer=ShipmentOperationWriteSerializer,
-                                   content_model=TaskBaseModel),
+                                   content_model=TaskBaseModel,
+                                   etag_models=()),
             'ORDER': RouterTask(task=OrderOperation,
                                 create_function=None,
                                 read_serializer=OrderReadSerializer,
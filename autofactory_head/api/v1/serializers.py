@@ -1,8 +1,11 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
 
-from warehouse_management.models import PalletCollectOperation, OperationPallet, Pallet, PalletStatus, PalletProduct, \
+from warehouse_management.models import PalletCollectOperation, Pallet, PalletStatus, PalletProduct, \
     PalletSource, ShipmentOperation
-from warehouse_management.serializers import PalletProductSerializer, PalletSourceReadSerializer
+from warehouse_management.serializers import (PalletProductSerializer, PalletSourceReadSerializer,
+                                              OperationReadListSerializer, OperationPalletsListSerializer,
+                                              OperationPalletsMixin)
 from datetime import datetime as dt
 
 
@@ -14,6 +17,7 @@ class ShipmentOperationReadSerializer(serializers.ModelSerializer):
     class Meta:
         model = ShipmentOperation
         fields = ('direction', 'date', 'number', 'guid', 'external_key', 'has_selection', 'manager')
+        list_serializer_class = OperationReadListSerializer
 
     @staticmethod
     def get_number(obj):
@@ -41,31 +45,37 @@ class PalletShipmentSerializer(serializers.ModelSerializer):
 
     @staticmethod
     def get_products(obj):
-        products = PalletProduct.objects.filter(pallet=obj)
-        serializer = PalletProductSerializer(products, many=True)
+        serializer = PalletProductSerializer(obj.products.all(), many=True)
         return serializer.data
 
     @staticmethod
     def get_sources(obj):
-        sources = PalletSource.objects.filter(pallet=obj)
-        serializer = PalletSourceReadSerializer(sources, many=True)
+        serializer = PalletSourceReadSerializer(obj.sources.all(), many=True)
         return serializer.data
 
+    @staticmethod
+    def get_prefetch() -> tuple:
+        return (Prefetch('products', PalletProduct.objects.select_related('product', 'order')),
+                Prefetch('sources', PalletSource.objects.select_related('pallet_source', 'product', 'user')))
+
 
-class PalletCollectShipmentSerializer(serializers.ModelSerializer):
+class PalletCollectShipmentSerializer(OperationPalletsMixin, serializers.ModelSerializer):
     pallets = serializers.SerializerMethodField()
     is_owner = serializers.SerializerMethodField()
+    pallet_serializer = PalletShipmentSerializer
 
     class Meta:
         model = PalletCollectOperation
         fields = ('guid', 'date', 'number', 'status', 'pallets', 'user', 'is_owner')
+        list_serializer_class = OperationPalletsListSerializer
 
     def get_is_owner(self, instance):
         return self.root.request_user == instance.user
 
-    @staticmethod
-    def get_pallets(obj):
-        pallet_guids = OperationPallet.objects.filter(operation=obj.guid).values_list('pallet', flat=True)
-        pallets = Pallet.objects.filter(guid__in=pallet_guids, status=PalletStatus.WAITED)
-        serializer = PalletShipmentSerializer(pallets, many=True)
+    @classmethod
+    def get_pallets_queryset(cls):
+        return Pallet.objects.filter(status=PalletStatus.WAITED).prefetch_related(*cls.pallet_serializer.get_prefetch())
+
+    def get_pallets(self, obj):
+        serializer = self.pallet_serializer(self.get_operation_pallets(obj), many=True)
         return serializer.data
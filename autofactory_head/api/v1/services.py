@@ -1,15 +1,17 @@
 import datetime
 
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import QuerySet
 
 from packing.models import MarkingOperationMark
 from warehouse_management.models import (
     PalletContent,
-    Pallet,
     PalletCollectOperation,
     OperationBaseOperation
 )
-from tasks.models import TaskStatus
+from tasks.models import TaskStatus, current_change_id
+from tasks.task_services import get_task_event, publish_task_events
 from warehouse_management.models import OperationPallet
 
 User = get_user_model()
@@ -70,21 +72,46 @@ def get_marks_to_unload() -> list:
     return data
 
 
+def lock_task_to_take(task: type(OperationBaseOperation), guid: str) -> OperationBaseOperation | None:
+    """ Блокирует задание для взятия в работу. Задание в работе и задание, которое в этот момент берет
+    другой пользователь, не возвращаются. Вызывается внутри транзакции """
+    return (task.objects.select_for_update(skip_locked=True, of=('self',)).filter(guid=guid)
+            .exclude(status=TaskStatus.WORK).first())
+
+
+def claim_next_task(queryset: QuerySet, user: User) -> OperationBaseOperation | None:
+    """ Берет в работу первое по дате новое задание выборки. Задания, которые в этот момент берут
+    другие пользователи, пропускаются, поэтому одно задание не достается двоим """
+    with transaction.atomic():
+        instance = (queryset.select_for_update(skip_locked=True, of=('self',)).filter(status=TaskStatus.NEW)
+                    .order_by('date', 'number').first())
+        if instance is not None:
+            task_take(instance, user)
+    return instance
+
+
 def task_take_pallet_collect(instance: PalletCollectOperation, user: User, guid: str) -> None:
-    if instance.status == TaskStatus.NEW and not instance.user:
-        pallet_operation: OperationPallet = OperationPallet.objects.filter(operation=guid).first()
-        if not (pallet_operation.pallet and pallet_operation.pallet.group):
-            return
-
-        pallets = (
-            Pallet.objects.filter(group=pallet_operation.pallet.group)
-            .exclude(guid=pallet_operation.pallet.guid)
-        )
-        operations = OperationPallet.objects.filter(pallet__in=pallets).values_list('operation', flat=True)
-        pallet_collect = PalletCollectOperation.objects.filter(guid__in=operations)
-
-        for item in pallet_collect:
-            task_take(item, user)
+    """ Берет в работу одним запросом новые задания сбора остальных паллет группы паллеты задания """
+    if instance.status != TaskStatus.NEW or instance.user:
+        return
+
+    pallet_operation = OperationPallet.objects.filter(operation=guid).select_related('pallet').first()
+    if not (pallet_operation and pallet_operation.pallet and pallet_operation.pallet.group):
+        return
+
+    operations = (OperationPallet.objects.filter(pallet__group=pallet_operation.pallet.group)
+                  .exclude(pallet=pallet_operation.pallet).values('operation'))
+    guids = list(PalletCollectOperation.objects.select_for_update(skip_locked=True)
+                 .filter(guid__in=operations, status=TaskStatus.NEW).values_list('guid', flat=True))
+    if not guids:
+        return
+
+    PalletCollectOperation.objects.filter(guid__in=guids).update(
+        status=TaskStatus.WORK, user=user, modified=datetime.datetime.now(), change_id=current_change_id())
+    publish_task_events(PalletCollectOperation, [
+        get_task_event(PalletCollectOperation(guid=guid, status=TaskStatus.WORK, user=user), 'changed')
+        for guid in guids
+    ])
 
 
 def task_take(
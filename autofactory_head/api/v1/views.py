@@ -1,19 +1,23 @@
 import time
 import uuid
 
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from rest_framework import status, viewsets, generics
 from rest_framework.exceptions import APIException
 from rest_framework.response import Response
 
 import api.views
-from api.v1.routers import get_task_router, get_content_router
-from api.v1.services import get_marks_to_unload, task_take_pallet_collect, task_take
+from api.pagination import KeysetPagination
+from api.routers import get_task_routers, get_content_registry
+from api.utils import VersionedListMixin, get_changes_etag, is_not_modified
+from api.v1.services import get_marks_to_unload, task_take_pallet_collect, task_take, lock_task_to_take
 from tasks.models import TaskStatus
 from tasks.serializers import TaskPropertiesSerializer
 from tasks.task_services import (change_task_properties, get_task_queryset, TaskException, get_content_queryset,
-                                 RouterTask)
-from warehouse_management.models import Pallet, PalletStatus, StorageCell
+                                 RouterTask, get_task_write_serializer, create_tasks, enqueue_task_job,
+                                 get_task_changes)
+from warehouse_management.models import Pallet, PalletStatus, StorageCell, StorageArea
 from warehouse_management.serializers import (PalletReadSerializer, PalletWriteSerializer, PalletUpdateSerializer,
                                               StorageCellsSerializer)
 from warehouse_management.warehouse_services import create_pallets
@@ -21,13 +25,14 @@ from warehouse_management.warehouse_services import create_pallets
 
 class TasksViewSet(viewsets.ViewSet):
     router = dict[str: RouterTask]
+    api_version = 'v1'
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.router = self.get_routers()
 
     def get_routers(self) -> dict[str: RouterTask]:
-        return get_task_router()
+        return get_task_routers(self.api_version)
 
     def list(self, request, type_task):
         task_router = self.router.get(type_task.upper())
@@ -36,55 +41,68 @@ class TasksViewSet(viewsets.ViewSet):
 
         filter_task = {key: value for key, value in request.query_params.items()}
         filter_task['user'] = self.request.user
+        changed_since = filter_task.pop('changed_since', None)
 
+        if changed_since is not None:
+            data, cursor, removed = self.get_list_data(task_router, filter_task, changed_since)
+            return Response({'cursor': cursor, 'tasks': data, 'removed': removed})
+
+        etag = None
+        if task_router.etag_models is not None:
+            etag = get_changes_etag(request, (task_router.task, *task_router.etag_models))
+            if etag and is_not_modified(request, etag):
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        data, _, _ = self.get_list_data(task_router, filter_task)
+        return Response(data, headers={'ETag': etag} if etag else None)
+
+    def get_list_data(self, task_router: RouterTask, filter_task: dict,
+                      changed_since: str | None = None) -> tuple:
+        cursor, removed = None, None
         try:
             task_queryset = get_task_queryset(task_router.task, filter_task)
+            if changed_since is not None:
+                cursor, task_queryset, removed = get_task_changes(task_router.task, task_queryset, changed_since)
         except TaskException:
             raise APIException('Не найден переданный фильтр')
 
         serializer = task_router.read_serializer(data=task_queryset, many=True)
-        serializer.request_user = request.user
+        serializer.request_user = self.request.user
         serializer.is_valid()
         serializer.save()
-        return Response(serializer.data)
+        return serializer.data, cursor, removed
 
     def create(self, request, type_task):
         task_router = self.router.get(type_task.upper())
         if not task_router:
             raise APIException('Тип задачи не найден')
 
-        if isinstance(request.data, list):
-            serializer = task_router.write_serializer(data=request.data, many=True)
-        else:
-            serializer = task_router.write_serializer(data=request.data)
+        if str(request.query_params.get('async')).capitalize() == 'True':
+            serializer = get_task_write_serializer(task_router, request.data)
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        if serializer.is_valid():
-            response = {'type_task': type_task}
-            result = task_router.create_function(serializer.validated_data, request.user)
-            answer_serializer = task_router.answer_serializer
-            if not answer_serializer:
-                response = response | {'guids': result}
-            else:
-                serializer = answer_serializer(result, many=True)
-                response = response | {'pallets': serializer.data}
-            return Response(response)
-        else:
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            job = enqueue_task_job(type_task, self.api_version, request.data, request.user)
+            return Response({'type_task': type_task, 'job': job.guid, 'status': job.status},
+                            status=status.HTTP_202_ACCEPTED)
+
+        return Response(create_tasks(task_router, type_task, request.data, request.user))
 
     def take(self, request, type_task, guid):
         task_router = self.router.get(type_task.upper())
         if not task_router:
             raise APIException('Тип задачи не найден')
-        instance = task_router.task.objects.filter(guid=guid).first()
-        if instance is None:
-            raise APIException('Задача не найдена')
-        if instance.status == TaskStatus.WORK:
-            raise APIException('Задача уже в работе')
+        with transaction.atomic():
+            instance = lock_task_to_take(task_router.task, guid)
+            if instance is None:
+                if not task_router.task.objects.filter(guid=guid).exists():
+                    raise APIException('Задача не найдена')
+                raise APIException('Задача уже в работе')
 
-        if type_task == 'PALLET_COLLECT_SHIPMENT':
-            task_take_pallet_collect(instance, request.user, guid)
+            if type_task == 'PALLET_COLLECT_SHIPMENT':
+                task_take_pallet_collect(instance, request.user, guid)
 
-        task_take(instance, request.user)
+            task_take(instance, request.user)
 
         return Response({'type_task': type_task, 'guid': guid, 'status': TaskStatus.WORK})
 
@@ -110,8 +128,7 @@ class TasksChangeViewSet(TasksViewSet):
 class TasksContentViewSet(viewsets.ViewSet):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        # TODO здесь будут прочие роутеры
-        self.router = get_content_router()
+        self.router = get_content_registry()
 
     def list(self, request, type_task, content_type):
         content_router = self.router.get(content_type.upper())
@@ -154,6 +171,14 @@ class PalletViewSet(viewsets.ViewSet):
             if request.query_params.get('id') is not None:
                 queryset = queryset.filter(id=request.query_params.get('id'))
 
+        paginator = KeysetPagination()
+        if request.query_params.get('stream') == 'true':
+            return paginator.get_streaming_response(queryset, PalletReadSerializer)
+
+        page = paginator.paginate_queryset(queryset, request)
+        if page is not None:
+            return paginator.get_paginated_response(PalletReadSerializer(page, many=True).data)
+
         serializer = PalletReadSerializer(queryset, many=True)
         return Response(serializer.data)
 
@@ -186,9 +211,10 @@ class PalletRetrieveUpdate(generics.RetrieveAPIView, generics.UpdateAPIView):
         return get_object_or_404(self.queryset, **filter_kwargs)
 
 
-class StorageCellsListCreateViewSet(generics.ListCreateAPIView):
+class StorageCellsListCreateViewSet(VersionedListMixin, generics.ListCreateAPIView):
     """Список и создание складских ячеек"""
     queryset = StorageCell.objects.all()
+    version_models = (StorageArea,)
     serializer_class = StorageCellsSerializer
 
     def get_serializer(self, *args, **kwargs):
@@ -1,6 +1,14 @@
+import base64
+import json
+import uuid
 from collections.abc import Callable
-from typing import NamedTuple, Iterable
+from typing import NamedTuple, Iterable, Iterator
 
+from django.core.serializers.json import DjangoJSONEncoder
+
+from api.exceptions import BadRequest
+from api.pagination import get_keyset_filter
+from packing.marking_services import MARKS_BATCH_SIZE
 from packing.models import MarkingOperationMark, MarkingOperation
 from warehouse_management.models import PalletContent
 
@@ -30,6 +38,68 @@ def get_marks_to_unload() -> dict:
     return data
 
 
+def stream_marks_to_unload(token: str | None = None, chunk_size: int = MARKS_BATCH_SIZE) -> Iterator[str]:
+    """ Марки для выгрузки в 1с построчно в формате NDJSON. Марки читаются серверным курсором в порядке
+    (операция, id) порциями по chunk_size. После каждой порции выдается строка
+    {"checkpoint": токен, "operations": [...]}: токен передается в параметре after для продолжения выгрузки
+    с места обрыва, операции выгружены полностью и могут быть подтверждены методом PUT marks/ """
+    fields = _get_fields_to_unload()
+    values = MarkingOperationMark.objects.filter(operation__ready_to_unload=True, operation__unloaded=False,
+                                                 operation__closed=True).order_by('operation_id', 'id')
+    if token:
+        values = values.filter(get_keyset_filter(('operation_id', 'id'), decode_unload_token(token)))
+    values = values.values('id', 'operation_id', *[field.source for field in fields])
+
+    chunk = []
+    for value in values.iterator(chunk_size=chunk_size):
+        if len(chunk) == chunk_size:
+            yield from _get_unload_chunk_lines(chunk, fields, next_operation=value['operation_id'])
+            chunk = []
+        chunk.append(value)
+    if chunk:
+        yield from _get_unload_chunk_lines(chunk, fields, next_operation=None)
+
+
+def encode_unload_token(value: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps([str(value['operation_id']), value['id']]).encode()).decode()
+
+
+def decode_unload_token(token: str) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except ValueError:
+        raise BadRequest('Некорректный токен продолжения выгрузки')
+    if not isinstance(values, list) or len(values) != 2:
+        raise BadRequest('Некорректный токен продолжения выгрузки')
+    operation, mark_id = values
+    if not isinstance(operation, str) or type(mark_id) is not int:
+        raise BadRequest('Некорректный токен продолжения выгрузки')
+    try:
+        operation = uuid.UUID(operation)
+    except ValueError:
+        raise BadRequest('Некорректный токен продолжения выгрузки')
+    return [operation, mark_id]
+
+
+def _get_unload_chunk_lines(chunk: list, fields: Iterable[Field], next_operation: uuid.UUID | None) -> Iterator[str]:
+    aggregation_codes = {value['aggregation_code'] for value in chunk if value['aggregation_code']}
+    pallets = dict(PalletContent.objects.filter(aggregation_code__in=aggregation_codes).values_list(
+        'aggregation_code', 'pallet__id'))
+
+    for value in chunk:
+        element = {field.destination: value[field.source] for field in fields}
+        element['production_date'] = value['operation__production_date'].strftime("%d.%m.%Y")
+        element['pallet'] = pallets.get(value['aggregation_code'])
+        yield json.dumps(element, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+    # операция выгружена полностью, если ее марки не продолжаются в следующей порции
+    operations = list(dict.fromkeys(value['operation_id'] for value in chunk))
+    if operations[-1] == next_operation:
+        operations.pop()
+    checkpoint = {'checkpoint': encode_unload_token(chunk[-1]), 'operations': operations}
+    yield json.dumps(checkpoint, cls=DjangoJSONEncoder) + '\n'
+
+
 def _get_fields_to_unload() -> Iterable[Field]:
     fields = [Field(source='operation__guid', destination='operation'),
               Field(source='encoded_mark', destination='encoded_mark'),
@@ -1,6 +1,7 @@
 from json import JSONDecodeError
 
 from django.contrib.auth import get_user_model
+from django.http import StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from pydantic.error_wrappers import ValidationError
 from rest_framework import generics, status, filters
@@ -8,9 +9,10 @@ from rest_framework.exceptions import APIException
 from rest_framework.response import Response
 
 import api.views
+from api.pagination import KeysetPagination
 from api.v1.views import TasksViewSet
 from api.v2.serializers import MarkingSerializer
-from api.v2.services import get_marks_to_unload
+from api.v2.services import decode_unload_token, get_marks_to_unload, stream_marks_to_unload
 from catalogs.models import ExternalSource
 from packing.marking_services import marking_close
 from packing.models import MarkingOperation
@@ -27,7 +29,15 @@ User = get_user_model()
 class MarksViewSet(api.views.MarksViewSet):
     @staticmethod
     def marks_to_unload(request):
-        """ Формирует марки для выгрузки в 1с """
+        """ Формирует марки для выгрузки в 1с. С параметром stream=true марки отдаются потоком NDJSON
+        порциями с токеном продолжения, который передается в параметре after """
+        if request.query_params.get('stream') == 'true':
+            token = request.query_params.get('after')
+            if token:
+                decode_unload_token(token)
+            response = StreamingHttpResponse(stream_marks_to_unload(token), content_type='application/x-ndjson')
+            response['Cache-Control'] = 'no-cache'
+            return response
         return Response(data=get_marks_to_unload())
 
 
@@ -37,6 +47,13 @@ class PalletViewSet(generics.ListCreateAPIView):
     filter_backends = (DjangoFilterBackend, filters.SearchFilter)
     filterset_fields = ('id', 'batch_number', 'production_date', 'content_count', 'product', 'status', 'series')
     search_fields = ('id',)
+    pagination_class = KeysetPagination
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('stream') == 'true':
+            return self.paginator.get_streaming_response(self.filter_queryset(self.get_queryset()),
+                                                         self.get_serializer_class())
+        return super().list(request, *args, **kwargs)
 
     def create(self, request, *args, **kwargs):
         serializer = PalletWriteSerializer(data=request.data, many=True)
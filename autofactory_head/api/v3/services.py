@@ -4,7 +4,7 @@ from catalogs.models import Product
 from factory_core.models import Shift
 from pydantic.error_wrappers import ValidationError
 from packing.marking_services import get_base64_string, get_marks_in_shifts
-from packing.models import MarkingOperation, MarkingOperationMark
+from packing.models import MarkingOperation, MarkingOperationMark, get_mark_hash
 
 
 def load_manual_marks(operation: MarkingOperation, data: list) -> None:
@@ -20,7 +20,7 @@ def load_manual_marks(operation: MarkingOperation, data: list) -> None:
     products = {}
     marking_marks_instances = []
 
-    marks_in_shift = get_marks_in_shifts(operation.shift)
+    marks_in_shift = get_marks_in_shifts(operation.shift, (mark.mark for value in marking_data for mark in value.marks))
     valid_marks = set()
     for value in marking_data:
         product = products.get(value.product)
@@ -40,6 +40,7 @@ def load_manual_marks(operation: MarkingOperation, data: list) -> None:
             values = {
                 'operation': operation,
                 'mark': mark.mark,
+                'mark_hash': get_mark_hash(mark.mark),
                 'encoded_mark': get_base64_string(mark.mark),
                 'product': product,
                 'aggregation_code': value.aggregation_code,
@@ -10,16 +10,14 @@ from rest_framework.response import Response
 
 import api.views as api_views
 import api.v3.serializers as api_serializers
-from api.utils import cache_api
+from api.utils import cache_api, VersionedListMixin
 from api.v2.views import TasksChangeViewSet
-from api.v3.routers import get_task_router
 from api.v3.services import load_manual_marks, load_offline_marking_data
 from api.v4.serializers import ShiftSerializerV4
 from factory_core.models import Shift
 from packing.marking_services import create_marking_marks, clear_raw_marks
 from packing.models import MarkingOperation
 from packing.marking_services import shift_close
-from tasks.task_services import RouterTask
 from warehouse_management.models import StorageArea, Pallet, StorageCell
 from warehouse_management.serializers import (
     ChangeCellSerializer, PalletUpdateShipmentSerializer, PalletUpdateRepackingSerializer
@@ -113,12 +111,10 @@ class MarkingViewSet(api_views.MarkingViewSet):
 
 
 class TasksViewSet(TasksChangeViewSet):
-    def get_routers(self) -> dict[str: RouterTask]:
-        parent_routers = super().get_routers()
-        return parent_routers | get_task_router()
+    api_version = 'v3'
 
 
-class StorageAreaListCreateViewSet(generics.ListCreateAPIView):
+class StorageAreaListCreateViewSet(VersionedListMixin, generics.ListCreateAPIView):
     """Список и создание складских ячеек"""
     queryset = StorageArea.objects.all()
     serializer_class = api_serializers.StorageAreaSerializer
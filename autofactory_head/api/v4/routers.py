@@ -37,6 +37,7 @@ def get_task_router() -> dict[str: RouterTask]:
                                    read_serializer=ShipmentOperationReadSerializerV4,
                                    write_serializer=ShipmentOperationWriteSerializer,
                                    content_model=TaskBaseModel,
+                                   etag_models=(),
                                    custom_methods={'check_pallet_collect': check_pallet_collect_shipment}),
             'PALLET_COLLECT_SHIPMENT': RouterTask(task=PalletCollectOperation,
                                                   create_function=None,
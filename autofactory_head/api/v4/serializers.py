@@ -1,5 +1,6 @@
 from django.http import JsonResponse
 from django.db import transaction
+from django.db.models import Prefetch
 from rest_framework import serializers
 from rest_framework.exceptions import APIException
 
@@ -19,7 +20,7 @@ from warehouse_management.models import (
 from warehouse_management.serializers import (
     PalletWriteSerializer, PalletProductSerializer, SuitablePalletSerializer, OperationPalletSerializer,
     PalletSourceReadSerializer, PalletReadSerializer, InventoryAddressWarehouseSerializer,
-    InventoryWriteSerializer, StorageCellsSerializer
+    InventoryWriteSerializer, StorageCellsSerializer, OperationReadListSerializer, OperationPalletsListSerializer
 )
 from catalogs.models import Line
 
@@ -43,6 +44,7 @@ class ShipmentOperationReadSerializerV4(ShipmentOperationReadSerializer):
     class Meta:
         model = ShipmentOperation
         fields = ('direction', 'date', 'number', 'guid', 'external_key', 'has_selection', 'manager', 'car_carrier')
+        list_serializer_class = OperationReadListSerializer
 
 
 class PalletProductReadSerializer(PalletProductSerializer):
@@ -50,11 +52,7 @@ class PalletProductReadSerializer(PalletProductSerializer):
 
     @staticmethod
     def get_suitable_pallets(obj):
-        pallets = SuitablePallets.objects.filter(pallet_product=obj)
-        if not pallets.count():
-            return []
-
-        serializer = SuitablePalletSerializer(pallets, many=True)
+        serializer = SuitablePalletSerializer(obj.suitablepallets_set.all(), many=True)
         return serializer.data
 
 
@@ -63,26 +61,27 @@ class PalletShipmentSerializerV4(PalletShipmentSerializer):
 
     @staticmethod
     def get_products(obj):
-        products = PalletProduct.objects.filter(pallet=obj)
-        serializer = PalletProductReadSerializer(products, many=True)
+        serializer = PalletProductReadSerializer(obj.products.all(), many=True)
         return serializer.data
 
+    @staticmethod
+    def get_prefetch() -> tuple:
+        return (Prefetch('products', PalletProduct.objects.select_related('product', 'order')
+                         .prefetch_related(Prefetch('suitablepallets_set',
+                                                    SuitablePallets.objects.select_related('pallet')))),
+                Prefetch('sources', PalletSource.objects.select_related('pallet_source', 'product', 'user')))
+
 
 class PalletCollectShipmentSerializerV4(PalletCollectShipmentSerializer):
     pallets = serializers.SerializerMethodField()
     user = serializers.SlugRelatedField(read_only=True, slug_field='username')
     modified = serializers.DateTimeField(format='%H:%M')
+    pallet_serializer = PalletShipmentSerializerV4
 
     class Meta:
         model = PalletCollectOperation
         fields = ('guid', 'date', 'number', 'status', 'pallets', 'user', 'is_owner', 'modified')
-
-    @staticmethod
-    def get_pallets(obj):
-        pallet_guids = OperationPallet.objects.filter(operation=obj.guid).values_list('pallet', flat=True)
-        pallets = Pallet.objects.filter(guid__in=pallet_guids, status=PalletStatus.WAITED)
-        serializer = PalletShipmentSerializerV4(pallets, many=True)
-        return serializer.data
+        list_serializer_class = OperationPalletsListSerializer
 
 
 class WriteOffOperationWriteSerializer(serializers.Serializer):
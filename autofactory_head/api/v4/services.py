@@ -12,8 +12,8 @@ from warehouse_management.models import (
     CancelShipmentOperation, ShipmentOperation, MovementShipmentOperation
 )
 from warehouse_management.warehouse_services import (
-    create_pallets, fill_operation_pallets, get_or_create_external_source, remove_boxes_from_pallet,
-    fill_operation_cells, get_cell_state, change_cell_content_state
+    create_pallets, fill_operation_pallets, resolve_external_sources, remove_boxes_from_pallet,
+    fill_operation_cells, get_cell_state, change_cell_content_state, first_rows_by_keys
 )
 
 User = get_user_model()
@@ -34,19 +34,26 @@ def create_collect_operation(serializer_data: Iterable[dict[str: str]], user: Us
 def create_write_off_operation(serializer_data: Iterable[dict[str: str]], user: User) -> Iterable[str]:
     """ Создает операцию списания"""
     result = []
+    serializer_data = list(serializer_data)
+    external_sources, tasks = resolve_external_sources(
+        (element['external_source'] for element in serializer_data), WriteOffOperation
+    )
     for element in serializer_data:
-        external_source = get_or_create_external_source(element)
-        task = WriteOffOperation.objects.filter(external_source=external_source).first()
+        key = element['external_source']['external_key']
+        task = tasks.get(key)
         if task is not None:
             result.append(task.guid)
             continue
 
-        operation = WriteOffOperation.objects.create(external_source=external_source)
+        operation = WriteOffOperation.objects.create(external_source=external_sources[key])
+        tasks[key] = operation
 
-        for row in element['pallets']:
-            pallet = Pallet.objects.filter(id=row['pallet']).first()
-            OperationPallet.objects.create(operation=operation.guid, pallet=pallet, count=row['count'],
-                                           type_operation='WRITE-OFF')
+        pallets = first_rows_by_keys(Pallet.objects.filter(id__in=[row['pallet'] for row in element['pallets']]),
+                                     'id')
+        OperationPallet.objects.bulk_create(
+            [OperationPallet(operation=operation.guid, pallet=pallets.get(('id', row['pallet'])), count=row['count'],
+                             type_operation='WRITE-OFF') for row in element['pallets']]
+        )
         result.append(operation.guid)
     return result
 
@@ -88,23 +95,36 @@ def change_content_write_off_operation(content: dict[str: str], instance: WriteO
 @transaction.atomic
 def create_inventory_operation(serializer_data: Iterable[dict[str: str]], user: User) -> Iterable[str]:
     result = []
+    serializer_data = list(serializer_data)
+    external_sources, tasks = resolve_external_sources(
+        (element['external_source'] for element in serializer_data), InventoryAddressWarehouseOperation
+    )
     for element in serializer_data:
-        external_source = get_or_create_external_source(element)
-        task = InventoryAddressWarehouseOperation.objects.filter(external_source=external_source).first()
+        key = element['external_source']['external_key']
+        task = tasks.get(key)
         if task is not None:
             result.append(task.guid)
             continue
 
-        operation = InventoryAddressWarehouseOperation.objects.create(external_source=external_source)
-
-        for row in element['products']:
-            product = Product.objects.filter(external_key=row['product']).first()
-            pallet = Pallet.objects.filter(id=row['pallet']).first()
-            cell = StorageCell.objects.filter(external_key=row['cell']).first()
-            inventory_content = InventoryAddressWarehouseContent.objects.create(
-                product=product, pallet=pallet, cell=cell, plan=row['plan'], priority=row['priority']
-            )
-            inventory_content.fill_properties(operation)
+        operation = InventoryAddressWarehouseOperation.objects.create(external_source=external_sources[key])
+        tasks[key] = operation
+
+        products = first_rows_by_keys(
+            Product.objects.filter(external_key__in=[row['product'] for row in element['products']]), 'external_key')
+        pallets = first_rows_by_keys(Pallet.objects.filter(id__in=[row['pallet'] for row in element['products']]),
+                                     'id')
+        cells = first_rows_by_keys(
+            StorageCell.objects.filter(external_key__in=[row['cell'] for row in element['products']]), 'external_key')
+
+        InventoryAddressWarehouseContent.bulk_create_for_operation(operation, [
+            InventoryAddressWarehouseContent(
+                product=products.get(('external_key', str(row['product']))),
+                pallet=pallets.get(('id', row['pallet'])),
+                cell=cells.get(('external_key', row['cell'])),
+                plan=row['plan'],
+                priority=row['priority']
+            ) for row in element['products']
+        ])
 
         result.append(operation.guid)
     return result
@@ -123,13 +143,14 @@ def change_content_inventory_operation(content: dict[str: str], instance: Invent
         if InventoryAddressWarehouseContent.objects.filter(operation=instance.guid, pallet=pallet).exists():
             raise APIException(f'Паллета {element.key} не может быть добавлена повторно.')
 
-        row = InventoryAddressWarehouseContent.objects.create(
+        row = InventoryAddressWarehouseContent.from_operation(
+            instance,
             product=pallet.product,
             pallet=pallet,
             cell=StorageCell.objects.get(external_key=element.cell),
             fact=element.count
         )
-        row.fill_properties(instance)
+        row.save()
 
         source = _create_pallet_source_to_inventory(
             row,
@@ -247,14 +268,18 @@ def divide_pallet(serializer_data: dict, user: User) -> list[Pallet]:
 @transaction.atomic
 def create_cancel_shipment(serializer_data, user: User) -> list:
     result = []
+    serializer_data = list(serializer_data)
+    external_sources, operations = resolve_external_sources(
+        (element['external_source'] for element in serializer_data), CancelShipmentOperation
+    )
     for element in serializer_data:
-        external_source = get_or_create_external_source(element)
-        operation = CancelShipmentOperation.objects.filter(external_source=external_source)
-        if operation:
-            result.append(external_source.external_key)
+        key = element['external_source']['external_key']
+        if key in operations:
+            result.append(key)
             continue
 
-        operation = CancelShipmentOperation.objects.create(external_source=external_source)
+        operation = CancelShipmentOperation.objects.create(external_source=external_sources[key])
+        operations[key] = operation
         fill_operation_cells(operation, element['pallets'])
         result.append(operation.guid)
 
@@ -272,23 +297,29 @@ def check_pallet_collect_shipment(instance: ShipmentOperation) -> dict:
 @transaction.atomic
 def create_movement_shipment(serializer_data, _: User) -> list:
     result = []
+    serializer_data = list(serializer_data)
+    external_sources, operations = resolve_external_sources(
+        (element['external_source'] for element in serializer_data), MovementShipmentOperation
+    )
     for element in serializer_data:
-        external_source = get_or_create_external_source(element)
-        operation_movement = MovementShipmentOperation.objects.filter(external_source=external_source).first()
+        key = element['external_source']['external_key']
+        operation_movement = operations.get(key)
         if operation_movement:
             result.append(operation_movement.guid)
             return result
 
-        operation_movement = MovementShipmentOperation.objects.create(external_source=external_source)
+        operation_movement = MovementShipmentOperation.objects.create(external_source=external_sources[key])
+        operations[key] = operation_movement
         result.append(operation_movement.guid)
 
+        pallets = first_rows_by_keys(Pallet.objects.filter(id__in=[row['pallet'] for row in element['pallets']]),
+                                     'id')
+        operation_pallets = []
         for pallet in element['pallets']:
-            operation_pallet = OperationPallet.objects.create(
-                pallet=Pallet.objects.get(id=pallet['pallet']),
-                count=pallet['count'],
-                external_source=external_source
-            )
-            operation_pallet.fill_properties(operation_movement)
+            if ('id', pallet['pallet']) not in pallets:
+                raise APIException(f'Не найдена паллета {pallet["pallet"]}')
+            operation_pallets.append(OperationPallet(pallet=pallets[('id', pallet['pallet'])], count=pallet['count']))
+        OperationPallet.bulk_create_for_operation(operation_movement, operation_pallets)
 
         fill_operation_cells(operation_movement, element['pallets'])
 
@@ -1,11 +1,14 @@
 from django.urls import path, include
 
 from api.v4.views import (
-    TasksViewSetV4, PalletCollectUpdate, UsersListViewSet, PalletDivideViewSet, PalletCollectStoryListView
+    TasksViewSetV4, PalletCollectUpdate, UsersListViewSet, PalletDivideViewSet, PalletCollectStoryListView,
+    FreeCellsListView, RawMarksCreateView, task_events
 )
 
 urlpatterns = [
     path('tasks/<str:type_task>/<uuid:guid>/take/', TasksViewSetV4.as_view({'patch': 'take'})),
+    path('tasks/<str:type_task>/events/', task_events),
+    path('tasks/<str:type_task>/claim/', TasksViewSetV4.as_view({'post': 'claim'})),
     path('tasks/<str:type_task>/', TasksViewSetV4.as_view({'get': 'list', 'post': 'create'})),
     path('tasks/<str:type_task>/<uuid:guid>/', TasksViewSetV4.as_view({'patch': 'change_task'})),
     path('tasks/<str:type_task>/<uuid:guid>/<str:method>/', TasksViewSetV4.as_view({'get': 'custom_method'})),
@@ -13,5 +16,7 @@ urlpatterns = [
     path('pallets/divide/', PalletDivideViewSet.as_view({'patch': 'divide_pallets'})),
     path('users/list/', UsersListViewSet.as_view({'get': 'list'})),
     path('pallets/<uuid:guid>/story/', PalletCollectStoryListView.as_view()),
+    path('cells/free/', FreeCellsListView.as_view()),
+    path('marking/<uuid:pk>/raw_marks/', RawMarksCreateView.as_view()),
     path('', include('api.v3.urls')),
 ]
@@ -1,27 +1,33 @@
 import re
 
+from asgiref.sync import sync_to_async
 from django.contrib.auth import get_user_model
+from django.http import JsonResponse
 from rest_framework import generics, permissions, viewsets, status
 from rest_framework.response import Response
 from rest_framework.request import Request
-from rest_framework.exceptions import APIException
+from rest_framework.exceptions import APIException, NotFound
 
+from api.exceptions import BadRequest
+from api.routers import get_task_routers
+from api.utils import check_api_access
+from api.v1.services import claim_next_task
 from api.v3.views import TasksViewSet
-from api.v4.routers import get_task_router
 from api.v4.serializers import PalletUpdateSerializer, PalletDivideSerializer
 from api.v4.services import divide_pallet
 from catalogs.models import ExternalSource
-from tasks.task_services import RouterTask
+from packing.marking_services import parse_raw_marks, add_raw_marks, raw_marks_ingestion_slot
+from packing.models import MarkingOperation
 from warehouse_management.models import Pallet, PalletSource, PalletProduct
-from warehouse_management.serializers import PalletReadSerializer
+from warehouse_management.serializers import PalletReadSerializer, StorageCellsSerializer
+from tasks.task_services import wait_task_events, TaskException, get_task_queryset
+from warehouse_management.warehouse_services import get_unused_cells_for_placement
 
 User = get_user_model()
 
 
 class TasksViewSetV4(TasksViewSet):
-    def get_routers(self) -> dict[str: RouterTask]:
-        parent_routers = super().get_routers()
-        return parent_routers | get_task_router()
+    api_version = 'v4'
 
     def custom_method(self, request, type_task, guid, method):
         task_router = self.router.get(type_task.upper())
@@ -41,6 +47,28 @@ class TasksViewSetV4(TasksViewSet):
 
         return Response(task_router.custom_methods.get(method)(instance))
 
+    def claim(self, request, type_task):
+        """ Берет в работу первое доступное новое задание типа. Параметры запроса фильтруют задания как в списке.
+        Если доступных заданий нет, возвращает 204 """
+        task_router = self.router.get(type_task.upper())
+        if not task_router:
+            raise APIException('Тип задачи не найден')
+
+        filter_task = {key: value for key, value in request.query_params.items()}
+        filter_task['user'] = self.request.user
+        try:
+            task_queryset = get_task_queryset(task_router.task, filter_task)
+        except TaskException:
+            raise APIException('Не найден переданный фильтр')
+
+        instance = claim_next_task(task_queryset, request.user)
+        if instance is None:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        serializer = task_router.read_serializer(instance)
+        return Response({'type_task': type_task, 'guid': instance.guid, 'status': instance.status,
+                         'task': serializer.data})
+
 
 class PalletCollectUpdate(generics.UpdateAPIView):
     queryset = Pallet.objects.all()
@@ -131,3 +159,54 @@ class PalletCollectStoryListView(generics.ListAPIView):
             result.append(data)
 
         return Response(result)
+
+
+class RawMarksCreateView(generics.GenericAPIView):
+    """Пакетная запись сырых марок автоматического сканера: массив JSON либо марки построчно.
+    Некорректный пакет - 400, неизвестная маркировка - 404, перегрузка - 503 с заголовком Retry-After"""
+
+    def post(self, request, pk):
+        marking = MarkingOperation.objects.filter(guid=pk).first()
+        if marking is None:
+            raise NotFound('Маркировка не найдена')
+
+        marks = parse_raw_marks(request.body, request.content_type)
+        with raw_marks_ingestion_slot():
+            created = add_raw_marks(marking, marks)
+        return Response({'created': created}, status=status.HTTP_201_CREATED)
+
+
+class FreeCellsListView(generics.ListAPIView):
+    """ Свободные ячейки для автоматического размещения. Параметры: limit, storage_area (внешний ключ) """
+    serializer_class = StorageCellsSerializer
+
+    def get_queryset(self):
+        limit = self.request.query_params.get('limit')
+        if limit is not None and (not limit.isdigit() or not int(limit)):
+            raise BadRequest('Параметр limit должен быть положительным числом')
+
+        return get_unused_cells_for_placement(limit=None if limit is None else int(limit),
+                                              storage_area=self.request.query_params.get('storage_area'))
+
+
+async def task_events(request, type_task):
+    """ Долгий опрос событий заданий: ответ приходит при создании, изменении или удалении задания типа
+    либо по истечении timeout секунд. С параметром changed_since ответ приходит сразу,
+    если задания менялись после курсора синхронизации списка """
+    error = await sync_to_async(check_api_access)(request)
+    if error is not None:
+        return error
+
+    task_router = get_task_routers(TasksViewSetV4.api_version).get(type_task.upper())
+    if not task_router:
+        return JsonResponse({'detail': 'Тип задачи не найден'}, status=404)
+
+    try:
+        timeout = max(0.0, min(float(request.GET.get('timeout', 25)), 60))
+        events = await wait_task_events(task_router.task, timeout, request.GET.get('changed_since'))
+    except (ValueError, TaskException):
+        return JsonResponse({'detail': 'Не найден переданный фильтр'}, status=400)
+
+    if events is None:
+        return JsonResponse({'type_task': type_task, 'changed': True, 'events': []})
+    return JsonResponse({'type_task': type_task, 'changed': bool(events), 'events': events})
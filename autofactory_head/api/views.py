@@ -11,20 +11,23 @@ from rest_framework.response import Response
 
 from catalogs.models import (ActivationKey, Department, Device, Direction, Line, LineProduct, Organization, Product,
                              RegularExpression, Storage, TypeFactoryOperation, Unit)
-from packing.marking_services import create_marking_marks, remove_marks
+from packing.marking_services import create_marking_marks, remove_marks, MARKS_BATCH_SIZE
 from packing.models import MarkingOperation, RawMark
+from tasks.models import TaskJob
 from tasks.task_services import TaskException, get_content_queryset
 from warehouse_management.models import Pallet, PalletStatus, StorageCell
 from warehouse_management.serializers import PalletReadSerializer, PalletUpdateSerializer
 
 from api.exceptions import ActivationFailed
+from api.utils import VersionedListMixin
+from api.routers import get_task_registry, get_content_registry, describe_task_router, describe_content_router
 from .serializers import (ConfirmUnloadingSerializer, DepartmentSerializer,
                           DeviceSerializer, DirectionSerializer, LineCreateSerializer, LogSerializer,
                           MarksSerializer, OrganizationSerializer, ProductSerializer,
                           RegularExpressionSerializer, StorageSerializer, TypeFactoryOperationSerializer,
                           UnitSerializer, UserSerializer, LineSerializer, MarkingSerializer,
-                          AggregationsSerializer)
-from .services import confirm_marks_unloading
+                          AggregationsSerializer, TaskJobSerializer)
+from .services import confirm_marks_unloading, get_catalog_changes
 
 User = get_user_model()
 
@@ -45,6 +48,36 @@ class UserRetrieve(generics.RetrieveAPIView):
         return Response(serializer.data)
 
 
+class TaskJobRetrieve(generics.RetrieveAPIView):
+    """Состояние отложенного создания заданий"""
+    serializer_class = TaskJobSerializer
+
+    def get_queryset(self):
+        if self.request.user.is_staff:
+            return TaskJob.objects.all()
+        return TaskJob.objects.filter(user=self.request.user)
+
+
+class RoutersList(generics.GenericAPIView):
+    """Реестр роутеров заданий и содержимого по версиям API"""
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request):
+        tasks = {api_version: {type_task: describe_task_router(task_router)
+                               for type_task, task_router in task_routers.items()}
+                 for api_version, task_routers in get_task_registry().items()}
+        content = {content_type: describe_content_router(content_router)
+                   for content_type, content_router in get_content_registry().items()}
+        return Response({'tasks': tasks, 'content': content})
+
+
+class CatalogChangesList(generics.GenericAPIView):
+    """Изменения справочников после версии since"""
+
+    def get(self, request):
+        return Response(get_catalog_changes(request.query_params.get('since')))
+
+
 class TypeFactoryOperationViewSet(generics.ListCreateAPIView):
     """ Типы производственных операций"""
     queryset = TypeFactoryOperation.objects.all()
@@ -58,9 +91,10 @@ class TypeFactoryOperationViewSet(generics.ListCreateAPIView):
                                                   many=True)
 
 
-class ProductViewSet(generics.ListCreateAPIView):
+class ProductViewSet(VersionedListMixin, generics.ListCreateAPIView):
     """Список и создание товаров"""
     queryset = Product.objects.all()
+    version_models = (Unit,)
     serializer_class = ProductSerializer
     filter_backends = (DjangoFilterBackend,)
     filterset_fields = ('guid', 'external_key')
@@ -72,7 +106,7 @@ class ProductViewSet(generics.ListCreateAPIView):
             return ProductSerializer(data=self.request.data, many=True)
 
 
-class StorageList(generics.ListAPIView):
+class StorageList(VersionedListMixin, generics.ListAPIView):
     """Список складов"""
     queryset = Storage.objects.all()
     serializer_class = StorageSerializer
@@ -259,8 +293,8 @@ class MarksViewSet(viewsets.ViewSet):
         """ Удаляет марки из текущей маркировки """
         serializer = MarksSerializer(data=request.data)
         if serializer.is_valid():
-            remove_marks(serializer.validated_data['marks'])
-            return Response(serializer.data)
+            removed = remove_marks(serializer.validated_data['marks'])
+            return Response({**serializer.data, 'removed': removed})
         return Response(serializer.errors)
 
 
@@ -276,13 +310,13 @@ class LogCreateViewSet(generics.CreateAPIView):
                         data=base64.b64decode(data))
 
 
-class RegExpList(generics.ListAPIView):
+class RegExpList(VersionedListMixin, generics.ListAPIView):
     """Список организаций"""
     queryset = RegularExpression.objects.all()
     serializer_class = RegularExpressionSerializer
 
 
-class UnitsCreateListSet(generics.ListCreateAPIView):
+class UnitsCreateListSet(VersionedListMixin, generics.ListCreateAPIView):
     queryset = Unit.objects.all()
     serializer_class = UnitSerializer
 
@@ -315,7 +349,7 @@ class MarkingViewSet(viewsets.ViewSet):
             else:
                 return Response(serializer.errors)
         elif request.user.role == User.VISION_OPERATOR:
-            data = RawMark.objects.filter(operation=marking).values()
+            data = RawMark.objects.filter(operation=marking).values('mark').iterator(chunk_size=MARKS_BATCH_SIZE)
         else:
             data = []
 
@@ -5,3 +5,8 @@ class CatalogsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'catalogs'
     verbose_name = 'Справочники'
+
+    def ready(self):
+        from .signals import connect_catalog_signals
+
+        connect_catalog_signals()
@@ -0,0 +1,33 @@
+# Generated by Django 4.0.4 on 2026-10-18 19:02
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicate_external_sources(apps, schema_editor):
+    """ Оставляет по одному внешнему источнику на ключ, ссылки дублей переносятся на оставшийся источник """
+    ExternalSource = apps.get_model('catalogs', 'ExternalSource')
+    relations = [field for model in apps.get_models() for field in model._meta.fields
+                 if field.is_relation and field.related_model == ExternalSource]
+
+    duplicates = (ExternalSource.objects.values('external_key').annotate(count=Count('id'), keep_id=Min('id'))
+                  .filter(count__gt=1))
+    for duplicate in duplicates:
+        removed_ids = list(ExternalSource.objects.filter(external_key=duplicate['external_key'])
+                           .exclude(id=duplicate['keep_id']).values_list('id', flat=True))
+        for field in relations:
+            field.model.objects.filter(**{f'{field.name}__in': removed_ids}).update(
+                **{field.name: duplicate['keep_id']})
+        ExternalSource.objects.filter(id__in=removed_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogs', '0056_line_interval_control_scanning_weight_and_more'),
+        ('warehouse_management', '0079_storagecell_placement_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_external_sources, migrations.RunPython.noop),
+    ]
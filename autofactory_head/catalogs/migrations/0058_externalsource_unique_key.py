@@ -0,0 +1,17 @@
+# Generated by Django 4.0.4 on 2026-10-18 19:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogs', '0057_merge_duplicate_external_sources'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='externalsource',
+            constraint=models.UniqueConstraint(fields=('external_key',), name='unique_external_source_key'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.0.4 on 2026-10-18 19:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogs', '0058_externalsource_unique_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('catalog', models.CharField(max_length=50, verbose_name='Справочник')),
+                ('object_id', models.CharField(max_length=36, verbose_name='Идентификатор объекта')),
+                ('deleted', models.BooleanField(default=False, verbose_name='Удален')),
+                ('change_id', models.BigIntegerField(db_index=True, editable=False, verbose_name='Идентификатор изменения')),
+                ('changing_date', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Изменение справочника',
+                'verbose_name_plural': 'Изменения справочников',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='catalogchange',
+            constraint=models.UniqueConstraint(fields=('catalog', 'object_id'), name='unique_catalog_change'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 import uuid
+from typing import Iterable
 
-from django.db import models
+from django.db import connection, models
 from django.db.models import UniqueConstraint
 
 
@@ -217,6 +218,7 @@ class ExternalSource(models.Model):
     class Meta:
         verbose_name = 'Внешний источник'
         verbose_name_plural = 'Внешние источники'
+        constraints = [UniqueConstraint(fields=['external_key'], name='unique_external_source_key')]
 
     def __str__(self):
         return self.name
@@ -264,3 +266,41 @@ class ActivationKey(models.Model):
 
     def __str__(self):
         return self.number
+
+
+class CatalogChange(models.Model):
+    """ Журнал изменений справочников для синхронизации устройств. На каждый объект справочника одна запись,
+    которая обновляется при изменении и удалении объекта. Идентификатор изменения - номер записавшей транзакции """
+
+    catalog = models.CharField('Справочник', max_length=50)
+    object_id = models.CharField('Идентификатор объекта', max_length=36)
+    deleted = models.BooleanField('Удален', default=False)
+    change_id = models.BigIntegerField('Идентификатор изменения', db_index=True, editable=False)
+    changing_date = models.DateTimeField('Дата изменения', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Изменение справочника'
+        verbose_name_plural = 'Изменения справочников'
+        constraints = [UniqueConstraint(fields=['catalog', 'object_id'], name='unique_catalog_change')]
+
+    def __str__(self):
+        return f'{self.catalog} {self.object_id}'
+
+    @classmethod
+    def register(cls, catalog: str, object_ids: Iterable, deleted: bool | None = False) -> None:
+        """ Отмечает объекты справочника измененными либо удаленными. При deleted=None признак удаления
+        не меняется: так отмечается объект, у которого изменилась подчиненная запись """
+        object_ids = sorted({str(object_id) for object_id in object_ids if object_id is not None})
+        if not object_ids:
+            return
+
+        table = cls._meta.db_table
+        deleted_value = 'EXCLUDED.deleted' if deleted is not None else f'{table}.deleted'
+        values = ', '.join(['(%s, %s, %s, txid_current(), now())'] * len(object_ids))
+        params = [value for object_id in object_ids for value in (catalog, object_id, bool(deleted))]
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO {table} (catalog, object_id, deleted, change_id, changing_date) VALUES {values}
+                ON CONFLICT (catalog, object_id) DO UPDATE SET deleted = {deleted_value},
+                    change_id = EXCLUDED.change_id, changing_date = EXCLUDED.changing_date
+            """, params)
@@ -7,3 +7,5 @@ class ExternalSerializer(serializers.ModelSerializer):
     class Meta:
         fields = ('name', 'external_key', 'number', 'date')
         model = ExternalSource
+        # Повторно присланные документы сопоставляются по ключу, а не отклоняются валидацией уникальности
+        extra_kwargs = {'external_key': {'validators': []}}
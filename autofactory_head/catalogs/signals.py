@@ -0,0 +1,59 @@
+from django.apps import apps
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from .models import CatalogChange
+
+# Справочники, изменения которых получают устройства, и их модели
+CATALOG_MODELS = {
+    'products': 'catalogs.Product',
+    'units': 'catalogs.Unit',
+    'lines': 'catalogs.Line',
+    'regexps': 'catalogs.RegularExpression',
+    'storages': 'catalogs.Storage',
+    'cells': 'warehouse_management.StorageCell',
+    'areas': 'warehouse_management.StorageArea',
+}
+
+# Подчиненные записи, изменение которых меняет представление объекта справочника
+CATALOG_PARENTS = {
+    'catalogs.Unit': ('products', 'product_id'),
+    'catalogs.LineProduct': ('lines', 'line_id'),
+}
+
+
+def save_catalog_object(sender, instance, **kwargs):
+    _register_catalog_change(sender, instance, deleted=False)
+
+
+def delete_catalog_object(sender, instance, **kwargs):
+    _register_catalog_change(sender, instance, deleted=True)
+
+
+def change_line_products(sender, instance, action, reverse, pk_set, **kwargs):
+    """ Состав номенклатуры линии меняется через related manager без сигналов сохранения LineProduct """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        CatalogChange.register('lines', [instance.pk], None)
+    elif pk_set:
+        CatalogChange.register('lines', pk_set, None)
+
+
+def _register_catalog_change(sender, instance, deleted: bool) -> None:
+    for catalog, label in CATALOG_MODELS.items():
+        if sender._meta.label == label:
+            CatalogChange.register(catalog, [instance.pk], deleted)
+
+    parent = CATALOG_PARENTS.get(sender._meta.label)
+    if parent is not None:
+        catalog, field_name = parent
+        CatalogChange.register(catalog, [getattr(instance, field_name)], None)
+
+
+def connect_catalog_signals() -> None:
+    for label in {*CATALOG_MODELS.values(), *CATALOG_PARENTS}:
+        model = apps.get_model(label)
+        post_save.connect(save_catalog_object, sender=model, dispatch_uid=f'catalog_change_save_{label}')
+        post_delete.connect(delete_catalog_object, sender=model, dispatch_uid=f'catalog_change_delete_{label}')
+    m2m_changed.connect(change_line_products, sender=apps.get_model('catalogs.LineProduct'),
+                        dispatch_uid='catalog_change_line_products')
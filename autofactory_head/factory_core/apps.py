@@ -11,3 +11,4 @@ class FactoryCoreConfig(AppConfig):
         from warehouse_management import signals
 
         operation_pre_close.connect(signals.pre_close_movement_shipment)
+
@@ -0,0 +1,30 @@
+# Generated by Django 4.0.4 on 2026-10-18 19:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('factory_core', '0007_shift_organization_shift_product'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='Наименование')),
+                ('series', models.CharField(blank=True, default='', max_length=255, verbose_name='Серия')),
+                ('last_number', models.BigIntegerField(default=0, verbose_name='Последний номер')),
+            ],
+            options={
+                'verbose_name': 'Нумератор документов',
+                'verbose_name_plural': 'Нумераторы документов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='numbersequence',
+            constraint=models.UniqueConstraint(fields=('name', 'series'), name='unique_number_sequence'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.0.4 on 2026-10-18 19:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('factory_core', '0008_numbersequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TableVersion',
+            fields=[
+                ('table', models.CharField(max_length=255, primary_key=True, serialize=False, verbose_name='Таблица')),
+                ('version', models.BigIntegerField(default=0, verbose_name='Версия')),
+            ],
+            options={
+                'verbose_name': 'Версия таблицы',
+                'verbose_name_plural': 'Версии таблиц',
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.0.4 on 2026-10-18 20:45
+
+from django.db import migrations
+
+# Триггеры счетчиков удаляются со всех таблиц, на которых они были созданы
+DROP_TRIGGERS_SQL = """
+DO $$
+DECLARE
+    trigger_table regclass;
+BEGIN
+    FOR trigger_table IN SELECT tgrelid::regclass FROM pg_trigger WHERE tgname = 'factory_core_tableversion_bump' LOOP
+        EXECUTE format('DROP TRIGGER factory_core_tableversion_bump ON %s', trigger_table);
+    END LOOP;
+END
+$$;
+DROP FUNCTION IF EXISTS factory_core_tableversion_bump();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('factory_core', '0009_tableversion'),
+    ]
+
+    operations = [
+        migrations.RunSQL(DROP_TRIGGERS_SQL, migrations.RunSQL.noop),
+        migrations.DeleteModel(
+            name='TableVersion',
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.0.4 on 2026-10-18 20:32
+
+from django.db import migrations
+
+# Последовательность номеров создается при первом обращении. Параллельное создание той же последовательности
+# ждет фиксации первой транзакции и использует созданную ей последовательность
+RESERVE_DOCUMENT_NUMBERS_SQL = """
+CREATE OR REPLACE FUNCTION reserve_document_numbers(sequence_name text, count integer, number_table text)
+RETURNS SETOF bigint AS $$
+DECLARE
+    last_number bigint := 0;
+BEGIN
+    IF to_regclass(quote_ident(sequence_name)) IS NULL THEN
+        IF number_table IS NOT NULL THEN
+            EXECUTE format('SELECT coalesce(max(number), 0) FROM %I', number_table) INTO last_number;
+        END IF;
+        BEGIN
+            EXECUTE format('CREATE SEQUENCE %I START WITH %s', sequence_name, last_number + 1);
+        EXCEPTION WHEN duplicate_table OR unique_violation THEN
+            NULL;
+        END;
+    END IF;
+    RETURN QUERY SELECT nextval(quote_ident(sequence_name)::regclass) FROM generate_series(1, count);
+END
+$$ LANGUAGE plpgsql
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('factory_core', '0010_delete_tableversion'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='NumberSequence',
+        ),
+        migrations.RunSQL(RESERVE_DOCUMENT_NUMBERS_SQL,
+                          'DROP FUNCTION IF EXISTS reserve_document_numbers(text, integer, text)'),
+    ]
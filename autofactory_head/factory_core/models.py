@@ -1,10 +1,11 @@
 import datetime
+import hashlib
 from random import randrange
 import uuid
 
-from django.db import models
+from django.db import connection, models
 from django.contrib.auth import get_user_model
-from django.db.models import Max
+from django.utils import timezone
 
 from catalogs.models import Line, Product, Organization
 
@@ -40,6 +41,38 @@ class ExternalSystemExchangeMixin(models.Model):
         self.save()
 
 
+class NumberSeries(models.TextChoices):
+    ALL = 'ALL', 'Сквозная'
+    DAY = 'DAY', 'В пределах дня'
+    YEAR = 'YEAR', 'В пределах года'
+
+
+def get_number_series(number_series: str) -> str:
+    """ Серия номеров на текущую дату: для сквозной нумерации - пустая строка """
+    today = timezone.localdate()
+    if number_series == NumberSeries.DAY:
+        return today.strftime('%Y%m%d')
+    if number_series == NumberSeries.YEAR:
+        return today.strftime('%Y')
+    return ''
+
+
+def reserve_numbers(name: str, count: int = 1, series: str = '', table: str | None = None) -> list[int]:
+    """ Выделяет count номеров документов из последовательности базы данных (nextval) для имени и серии.
+    Последовательность не блокируется до конца транзакции, поэтому параллельное создание документов не ждет
+    друг друга, номера уникальны, а откаченная транзакция оставляет пропуск в номерах.
+    Последовательность создается при первом обращении функцией reserve_document_numbers (миграция factory_core
+    0011), для сквозной серии нумерация продолжается с максимального номера в таблице table """
+    if count <= 0:
+        return []
+
+    digest = hashlib.md5(f'{name}:{series}'.encode()).hexdigest()[:8]
+    sequence = f'number_{name.rsplit(".", 1)[-1][:40]}_{digest}'
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reserve_document_numbers(%s, %s, %s)', [sequence, count, table if not series else None])
+        return [row[0] for row in cursor.fetchall()]
+
+
 class OperationBaseModel(models.Model):
     """ Базовая модель для операций """
 
@@ -49,6 +82,8 @@ class OperationBaseModel(models.Model):
                             editable=False)
     modified = models.DateTimeField('Принято в работу', null=True, blank=True)
 
+    number_series = NumberSeries.ALL
+
     class Meta:
         abstract = True
 
@@ -58,12 +93,16 @@ class OperationBaseModel(models.Model):
     def save(self, force_insert=False, force_update=False, using=None,
              update_fields=None):
         if self.date is None:
-            qs = type(self).objects.all()
-            number = qs.aggregate(Max('number')).get('number__max') or 0
-            self.number = number + 1
+            self.number = type(self).reserve_numbers(1)[0]
 
         super().save(force_insert, force_update, using, update_fields)
 
+    @classmethod
+    def reserve_numbers(cls, count: int) -> list[int]:
+        """ Возвращает номера для создаваемых операций. Используется при пакетном создании (bulk_create).
+        Каждая модель операции нумеруется своей последовательностью, серия задается атрибутом number_series """
+        return reserve_numbers(cls._meta.label_lower, count, get_number_series(cls.number_series), cls._meta.db_table)
+
 
 class Shift(models.Model):
     """ Смена """
@@ -91,8 +130,7 @@ class Shift(models.Model):
 
     def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
         if self.creating_date is None:
-            number = Shift.objects.aggregate(Max('number')).get('number__max') or 0
-            self.number = number + 1
+            self.number = reserve_numbers(Shift._meta.label_lower, table=Shift._meta.db_table)[0]
 
         if self.code_offline is None:
             self.code_offline = str(randrange(100, 900, 1))
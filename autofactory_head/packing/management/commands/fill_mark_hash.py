@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Max, Min
+
+from packing.models import MarkingOperationMark, MARK_HASH_SQL
+
+
+class Command(BaseCommand):
+    help = ('Заполняет хеш марок без хеша. Марки, записанные до появления поля, заполняет миграция packing 0049, '
+            'команда нужна для марок, записанных прежней версией во время обновления')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50000, help='Количество строк в одном запросе')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        bounds = MarkingOperationMark.objects.filter(mark_hash__isnull=True).aggregate(Min('id'), Max('id'))
+        if bounds['id__min'] is None:
+            self.stdout.write(self.style.SUCCESS('Хеш всех марок заполнен'))
+            return
+
+        table = MarkingOperationMark._meta.db_table
+        count = 0
+        for start in range(bounds['id__min'], bounds['id__max'] + 1, batch_size):
+            # Каждая пачка фиксируется отдельно, чтобы не держать блокировки всей таблицы
+            with connection.cursor() as cursor:
+                cursor.execute(f"""
+                    UPDATE {table} SET mark_hash = {MARK_HASH_SQL}
+                    WHERE id >= %s AND id < %s AND mark_hash IS NULL
+                """, [start, start + batch_size])
+                count += cursor.rowcount
+
+        self.stdout.write(self.style.SUCCESS(f'Заполнен хеш марок: {count}'))
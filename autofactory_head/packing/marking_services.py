@@ -1,34 +1,54 @@
 import base64
 import datetime
+import json
+import logging
+import time
 import uuid
-from collections.abc import Iterable
+from collections import Counter, defaultdict
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
 from datetime import datetime as dt, timedelta
 from typing import Optional, Dict, List, Union
 
 import pytz
 from django.contrib.auth import get_user_model
-from django.db import transaction
-from django.db.models import Count
+from django.db import connection, transaction
+from django.db.models import Count, Q
 from django.http import HttpResponsePermanentRedirect, HttpResponseRedirect
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse_lazy
+from django_redis import get_redis_connection
 from rest_framework.exceptions import APIException
 
+from api.exceptions import Overloaded, BadRequest
 from catalogs.models import (
     Product
 )
 from factory_core.models import Shift
-from tasks.models import TaskStatus
+from tasks.models import TaskStatus, current_change_id
+from tasks.task_services import get_task_event, publish_task_events
 from warehouse_management.models import Pallet, OperationPallet, PalletCollectOperation
 
 from packing.models import (
     RawMark,
     MarkingOperation,
-    MarkingOperationMark
+    MarkingOperationMark,
+    ShiftMark,
+    get_mark_hash
 )
 
 User = get_user_model()
 
+logger = logging.getLogger(__name__)
+
+MARKS_BATCH_SIZE = 5000
+
+RAW_MARKS_SLOTS_KEY = 'raw_marks_slots'
+RAW_MARKS_SLOT_TTL = 60
+RAW_MARKS_MAX_IN_FLIGHT = 16
+RAW_MARKS_RETRY_AFTER = 1
+RAW_MARKS_MAX_BATCH = 10000
+
 
 def get_dashboard_data() -> Dict:
     result = {}
@@ -97,19 +117,25 @@ def _get_data_report_marking_dynamics(start: datetime, end: datetime, lines: Lis
     return result
 
 
-def remove_marks(marks: list) -> None:
-    """Ищет марки за последние три дня для невыгруженных операций маркировки
-    если такие марки найдены она их удаляет"""
-    for mark in marks:
-        indexes_to_remove = []
-        date_filter = datetime.datetime.now() - datetime.timedelta(7)
-        for element in MarkingOperationMark.objects.filter(
-                operation__date__gte=date_filter, operation__unloaded=False,
-                mark=mark):
-            indexes_to_remove.append(element.id)
+def remove_marks(marks: list) -> dict[str, int]:
+    """Удаляет одним запросом марки за последние семь дней невыгруженных операций маркировки.
+    Возвращает количество удаленных записей по каждой переданной марке"""
+    marks = list(dict.fromkeys(str(mark) for mark in marks))
+    if not marks:
+        return {}
 
-        for index in indexes_to_remove:
-            MarkingOperationMark.objects.get(pk=index).delete()
+    date_filter = datetime.datetime.now() - datetime.timedelta(7)
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            DELETE FROM {MarkingOperationMark._meta.db_table} AS marks
+            USING {MarkingOperation._meta.db_table} AS operations
+            WHERE marks.operation_id = operations.guid AND marks.mark_hash = ANY(%s) AND marks.mark = ANY(%s)
+                AND operations.date >= %s AND NOT operations.unloaded
+            RETURNING marks.mark
+        """, [[get_mark_hash(mark) for mark in marks], marks, date_filter])
+        removed = Counter(row[0] for row in cursor.fetchall())
+
+    return {mark: removed[mark] for mark in marks}
 
 
 @transaction.atomic
@@ -136,46 +162,111 @@ def register_to_exchange(operation: MarkingOperation) -> bool:
     need_exchange = not bool(markings.exclude(guid=operation.guid).filter(closed=False).exists())
 
     if need_exchange:
-        offline_marking_guids = dict()
-        marking_groups = [str(group) for group in markings.filter(group__isnull=False).values_list('group', flat=True)]
-        pallets_ids = list(Pallet.objects.filter(marking_group__in=marking_groups).values_list('guid', flat=True))
-        markings_full_group = {value['group_offline']: value['group'] for value in
-                               markings.filter(group__isnull=False).values('group', 'group_offline')}
-        for marking in markings:
-            if marking.guid == operation.guid:
-                marking.closed = True
-            marking.ready_to_unload = True
-            marking.save()
-
-            if marking.group is not None:
-                continue
-
-            group = offline_marking_guids.get(marking.group_offline) or markings_full_group.get(marking.group_offline)
-            if group is None:
-                group = uuid.uuid4()
-                offline_marking_guids[marking.group_offline] = group
-
-            marking.group = group
-            marking.save()
-
-            filter_kwargs = {'batch_number': marking.batch_number,
-                             'production_date': marking.production_date,
-                             'marking_group': marking.group_offline}
-            pallets = Pallet.objects.filter(**filter_kwargs)
-            for pallet in pallets:
-                pallet.marking_group = str(group)
-                pallets_ids.append(pallet.guid)
-                pallet.save()
-
-        tasks_ids = OperationPallet.objects.filter(pallet__guid__in=pallets_ids).values_list('operation', flat=True)
-        tasks = PalletCollectOperation.objects.filter(guid__in=tasks_ids)
-        for task in tasks:
-            task.ready_to_unload = True
-            task.save()
+        rows = list(markings.values('guid', 'group', 'group_offline', 'batch_number', 'production_date'))
+        marking_groups = {str(row['group']) for row in rows if row['group'] is not None}
+        # по оффлайн ключу может найтись несколько групп, маркировкам без группы достается одна из них
+        markings_full_group = {row['group_offline']: row['group'] for row in rows if row['group'] is not None}
+
+        # Маркировки без группы получают группу маркировки с тем же оффлайн ключом либо новую группу
+        offline_groups = defaultdict(list)
+        for row in rows:
+            if row['group'] is None:
+                offline_groups[row['group_offline']].append(row)
+
+        counts = Counter(closed=markings.filter(guid=operation.guid).update(closed=True))
+        counts['markings'] = markings.update(ready_to_unload=True)
+        for group_offline, group_rows in offline_groups.items():
+            group = markings_full_group.get(group_offline) or uuid.uuid4()
+            marking_groups.add(str(group))
+            counts['grouped'] += MarkingOperation.objects.filter(
+                guid__in=[row['guid'] for row in group_rows]).update(group=group)
+
+            pallets_filter = Q()
+            for batch_number, production_date in {(row['batch_number'], row['production_date']) for row in group_rows}:
+                pallets_filter |= Q(batch_number=batch_number, production_date=production_date)
+            counts['pallets'] += Pallet.objects.filter(pallets_filter, marking_group=group_offline).update(
+                marking_group=str(group))
+
+        tasks_ids = OperationPallet.objects.filter(pallet__marking_group__in=marking_groups).values('operation')
+        tasks = list(PalletCollectOperation.objects.filter(guid__in=tasks_ids).only('guid', 'status', 'user'))
+        counts['tasks'] = PalletCollectOperation.objects.filter(guid__in=[task.guid for task in tasks]).update(
+            ready_to_unload=True, change_id=current_change_id())
+        publish_task_events(PalletCollectOperation, [get_task_event(task, 'changed') for task in tasks])
+
+        logger.info('Маркировка %s зарегистрирована к обмену: маркировок %s, закрыто %s, сгруппировано %s, '
+                    'паллет %s, сборов паллет %s', operation.guid, counts['markings'], counts['closed'],
+                    counts['grouped'], counts['pallets'], counts['tasks'])
 
     return need_exchange
 
 
+def parse_raw_marks(body: bytes, content_type: str) -> list[str]:
+    """Разбирает пакет сырых марок: массив JSON либо марки построчно (text/plain, application/x-ndjson).
+    Элемент - строка марки либо объект с ключом mark. Повторы внутри пакета отбрасываются"""
+    try:
+        text = body.decode('utf-8')
+        if content_type.split(';')[0].strip().lower() == 'application/json':
+            values = json.loads(text)
+            if not isinstance(values, list):
+                raise ValueError
+        else:
+            values = [json.loads(line) if line[:1] in ('"', '{') else line
+                      for line in (line.rstrip('\r') for line in text.split('\n')) if line]
+        marks = [value['mark'] if isinstance(value, dict) else value for value in values]
+    except (ValueError, KeyError, TypeError):
+        raise BadRequest('Переданы некорректные данные марок')
+
+    if not all(isinstance(mark, str) and mark for mark in marks):
+        raise BadRequest('Переданы некорректные данные марок')
+    if len(marks) > RAW_MARKS_MAX_BATCH:
+        raise BadRequest(f'В пакете больше {RAW_MARKS_MAX_BATCH} марок')
+    return list(dict.fromkeys(marks))
+
+
+def add_raw_marks(operation: MarkingOperation, marks: list[str]) -> int:
+    """Записывает сырые марки автоматического сканера одним запросом INSERT.
+    Повторы марок между пакетами отбрасываются при закрытии маркировки"""
+    if operation.closed:
+        raise BadRequest('Маркировка уже закрыта')
+
+    RawMark.objects.bulk_create([RawMark(operation=operation, mark=mark) for mark in marks])
+    return len(marks)
+
+
+@contextmanager
+def raw_marks_ingestion_slot() -> Iterator[None]:
+    """Ограничивает число одновременно записываемых пакетов сырых марок по всем процессам.
+    Когда база не успевает записывать пакеты, они копятся в работе и новые пакеты получают отказ
+    с предложением повторить позже. Каждый пакет занимает место в ZSET со своим сроком, поэтому место
+    процесса, остановленного во время записи, освобождается через RAW_MARKS_SLOT_TTL секунд.
+    Без Redis ограничение не действует"""
+    redis = None
+    slot = uuid.uuid4().hex
+    try:
+        redis = get_redis_connection()
+        now = time.time()
+        pipeline = redis.pipeline()
+        pipeline.zremrangebyscore(RAW_MARKS_SLOTS_KEY, '-inf', now)
+        pipeline.zadd(RAW_MARKS_SLOTS_KEY, {slot: now + RAW_MARKS_SLOT_TTL})
+        pipeline.zcard(RAW_MARKS_SLOTS_KEY)
+        pipeline.expire(RAW_MARKS_SLOTS_KEY, RAW_MARKS_SLOT_TTL)
+        in_flight = pipeline.execute()[2]
+    except Exception as e:
+        logger.warning('Не удалось учесть пакет сырых марок: %s', e)
+        redis, in_flight = None, 0
+
+    try:
+        if in_flight > RAW_MARKS_MAX_IN_FLIGHT:
+            raise Overloaded(RAW_MARKS_RETRY_AFTER)
+        yield
+    finally:
+        if redis is not None:
+            try:
+                redis.zrem(RAW_MARKS_SLOTS_KEY, slot)
+            except Exception as e:
+                logger.warning('Не удалось учесть пакет сырых марок: %s', e)
+
+
 def clear_raw_marks(operation: MarkingOperation) -> None:
     """Очищает данные сырых марок
     после создание экземпляров MarkingOperationMark"""
@@ -202,10 +293,12 @@ def marking_close(operation: MarkingOperation, data: Iterable) -> None:
 
 
 def create_marking_marks(operation: MarkingOperation, data: Iterable) -> None:
-    """Создает и записывает в базу экземпляры MarkingOperationMark"""
+    """Создает и записывает в базу экземпляры MarkingOperationMark
+    Повторные марки пропускаются, запись идет пачками по MARKS_BATCH_SIZE,
+    поэтому data может быть итератором по сырым маркам любого размера"""
     products = {}
     marking_marks_instances = []
-    marks = []
+    marks = set()
 
     for value in data:
         if not isinstance(value, dict):
@@ -224,10 +317,10 @@ def create_marking_marks(operation: MarkingOperation, data: Iterable) -> None:
                 marking_marks_instances=marking_marks_instances,
                 operation=operation, **value)
         else:
-            if marks.count(mark):
+            if mark in marks:
                 continue
 
-            marks.append(mark)
+            marks.add(mark)
             product = operation.product
 
             _create_instance_marking_marks(
@@ -236,7 +329,18 @@ def create_marking_marks(operation: MarkingOperation, data: Iterable) -> None:
                 product,
                 marks=(mark,))
 
+        if len(marking_marks_instances) >= MARKS_BATCH_SIZE:
+            _write_marking_marks(operation, marking_marks_instances)
+            marking_marks_instances.clear()
+
+    _write_marking_marks(operation, marking_marks_instances)
+
+
+def _write_marking_marks(operation: MarkingOperation, marking_marks_instances: list) -> None:
+    """Записывает пачку марок и пополняет ключ марок смены операции"""
     MarkingOperationMark.objects.bulk_create(marking_marks_instances)
+    if operation.shift_id is not None:
+        add_shift_marks(operation.shift, (instance.mark for instance in marking_marks_instances))
 
 
 def get_base64_string(source: str) -> str:
@@ -276,6 +380,7 @@ def _create_instance_marking_marks(marking_marks_instances: Iterable,
         marking_marks_instances.append(
             MarkingOperationMark(operation=operation,
                                  mark=mark,
+                                 mark_hash=get_mark_hash(mark),
                                  encoded_mark=get_base64_string(mark),
                                  product=product,
                                  aggregation_code=aggregation_code))
@@ -343,11 +448,43 @@ def register_to_exchange_marking_data(shift: Shift) -> None:
         task.close()
 
 
-def get_marks_in_shifts(shift: Shift) -> set:
-    """ Возвращает все марки которые отсканированы в пределах смены """
-    operations = list(MarkingOperation.objects.filter(shift=shift).values_list('guid', flat=True))
-    marks = MarkingOperationMark.objects.filter(operation__in=operations).values_list('mark', flat=True)
-    return set(marks)
+def add_shift_marks(shift: Shift, marks: Iterable[str]) -> set:
+    """ Записывает хеши марок в уникальный ключ смены (INSERT ... ON CONFLICT DO NOTHING).
+    Возвращает марки, хеш которых в смене уже был. Параллельная запись той же марки ждет фиксации
+    первой транзакции и получает конфликт, поэтому марка не проходит проверку повторов дважды """
+    marks = list(dict.fromkeys(marks))
+    known = set()
+    with connection.cursor() as cursor:
+        for index in range(0, len(marks), MARKS_BATCH_SIZE):
+            chunk = marks[index:index + MARKS_BATCH_SIZE]
+            hashes = [get_mark_hash(mark) for mark in chunk]
+            cursor.execute(f"""
+                INSERT INTO {ShiftMark._meta.db_table} (shift_id, mark_hash) SELECT %s, unnest(%s::bigint[])
+                ON CONFLICT (shift_id, mark_hash) DO NOTHING
+                RETURNING mark_hash
+            """, [shift.pk, hashes])
+            added = {row[0] for row in cursor.fetchall()}
+            known.update(mark for mark, mark_hash in zip(chunk, hashes) if mark_hash not in added)
+    return known
+
+
+def get_marks_in_shifts(shift: Shift | None, marks: Iterable[str]) -> set:
+    """ Возвращает марки из переданных, которые уже отсканированы в пределах смены,
+    остальные марки записывает в ключ марок смены. Совпавшие по ключу марки сверяются с марками смены:
+    ключ мог остаться от удаленной марки, а разные марки могут совпасть по хешу.
+    Запросы зависят только от количества переданных марок и повторов среди них """
+    marks = list(dict.fromkeys(marks))
+    operations = MarkingOperation.objects.filter(shift=shift).values('guid')
+    if shift is not None:
+        marks = list(add_shift_marks(shift, marks))
+
+    marks_in_shift = set()
+    for index in range(0, len(marks), MARKS_BATCH_SIZE):
+        chunk = marks[index:index + MARKS_BATCH_SIZE]
+        marks_in_shift.update(MarkingOperationMark.objects.filter(
+            operation__in=operations, mark_hash__in=[get_mark_hash(mark) for mark in chunk], mark__in=chunk)
+            .values_list('mark', flat=True))
+    return marks_in_shift
 
 
 def shift_close(shift_guid: uuid.UUID) -> Union[HttpResponsePermanentRedirect, HttpResponseRedirect]:
@@ -0,0 +1,22 @@
+# Generated by Django 4.0.4 on 2026-10-18 19:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('packing', '0045_markingoperation_modified'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='markingoperationmark',
+            name='mark_hash',
+            field=models.BigIntegerField(editable=False, null=True, verbose_name='Хеш марки'),
+        ),
+        migrations.AddIndex(
+            model_name='markingoperationmark',
+            index=models.Index(fields=['mark_hash'], name='marking_mark_hash_index'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.4 on 2026-10-18 19:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('packing', '0046_mark_hash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='markingoperationmark',
+            index=models.Index(fields=['operation', 'id'], name='marking_mark_unload_index'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.0.4 on 2026-10-18 20:40
+
+from django.db import migrations
+from django.db.models import Max, Min
+
+BATCH_SIZE = 50000
+
+
+def fill_mark_hash(apps, schema_editor):
+    """ Заполняет хеш марок, записанных до появления поля. Выражение совпадает с packing.models.MARK_HASH_SQL.
+    Миграция не атомарная: каждая пачка фиксируется отдельно и не держит блокировку всей таблицы """
+    MarkingOperationMark = apps.get_model('packing', 'MarkingOperationMark')
+    bounds = MarkingOperationMark.objects.filter(mark_hash__isnull=True).aggregate(Min('id'), Max('id'))
+    if bounds['id__min'] is None:
+        return
+
+    table = MarkingOperationMark._meta.db_table
+    with schema_editor.connection.cursor() as cursor:
+        for start in range(bounds['id__min'], bounds['id__max'] + 1, BATCH_SIZE):
+            cursor.execute(f"""
+                UPDATE {table} SET mark_hash = ('x' || substr(md5(mark), 1, 16))::bit(64)::bigint
+                WHERE id >= %s AND id < %s AND mark_hash IS NULL
+            """, [start, start + BATCH_SIZE])
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('packing', '0047_marking_mark_unload_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_mark_hash, migrations.RunPython.noop),
+    ]
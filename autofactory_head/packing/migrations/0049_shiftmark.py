@@ -0,0 +1,31 @@
+# Generated by Django 4.0.4 on 2026-10-18 20:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('factory_core', '0009_tableversion'),
+        ('packing', '0048_fill_mark_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShiftMark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mark_hash', models.BigIntegerField(verbose_name='Хеш марки')),
+                ('shift', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mark_hashes', to='factory_core.shift', verbose_name='Смена')),
+            ],
+            options={
+                'verbose_name': 'Марка смены',
+                'verbose_name_plural': 'Марки смены',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shiftmark',
+            constraint=models.UniqueConstraint(fields=('shift', 'mark_hash'), name='shift_mark_hash_unique'),
+        ),
+    ]
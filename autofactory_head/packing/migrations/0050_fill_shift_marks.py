@@ -0,0 +1,41 @@
+# Generated by Django 4.0.4 on 2026-10-18 20:27
+
+from django.db import migrations
+from django.db.models import Max, Min
+
+BATCH_SIZE = 50000
+
+
+def fill_shift_marks(apps, schema_editor):
+    """ Заполняет ключ марок смен по уже записанным маркам. Миграция не атомарная:
+    каждая пачка фиксируется отдельно и не держит блокировку всей таблицы марок """
+    MarkingOperationMark = apps.get_model('packing', 'MarkingOperationMark')
+    MarkingOperation = apps.get_model('packing', 'MarkingOperation')
+    ShiftMark = apps.get_model('packing', 'ShiftMark')
+    bounds = MarkingOperationMark.objects.aggregate(Min('id'), Max('id'))
+    if bounds['id__min'] is None:
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        for start in range(bounds['id__min'], bounds['id__max'] + 1, BATCH_SIZE):
+            cursor.execute(f"""
+                INSERT INTO {ShiftMark._meta.db_table} (shift_id, mark_hash)
+                SELECT DISTINCT operations.shift_id, marks.mark_hash
+                FROM {MarkingOperationMark._meta.db_table} AS marks
+                JOIN {MarkingOperation._meta.db_table} AS operations ON operations.guid = marks.operation_id
+                WHERE marks.id >= %s AND marks.id < %s
+                    AND operations.shift_id IS NOT NULL AND marks.mark_hash IS NOT NULL
+                ON CONFLICT (shift_id, mark_hash) DO NOTHING
+            """, [start, start + BATCH_SIZE])
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('packing', '0049_shiftmark'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_shift_marks, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,5 @@
+import hashlib
+
 from django.contrib.auth import get_user_model
 from django.db import models
 from catalogs.models import Device, Line, ExternalSource
@@ -34,9 +36,19 @@ class MarkingOperation(OperationBaseModel, ExternalSystemExchangeMixin):
         verbose_name_plural = 'Операции маркировки'
 
 
+def get_mark_hash(mark: str) -> int:
+    """ 64-битный хеш марки для поиска по индексу. Совпадает с выражением MARK_HASH_SQL,
+    поэтому хеш существующих марок заполняется одним запросом на стороне базы """
+    return int.from_bytes(hashlib.md5(mark.encode()).digest()[:8], 'big', signed=True)
+
+
+MARK_HASH_SQL = "('x' || substr(md5(mark), 1, 16))::bit(64)::bigint"
+
+
 class MarkingOperationMark(models.Model):
     operation = models.ForeignKey(MarkingOperation, on_delete=models.CASCADE, related_name='marks')
     mark = models.CharField('Марка', max_length=500)
+    mark_hash = models.BigIntegerField('Хеш марки', null=True, editable=False)
     encoded_mark = models.CharField('Зашифрованная марка', max_length=500, null=True)
     aggregation_code = models.CharField('Код агрегации', max_length=500, null=True)
     product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name='Номенклатура', blank=True, null=True)
@@ -45,6 +57,28 @@ class MarkingOperationMark(models.Model):
     class Meta:
         verbose_name = 'Марка'
         verbose_name_plural = 'Марки'
+        indexes = [
+            models.Index(fields=['mark_hash'], name='marking_mark_hash_index'),
+            models.Index(fields=['operation', 'id'], name='marking_mark_unload_index'),
+        ]
+
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        self.mark_hash = get_mark_hash(self.mark)
+        if update_fields is not None:
+            update_fields = {*update_fields, 'mark_hash'}
+        super().save(force_insert, force_update, using, update_fields)
+
+
+class ShiftMark(models.Model):
+    """ Хеши марок, записанных в пределах смены. Уникальный ключ (смена, хеш) пополняется при записи марок,
+    поэтому повторы загружаемых марок проверяются без чтения марок смены """
+    shift = models.ForeignKey(Shift, on_delete=models.CASCADE, verbose_name='Смена', related_name='mark_hashes')
+    mark_hash = models.BigIntegerField('Хеш марки')
+
+    class Meta:
+        verbose_name = 'Марка смены'
+        verbose_name_plural = 'Марки смены'
+        constraints = [models.UniqueConstraint(fields=['shift', 'mark_hash'], name='shift_mark_hash_unique')]
 
 
 class RawMark(models.Model):
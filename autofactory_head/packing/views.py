@@ -12,6 +12,7 @@ from packing.marking_services import get_marking_filters, shift_close
 from packing.models import (
     MarkingOperation,
     MarkingOperationMark,
+    get_mark_hash,
 )
 from users.models import User
 
@@ -112,7 +113,10 @@ def marking_detail(request, pk):
     marks = MarkingOperationMark.objects.all().filter(operation=operation).order_by('product')
 
     if len(request.GET) and request.GET.get('mark') is not None:
-        marks = marks.filter(mark__startswith=request.GET.get('mark'))
+        mark = request.GET.get('mark')
+        # Полная марка ищется по индексу хеша, иначе поиск по началу марки в пределах операции
+        exact_marks = marks.filter(mark_hash=get_mark_hash(mark), mark=mark)
+        marks = exact_marks if exact_marks.exists() else marks.filter(mark__startswith=mark)
 
     marks = marks[:100]
     paginator = Paginator(marks, 30)
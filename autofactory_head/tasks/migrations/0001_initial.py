@@ -0,0 +1,43 @@
+# Generated by Django 4.0.4 on 2026-10-18 19:06
+
+from django.conf import settings
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskJob',
+            fields=[
+                ('guid', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, verbose_name='ГУИД')),
+                ('type_task', models.CharField(max_length=255, verbose_name='Тип задания')),
+                ('api_version', models.CharField(max_length=10, verbose_name='Версия API')),
+                ('payload', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='Данные запроса')),
+                ('status', models.CharField(choices=[('NEW', 'New'), ('WORK', 'Work'), ('DONE', 'Done'), ('ERROR', 'Error')], default='NEW', max_length=10, verbose_name='Статус')),
+                ('result', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True, verbose_name='Результат')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('creating_date', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('start_date', models.DateTimeField(blank=True, null=True, verbose_name='Дата начала обработки')),
+                ('finish_date', models.DateTimeField(blank=True, null=True, verbose_name='Дата окончания обработки')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Задание на создание',
+                'verbose_name_plural': 'Задания на создание',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='taskjob',
+            index=models.Index(fields=['status', 'creating_date'], name='task_job_queue_index'),
+        ),
+    ]
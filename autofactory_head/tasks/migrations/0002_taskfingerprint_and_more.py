@@ -0,0 +1,33 @@
+# Generated by Django 4.0.4 on 2026-10-18 19:09
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskFingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type_task', models.CharField(max_length=255, verbose_name='Тип задания')),
+                ('external_key', models.CharField(max_length=255, verbose_name='Внешний ключ')),
+                ('content_hash', models.CharField(max_length=64, verbose_name='Хеш содержимого')),
+                ('result', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='Результат')),
+                ('creating_date', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+            ],
+            options={
+                'verbose_name': 'Отпечаток документа',
+                'verbose_name_plural': 'Отпечатки документов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='taskfingerprint',
+            constraint=models.UniqueConstraint(fields=('type_task', 'external_key'), name='unique_task_fingerprint'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.0.4 on 2026-10-18 19:18
+
+from django.db import migrations, models
+import tasks.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0002_taskfingerprint_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_model', models.CharField(max_length=255, verbose_name='Модель задания')),
+                ('guid', models.UUIDField(verbose_name='ГУИД задания')),
+                ('change_id', models.BigIntegerField(default=tasks.models.current_change_id, verbose_name='Идентификатор изменения')),
+                ('deleting_date', models.DateTimeField(auto_now_add=True, verbose_name='Дата удаления')),
+            ],
+            options={
+                'verbose_name': 'Удаленное задание',
+                'verbose_name_plural': 'Удаленные задания',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='tasktombstone',
+            index=models.Index(fields=['task_model', 'change_id'], name='task_tombstone_change_index'),
+        ),
+    ]
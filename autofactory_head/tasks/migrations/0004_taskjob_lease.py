@@ -0,0 +1,28 @@
+# Generated by Django 4.0.4 on 2026-10-18 20:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0003_tasktombstone_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskjob',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Попыток обработки'),
+        ),
+        migrations.AddField(
+            model_name='taskjob',
+            name='lease_date',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Обработка занята до'),
+        ),
+        migrations.RunSQL(
+            "UPDATE tasks_taskjob SET lease_date = COALESCE(start_date, creating_date) + interval '10 minutes' "
+            "WHERE status = 'WORK'",
+            migrations.RunSQL.noop,
+        ),
+    ]
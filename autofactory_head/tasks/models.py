@@ -1,5 +1,9 @@
+import uuid
+
 from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models.expressions import RawSQL
 from pydantic.main import BaseModel
 
 from catalogs.models import ExternalSource
@@ -15,6 +19,12 @@ class TaskStatus(models.TextChoices):
     CLOSE = 'CLOSE'
 
 
+def current_change_id() -> RawSQL:
+    """ Идентификатор изменения - номер транзакции, записывающей задание. Вычисляется базой данных при записи,
+    поэтому изменения, не зафиксированные к моменту чтения, не теряются при синхронизации по курсору """
+    return RawSQL('txid_current()', [])
+
+
 class Task(ExternalSystemExchangeMixin):
     type_task = models.CharField(max_length=255, verbose_name='Тип задания')
 
@@ -31,9 +41,89 @@ class Task(ExternalSystemExchangeMixin):
                                         null=True,
                                         blank=True)
 
+    change_id = models.BigIntegerField('Идентификатор изменения', default=current_change_id, db_index=True,
+                                       editable=False)
+
     class Meta:
         abstract = True
 
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        self.change_id = current_change_id()
+        if update_fields is not None:
+            update_fields = {*update_fields, 'change_id'}
+        super().save(force_insert, force_update, using, update_fields)
+        # Значение вычислено базой при записи, на экземпляре вместо выражения остается число
+        self.refresh_from_db(using=using, fields=['change_id'])
+
+
+class TaskJobStatus(models.TextChoices):
+    NEW = 'NEW'
+    WORK = 'WORK'
+    DONE = 'DONE'
+    ERROR = 'ERROR'
+
+
+class TaskJob(models.Model):
+    """ Отложенное создание заданий: данные запроса сохраняются и обрабатываются фоновым обработчиком """
+
+    guid = models.UUIDField('ГУИД', primary_key=True, default=uuid.uuid4, editable=False)
+    type_task = models.CharField('Тип задания', max_length=255)
+    api_version = models.CharField('Версия API', max_length=10)
+    payload = models.JSONField('Данные запроса', encoder=DjangoJSONEncoder)
+    status = models.CharField('Статус', max_length=10, choices=TaskJobStatus.choices, default=TaskJobStatus.NEW)
+    result = models.JSONField('Результат', encoder=DjangoJSONEncoder, null=True, blank=True)
+    error = models.TextField('Ошибка', blank=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Пользователь', null=True, blank=True)
+    creating_date = models.DateTimeField('Дата создания', auto_now_add=True)
+    start_date = models.DateTimeField('Дата начала обработки', null=True, blank=True)
+    finish_date = models.DateTimeField('Дата окончания обработки', null=True, blank=True)
+    lease_date = models.DateTimeField('Обработка занята до', null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField('Попыток обработки', default=0)
+
+    class Meta:
+        verbose_name = 'Задание на создание'
+        verbose_name_plural = 'Задания на создание'
+        indexes = [models.Index(fields=['status', 'creating_date'], name='task_job_queue_index')]
+
+    def __str__(self):
+        return f'{self.type_task} {self.guid}'
+
+
+class TaskFingerprint(models.Model):
+    """ Отпечаток содержимого документа внешней системы, по которому было создано задание.
+    Повторно присланный без изменений документ получает сохраненный результат без создания задания """
+
+    type_task = models.CharField('Тип задания', max_length=255)
+    external_key = models.CharField('Внешний ключ', max_length=255)
+    content_hash = models.CharField('Хеш содержимого', max_length=64)
+    result = models.JSONField('Результат', encoder=DjangoJSONEncoder)
+    creating_date = models.DateTimeField('Дата создания', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Отпечаток документа'
+        verbose_name_plural = 'Отпечатки документов'
+        constraints = [models.UniqueConstraint(fields=['type_task', 'external_key'], name='unique_task_fingerprint')]
+
+    def __str__(self):
+        return f'{self.type_task} {self.external_key}'
+
+
+class TaskTombstone(models.Model):
+    """ Запись об удаленном задании для синхронизации списков заданий на устройствах """
+
+    task_model = models.CharField('Модель задания', max_length=255)
+    guid = models.UUIDField('ГУИД задания')
+    change_id = models.BigIntegerField('Идентификатор изменения', default=current_change_id)
+    deleting_date = models.DateTimeField('Дата удаления', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Удаленное задание'
+        verbose_name_plural = 'Удаленные задания'
+        indexes = [models.Index(fields=['task_model', 'change_id'], name='task_tombstone_change_index')]
+
+    def __str__(self):
+        return f'{self.task_model} {self.guid}'
+
 
 class TaskProperties(BaseModel):
     status: TaskStatus | None
@@ -0,0 +1,23 @@
+from django.apps import apps
+from django.db.models.signals import post_delete, post_save
+
+from .models import Task, TaskTombstone
+from .task_services import get_task_event, publish_task_events
+
+
+def post_save_task(sender, instance, created, **kwargs):
+    publish_task_events(sender, [get_task_event(instance, 'created' if created else 'changed')])
+
+
+def post_delete_task(sender, instance, **kwargs):
+    TaskTombstone.objects.create(task_model=sender._meta.label_lower, guid=instance.pk)
+    publish_task_events(sender, [get_task_event(instance, 'deleted')])
+
+
+def connect_task_signals() -> None:
+    """ Обработчики подключаются к моделям заданий, а не ко всем моделям: обработчик удаления без отправителя
+    отключает быстрое удаление queryset.delete() у всех моделей проекта """
+    for model in apps.get_models():
+        if issubclass(model, Task):
+            post_save.connect(post_save_task, sender=model, dispatch_uid=f'task_save_{model._meta.label}')
+            post_delete.connect(post_delete_task, sender=model, dispatch_uid=f'task_delete_{model._meta.label}')
@@ -1,15 +1,41 @@
+import asyncio
+import datetime
+import hashlib
+import json
+import logging
+import time
 from collections.abc import Callable
+from functools import cache
+from types import MappingProxyType
 from typing import NamedTuple, Iterable
 
+import redis.asyncio
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, models, transaction
 from django.db.models import QuerySet, Q
+from django.utils import timezone
+from django_redis import get_redis_connection
 from rest_framework import serializers
+from rest_framework.exceptions import APIException, ValidationError
 
-from tasks.models import Task, TaskStatus, TaskProperties, TaskBaseModel
+from tasks.models import (Task, TaskStatus, TaskProperties, TaskBaseModel, TaskJob, TaskJobStatus,
+                          TaskFingerprint, TaskTombstone, current_change_id)
 
 User = get_user_model()
 
+TASK_JOBS_QUEUE_KEY = 'task_jobs'
+TASK_JOB_LEASE = datetime.timedelta(minutes=10)
+TASK_JOB_MAX_ATTEMPTS = 3
+
+TASK_FILTER_FLAGS = frozenset({'not_closed', 'only_close', 'all_users'})
+
+BOOLEAN_VALUES = MappingProxyType({'true': 'True', 'false': 'False'})
+
+logger = logging.getLogger(__name__)
+
 
 class RouterTask(NamedTuple):
     task: type(Task)
@@ -21,6 +47,8 @@ class RouterTask(NamedTuple):
     answer_serializer: type(serializers.Serializer) | None = None
     change_properties_function: Callable[[dict[str, str], type(Task)], [str]] | None = None
     custom_methods: dict[str, Callable] | None = None
+    # Модели, из которых кроме заданий строится список, для ETag (api.utils.get_changes_etag). None - список без ETag
+    etag_models: tuple[type(models.Model), ...] | None = None
 
 
 class RouterContent(NamedTuple):
@@ -30,6 +58,21 @@ class RouterContent(NamedTuple):
     serializer: type(serializers.Serializer)
 
 
+class ModelFilter(NamedTuple):
+    fields: frozenset[str]
+    types: MappingProxyType
+
+
+@cache
+def get_model_filter(model: type(models.Model), flags: frozenset[str] = frozenset()) -> ModelFilter:
+    """ Допустимые ключи фильтра по модели и типы полей модели. Флаги фильтра считаются логическими полями """
+    types = {field.name: field.get_internal_type() for field in model._meta.concrete_fields}
+    types |= {field.attname: field.target_field.get_internal_type()
+              for field in model._meta.concrete_fields if field.is_relation}
+    types |= {flag: 'BooleanField' for flag in flags}
+    return ModelFilter(fields=frozenset(dir(model)) | flags, types=MappingProxyType(types))
+
+
 def change_task_properties(instance: Task, properties: TaskProperties) -> None:
     """ Сохраняет свойства инстанса из базового класса: статус, флаги выгрузки... """
     keys = set(instance.__dict__.keys()) & set(properties.__dict__.keys())
@@ -37,21 +80,22 @@ def change_task_properties(instance: Task, properties: TaskProperties) -> None:
         return None
 
     fields = {key: str(properties.__dict__[key]) for key in keys if properties.__dict__[key] is not None}
-    type(instance).objects.filter(pk=instance.pk).update(**fields)
+    type(instance).objects.filter(pk=instance.pk).update(**fields, change_id=current_change_id())
+    event = get_task_event(instance, 'changed')
+    event['status'] = fields.get('status', event['status'])
+    publish_task_events(type(instance), [event])
 
 
 def get_task_queryset(task: Task, filter_task: dict[str: str]) -> QuerySet:
     """ Получает выборку из стандартного менеджера модели и сериализатор по типу задачи из роутера.
      В роутере содержатся модели наследуемые от Task """
-    transform_incoming_data(filter_task)
-    queryset = task.objects.all()
-
-    class_keys = set(dir(task)) | {'not_closed', 'only_close', 'all_users'}
-    filter_keys = set(filter_task.keys())
-
-    if len(filter_keys.difference(class_keys)):
+    model_filter = get_model_filter(task, TASK_FILTER_FLAGS)
+    if not model_filter.fields.issuperset(filter_task):
         raise TaskException
 
+    transform_incoming_data(filter_task, model_filter)
+    queryset = task.objects.all()
+
     if filter_task.get('all_users'):
         filter_task.pop('user')
         filter_task.pop('all_users')
@@ -74,17 +118,37 @@ def get_task_queryset(task: Task, filter_task: dict[str: str]) -> QuerySet:
     return queryset
 
 
+def get_task_changes(task: type(Task), queryset: QuerySet, changed_since: str) -> tuple[int, QuerySet, list]:
+    """ Изменения заданий после курсора changed_since. Возвращает новый курсор, измененные задания из выборки
+    и гуиды заданий, которые удалены либо больше не входят в выборку (закрыты, взяты другим пользователем) """
+    try:
+        changed_since = int(changed_since)
+    except ValueError:
+        raise TaskException
+
+    with connection.cursor() as cursor:
+        # Все транзакции, не зафиксированные к этому моменту, получат идентификатор изменения не меньше курсора
+        cursor.execute('SELECT txid_snapshot_xmin(txid_current_snapshot())')
+        new_cursor = cursor.fetchone()[0]
+
+    changed_tasks = queryset.filter(change_id__gte=changed_since)
+    changed_guids = set(task.objects.filter(change_id__gte=changed_since).values_list('guid', flat=True))
+    removed = changed_guids.difference(changed_tasks.values_list('guid', flat=True))
+    removed.update(TaskTombstone.objects.filter(task_model=task._meta.label_lower, change_id__gte=changed_since)
+                   .values_list('guid', flat=True))
+    return new_cursor, changed_tasks, list(removed)
+
+
 def get_content_queryset(router: RouterContent, type_task: str, filter_object: dict[str: str]) -> QuerySet:
     """ Получает данные объектов по модели object_model из роутера. Фильтрация по любому полю модели объекта.
      Дополнительный фильтр по типу задания: класс - content_model """
-    transform_incoming_data(filter_object)
-    objects_queryset = router.object_model.objects.all()
-    class_keys = set(dir(router.object_model))
-    filter_keys = set(filter_object.keys())
-    if len(filter_keys.difference(class_keys)):
+    model_filter = get_model_filter(router.object_model)
+    if not model_filter.fields.issuperset(filter_object):
         raise TaskException
 
-    if len(filter_keys):
+    transform_incoming_data(filter_object, model_filter)
+    objects_queryset = router.object_model.objects.all()
+    if len(filter_object):
         objects_queryset = objects_queryset.filter(**filter_object)
 
     object_ids = objects_queryset.values_list('pk', flat=True)
@@ -96,12 +160,260 @@ def get_content_queryset(router: RouterContent, type_task: str, filter_object: d
     return objects_queryset
 
 
-def transform_incoming_data(request_params: dict[str:str]) -> None:
+def transform_incoming_data(request_params: dict[str:str], model_filter: ModelFilter) -> None:
+    """ Приводит значения логических полей фильтра к виду True/False """
     for key, value in request_params.items():
-        if str(value).capitalize() == 'True' or str(value).capitalize() == 'False':
-            request_params[key] = str(value).capitalize()
+        if model_filter.types.get(key) == 'BooleanField':
+            request_params[key] = BOOLEAN_VALUES.get(str(value).lower(), value)
 
 
 class TaskException(Exception):
     """ Не возможно сформировать список заданий """
     pass
+
+
+def get_task_write_serializer(task_router: RouterTask, data: list | dict) -> serializers.Serializer:
+    """ Сериализатор создания заданий по данным запроса: список или одиночный объект """
+    if isinstance(data, list):
+        return task_router.write_serializer(data=data, many=True)
+    return task_router.write_serializer(data=data)
+
+
+def create_tasks(task_router: RouterTask, type_task: str, data: list | dict, user: User | None) -> dict:
+    """ Проверяет данные запроса, создает задания функцией роутера и формирует ответ:
+    гуиды заданий или данные созданных паллет. Документы, присланные повторно без изменений,
+    получают сохраненный результат без проверки и создания, измененные документы перечисляются в changed """
+    response = {'type_task': type_task}
+    if task_router.answer_serializer or not isinstance(data, list):
+        serializer = get_task_write_serializer(task_router, data)
+        serializer.is_valid(raise_exception=True)
+        result = task_router.create_function(serializer.validated_data, user)
+        if not task_router.answer_serializer:
+            return response | {'guids': result}
+
+        serializer = task_router.answer_serializer(result, many=True)
+        return response | {'pallets': serializer.data}
+
+    fingerprints = [get_document_fingerprint(document) for document in data]
+    replayed, changed = find_replayed_documents(task_router, type_task, fingerprints)
+    results = dict(replayed)
+    created_indexes = [index for index in range(len(data)) if index not in replayed]
+    if created_indexes:
+        serializer = get_task_write_serializer(task_router, [data[index] for index in created_indexes])
+        if not serializer.is_valid():
+            # Ошибки возвращаются по позициям документов исходного запроса
+            errors = [{} for _ in data]
+            for index, error in zip(created_indexes, serializer.errors):
+                errors[index] = error
+            raise ValidationError(errors)
+
+        created = list(task_router.create_function(serializer.validated_data, user))
+        if len(created) == len(created_indexes):
+            results.update(zip(created_indexes, created))
+            save_document_fingerprints(type_task, [(fingerprints[index], results[index])
+                                                   for index in created_indexes if index not in changed])
+        else:
+            # Результат не сопоставляется с документами, поэтому отпечатки не сохраняются
+            results.update(enumerate(created, start=len(data)))
+
+    response = response | {'guids': [results[index] for index in sorted(results)]}
+    if changed:
+        response['changed'] = list(changed.values())
+    return response
+
+
+def get_document_fingerprint(document: dict) -> tuple[str, str] | None:
+    """ Внешний ключ документа и хеш его содержимого. Документы без внешнего источника не отслеживаются """
+    external_source = document.get('external_source') if isinstance(document, dict) else None
+    if not isinstance(external_source, dict) or not external_source.get('external_key'):
+        return None
+
+    content = json.dumps(document, sort_keys=True, ensure_ascii=False, default=str)
+    return str(external_source['external_key']), hashlib.sha256(content.encode()).hexdigest()
+
+
+def find_replayed_documents(task_router: RouterTask, type_task: str,
+                            fingerprints: list[tuple[str, str] | None]) -> tuple[dict[int, str], dict[int, str]]:
+    """ Находит документы, по которым уже созданы задания. Возвращает сохраненные результаты неизмененных
+    документов и внешние ключи измененных документов по позиции документа в запросе """
+    keys = {fingerprint[0] for fingerprint in fingerprints if fingerprint is not None}
+    if not keys:
+        return {}, {}
+
+    stored = {row.external_key: row for row in TaskFingerprint.objects.filter(type_task=type_task,
+                                                                             external_key__in=keys)}
+    if stored:
+        # Отпечаток удаленного задания не считается: документ создается заново
+        existing_keys = set(task_router.task.objects.filter(external_source__external_key__in=stored)
+                            .values_list('external_source__external_key', flat=True))
+        stored = {key: row for key, row in stored.items() if key in existing_keys}
+
+    replayed, changed = {}, {}
+    for index, fingerprint in enumerate(fingerprints):
+        row = stored.get(fingerprint[0]) if fingerprint is not None else None
+        if row is None:
+            continue
+        if row.content_hash == fingerprint[1]:
+            replayed[index] = row.result
+        else:
+            changed[index] = row.external_key
+    return replayed, changed
+
+
+def save_document_fingerprints(type_task: str, rows: Iterable[tuple[tuple[str, str] | None, str]]) -> None:
+    """ Сохраняет отпечатки документов с результатом создания задания по ним """
+    fingerprints = {}
+    for fingerprint, result in rows:
+        if fingerprint is not None:
+            fingerprints.setdefault(fingerprint[0], TaskFingerprint(type_task=type_task, external_key=fingerprint[0],
+                                                                    content_hash=fingerprint[1], result=result))
+    if not fingerprints:
+        return
+
+    with transaction.atomic():
+        TaskFingerprint.objects.filter(type_task=type_task, external_key__in=fingerprints).delete()
+        TaskFingerprint.objects.bulk_create(fingerprints.values())
+
+
+def enqueue_task_job(type_task: str, api_version: str, payload: list | dict, user: User | None) -> TaskJob:
+    """ Сохраняет проверенные данные запроса как задание на создание и будит фоновый обработчик """
+    job = TaskJob.objects.create(type_task=type_task, api_version=api_version, payload=payload, user=user)
+    transaction.on_commit(notify_task_jobs)
+    return job
+
+
+def notify_task_jobs() -> None:
+    """ Сигнал обработчикам о новом задании. Без Redis обработчики находят задания опросом базы """
+    try:
+        get_redis_connection().rpush(TASK_JOBS_QUEUE_KEY, 1)
+    except Exception as e:
+        logger.warning('Не удалось отправить сигнал обработчикам заданий: %s', e)
+
+
+def wait_task_jobs(timeout: int) -> None:
+    """ Ожидает сигнал о новом задании не дольше timeout секунд """
+    try:
+        get_redis_connection().blpop([TASK_JOBS_QUEUE_KEY], timeout=timeout)
+    except Exception as e:
+        logger.warning('Не удалось получить сигнал о заданиях: %s', e)
+        time.sleep(timeout)
+
+
+def claim_task_job() -> TaskJob | None:
+    """ Забирает в работу самое раннее новое задание. Занятые другими обработчиками строки пропускаются.
+    Задание в работе занято на время TASK_JOB_LEASE: если обработчик за это время не завершил его (например,
+    процесс был остановлен), задание забирается повторно, но не больше TASK_JOB_MAX_ATTEMPTS раз """
+    now = timezone.now()
+    with transaction.atomic():
+        TaskJob.objects.filter(status=TaskJobStatus.WORK, lease_date__lt=now,
+                               attempts__gte=TASK_JOB_MAX_ATTEMPTS).update(
+            status=TaskJobStatus.ERROR, error='Задание не обработано за допустимое число попыток', finish_date=now)
+
+        job = (TaskJob.objects.select_for_update(skip_locked=True)
+               .filter(Q(status=TaskJobStatus.NEW) | Q(status=TaskJobStatus.WORK, lease_date__lt=now))
+               .order_by('creating_date').first())
+        if job is None:
+            return None
+        job.status = TaskJobStatus.WORK
+        job.start_date = now
+        job.lease_date = now + TASK_JOB_LEASE
+        job.attempts += 1
+        job.save(update_fields=['status', 'start_date', 'lease_date', 'attempts'])
+    return job
+
+
+def run_task_job(job: TaskJob, routers: dict[str: RouterTask]) -> None:
+    """ Создает задания по сохраненным данным. При ошибке созданные данные откатываются,
+    текст ошибки сохраняется в задании """
+    try:
+        task_router = routers.get(job.type_task.upper())
+        if not task_router:
+            raise APIException('Тип задачи не найден')
+
+        with transaction.atomic():
+            job.result = create_tasks(task_router, job.type_task, job.payload, job.user)
+        job.status = TaskJobStatus.DONE
+    except ValidationError as e:
+        job.status = TaskJobStatus.ERROR
+        job.error = 'Данные не прошли проверку'
+        job.result = e.detail
+    except APIException as e:
+        job.status = TaskJobStatus.ERROR
+        job.error = str(e.detail)
+    except Exception as e:
+        logger.exception('Ошибка обработки задания %s', job.guid)
+        job.status = TaskJobStatus.ERROR
+        job.error = str(e)
+
+    job.finish_date = timezone.now()
+    job.save(update_fields=['status', 'result', 'error', 'finish_date'])
+
+
+def get_task_events_channel(task: type(Task)) -> str:
+    """ Канал Redis событий заданий модели """
+    return f'task_events:{task._meta.label_lower}'
+
+
+def get_task_event(instance: Task, event: str) -> dict:
+    """ Событие задания: создано, изменено (взято в работу, закрыто) либо удалено """
+    return {'event': event, 'guid': instance.pk, 'status': instance.status, 'user': instance.user_id}
+
+
+def publish_task_events(task: type(Task), events: list[dict]) -> None:
+    """ Публикует события заданий подписанным устройствам после фиксации транзакции """
+    if not events:
+        return
+
+    channel = get_task_events_channel(task)
+    message = json.dumps(events, cls=DjangoJSONEncoder)
+
+    def publish():
+        try:
+            get_redis_connection().publish(channel, message)
+        except Exception as e:
+            logger.warning('Не удалось опубликовать события заданий: %s', e)
+
+    transaction.on_commit(publish)
+
+
+def has_task_changes(task: type(Task), changed_since: str) -> bool:
+    """ Есть ли изменения заданий модели после курсора changed_since """
+    try:
+        changed_since = int(changed_since)
+    except ValueError:
+        raise TaskException
+
+    return (task.objects.filter(change_id__gte=changed_since).exists()
+            or TaskTombstone.objects.filter(task_model=task._meta.label_lower, change_id__gte=changed_since).exists())
+
+
+async def wait_task_events(task: type(Task), timeout: float, changed_since: str | None = None) -> list[dict] | None:
+    """ Ожидает события заданий модели не дольше timeout секунд и возвращает их. Если после курсора changed_since
+    задания уже менялись, сразу возвращает None. Курсор проверяется после подписки, поэтому события не теряются """
+    config = settings.CACHES['default']
+    options = config.get('OPTIONS', {})
+    client = redis.asyncio.from_url(config['LOCATION'], db=int(options.get('DB') or 0),
+                                    password=options.get('PASSWORD'))
+    pubsub = client.pubsub()
+    try:
+        await pubsub.subscribe(get_task_events_channel(task))
+        if changed_since is not None and await sync_to_async(has_task_changes)(task, changed_since):
+            return None
+
+        events = []
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not events:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining)
+            if message is not None:
+                events += json.loads(message['data'])
+
+        # События одной операции приходят пачкой, ждем их коротко, чтобы отдать одним ответом
+        while events and (message := await pubsub.get_message(ignore_subscribe_messages=True, timeout=0.1)):
+            events += json.loads(message['data'])
+        return events
+    finally:
+        await pubsub.aclose()
+        await client.aclose()
@@ -0,0 +1,38 @@
+""" Замеры производительности. Не входят в обычный прогон тестов, запускаются явно:
+python manage.py test tests.benchmarks
+Тест падает, если замер превышает бюджет duration_budget (секунды) """
+import datetime
+import time
+
+from django.db import transaction
+
+from packing.marking_services import create_marking_marks, clear_raw_marks, MARKS_BATCH_SIZE
+from packing.models import MarkingOperation, MarkingOperationMark, RawMark
+from tests.tests import BaseClassTest
+
+
+class MarkingCloseBenchmark(BaseClassTest):
+    """ Закрытие маркировки автоматического сканера со 100 000 сырых марок """
+
+    marks_count = 100_000
+    duplicates_count = 10_000
+    duration_budget = 30
+
+    def test_close_marking_with_raw_marks(self):
+        operation = MarkingOperation.objects.create(author=self.user, line=self.line, product=self.product_simple,
+                                                    production_date=datetime.date.today(), batch_number='1')
+        marks = [f'0104610046202380215{index:013d}' for index in range(self.marks_count)]
+        RawMark.objects.bulk_create([RawMark(operation=operation, mark=mark)
+                                     for mark in marks + marks[:self.duplicates_count]], batch_size=MARKS_BATCH_SIZE)
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            data = RawMark.objects.filter(operation=operation).values('mark').iterator(chunk_size=MARKS_BATCH_SIZE)
+            create_marking_marks(operation, data)
+            clear_raw_marks(operation)
+        duration = time.perf_counter() - started
+
+        self.assertEquals(MarkingOperationMark.objects.filter(operation=operation).count(), self.marks_count)
+        self.assertFalse(RawMark.objects.filter(operation=operation).exists())
+        self.assertLess(duration, self.duration_budget,
+                        f'Закрытие маркировки, {self.marks_count} марок: {duration:.2f} с')
@@ -1,13 +1,46 @@
+import base64
+import copy
 import datetime
 import json
+import threading
 import uuid
+from io import StringIO
 from typing import NamedTuple
+from unittest import mock
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Q
+from django.forms import model_to_dict
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework.reverse import reverse
-from rest_framework.test import APITestCase
-from packing.models import MarkingOperation
-from catalogs.models import Line, Product
+from rest_framework.test import APITestCase, APITransactionTestCase
+from api.routers import get_task_registry, get_task_routers
+from api.v2.services import stream_marks_to_unload
+from api.v3.services import load_manual_marks
+from factory_core.models import Shift, reserve_numbers
+from packing.models import MarkingOperation, MarkingOperationMark, ShiftMark, get_mark_hash
+from packing.marking_services import register_to_exchange, create_marking_marks, RAW_MARKS_MAX_BATCH
+from users.models import Setting
+from catalogs.models import Line, Product, ExternalSource, Storage, Unit, RegularExpression
+from warehouse_management.models import (StorageArea, StorageCell, Pallet, OperationCell, SelectionOperation,
+                                         ShipmentOperation, PalletSource, StorageCellContentState,
+                                         StatusCellContent, PalletCollectOperation, OperationPallet, PalletProduct,
+                                         PalletStatus, SuitablePallets, InventoryOperation, OrderOperation,
+                                         PalletContent, StorageCellOccupancy, OperationProduct)
+from warehouse_management.serializers import PalletReadSerializer, PalletWriteSerializer
+from warehouse_management.warehouse_services import (create_shipment_operation, get_or_create_external_source,
+                                                     resolve_external_sources, create_order_operation,
+                                                     create_pallets, change_cell_content_state, get_cell_state,
+                                                     fill_operation_products, fill_operation_pallets,
+                                                     fill_operation_cells)
+from tasks.models import TaskFingerprint, TaskJob, TaskJobStatus, TaskStatus, current_change_id
+from tasks.task_services import (get_task_events_channel, claim_task_job, get_task_changes, TaskException,
+                                 get_model_filter, get_task_queryset, TASK_FILTER_FLAGS,
+                                 TASK_JOB_MAX_ATTEMPTS)
 
 User = get_user_model()
 
@@ -28,6 +61,11 @@ class BaseClassTest(APITestCase):
                                                      is_weight=True)
 
 
+class BaseTransactionClassTest(APITransactionTestCase):
+    """ Данные теста фиксируются каждым запросом, а не откатываются общей транзакцией теста """
+    setUp = BaseClassTest.setUp
+
+
 class InterfaceTests(BaseClassTest):
 
     def test_marking_pages(self):
@@ -92,3 +130,812 @@ class MarkingTests(BaseClassTest):
         response = self.client.put(f'/api/v2/marking/{marking_guid}/', data=json.dumps(marks_data),
                                    content_type='application/json')
         dd = 33
+
+    def test_remove_marks(self):
+        operation = MarkingOperation.objects.create(author=self.user, line=self.line, product=self.product_simple,
+                                                    production_date=datetime.date.today())
+        marks = [f'0104610046202380215{index:013d}' for index in range(3)]
+        MarkingOperationMark.objects.bulk_create([MarkingOperationMark(operation=operation, mark=mark)
+                                                  for mark in marks + marks[:1]])
+        call_command('fill_mark_hash', stdout=StringIO())
+        self.assertEquals(set(operation.marks.values_list('mark_hash', flat=True)),
+                          {get_mark_hash(mark) for mark in marks})
+
+        response = self.client.post('/api/v1/marks/remove/', data={'marks': [marks[0], marks[1], 'unknown']},
+                                    format='json')
+        self.assertEquals(response.data['removed'], {marks[0]: 2, marks[1]: 1, 'unknown': 0})
+        self.assertEquals(list(operation.marks.values_list('mark', flat=True)), [marks[2]])
+
+    def test_shift_marks_dedup(self):
+        shift = Shift.objects.create(line=self.line, production_date=datetime.date.today())
+        operations = [MarkingOperation.objects.create(author=self.user, line=self.line, shift=shift,
+                                                      production_date=datetime.date.today()) for _ in range(3)]
+        marks = [f'0104610046202380215{index:013d}' for index in range(4)]
+
+        create_marking_marks(operations[0], [{'mark': marks[0]}, {'mark': marks[1]}])
+        self.assertEquals(set(ShiftMark.objects.filter(shift=shift).values_list('mark_hash', flat=True)),
+                          {get_mark_hash(mark) for mark in marks[:2]})
+
+        # Хеш удаленной марки остается в ключе смены, но марка загружается повторно
+        operations[0].marks.filter(mark=marks[1]).delete()
+        data = [{'aggregation_code': '01', 'product': str(self.product_simple.guid),
+                 'marks': [{'mark': mark, 'scan_date': timezone.now()} for mark in marks + marks[2:3]]}]
+        load_manual_marks(operations[1], data)
+        self.assertEquals(sorted(operations[1].marks.values_list('mark', flat=True)), marks[1:])
+
+        load_manual_marks(operations[2], data)
+        self.assertFalse(operations[2].marks.exists())
+        self.assertEquals(ShiftMark.objects.filter(shift=shift).count(), len(marks))
+
+    def test_raw_marks_batch(self):
+        operation = MarkingOperation.objects.create(author=self.user, line=self.line,
+                                                    production_date=datetime.date.today())
+        url = f'/api/v4/marking/{operation.guid}/raw_marks/'
+
+        response = self.client.post(url, data='0101\n0102\r\n0101\n', content_type='text/plain')
+        self.assertEquals(response.data, {'created': 2})
+        response = self.client.post(url, data=json.dumps(['0103', {'mark': '0104'}]), content_type='application/json')
+        self.assertEquals(response.data, {'created': 2})
+        response = self.client.post(url, data=json.dumps(['0105']), content_type='application/json; charset=utf-8')
+        self.assertEquals(response.data, {'created': 1})
+        self.assertEquals(sorted(operation.raw_marks.values_list('mark', flat=True)),
+                          ['0101', '0102', '0103', '0104', '0105'])
+
+        self.assertEquals(self.client.post(url, data='{"mark"', content_type='text/plain').status_code, 400)
+        self.assertEquals(self.client.post(url, data='\n'.join(map(str, range(RAW_MARKS_MAX_BATCH + 1))),
+                                           content_type='text/plain').status_code, 400)
+        self.assertEquals(self.client.post(f'/api/v4/marking/{uuid.uuid4()}/raw_marks/', data='0101',
+                                           content_type='text/plain').status_code, 404)
+
+    def test_register_to_exchange_shared_offline_key(self):
+        self.user.settings = Setting.objects.create()
+        self.user.save()
+        groups = [uuid.uuid4(), uuid.uuid4()]
+        tasks = []
+        for group in groups:
+            MarkingOperation.objects.create(author=self.user, line=self.line, production_date=datetime.date.today(),
+                                            batch_number='1', group=group, group_offline='123', closed=True)
+            pallet = Pallet.objects.create(product=self.product_simple, marking_group=str(group))
+            task = PalletCollectOperation.objects.create()
+            OperationPallet.objects.create(operation=task.guid, type_operation=task.type_task, pallet=pallet)
+            tasks.append(task)
+        operation = MarkingOperation.objects.create(author=self.user, line=self.line, batch_number='1',
+                                                    production_date=datetime.date.today(), group_offline='123')
+
+        self.assertTrue(register_to_exchange(operation))
+        self.assertIn(MarkingOperation.objects.get(pk=operation.pk).group, groups)
+        self.assertEquals(PalletCollectOperation.objects.filter(guid__in=[task.guid for task in tasks],
+                                                                ready_to_unload=True).count(), 2)
+
+    def test_stream_marks_to_unload(self):
+        operations = [MarkingOperation.objects.create(author=self.user, line=self.line, closed=True,
+                                                      ready_to_unload=True, production_date=datetime.date.today())
+                      for _ in range(2)]
+        operations.sort(key=lambda operation: str(operation.guid))
+        for number, operation in enumerate(operations):
+            MarkingOperationMark.objects.bulk_create([MarkingOperationMark(operation=operation, mark=f'01{number}{i}')
+                                                      for i in range(3)])
+
+        lines = [json.loads(line) for line in stream_marks_to_unload(chunk_size=2)]
+        checkpoints = [line for line in lines if 'checkpoint' in line]
+        self.assertEquals(len(lines) - len(checkpoints), 6)
+        self.assertEquals([line['operations'] for line in checkpoints],
+                          [[], [str(operations[0].guid)], [str(operations[1].guid)]])
+
+        lines = [json.loads(line) for line in stream_marks_to_unload(checkpoints[0]['checkpoint'], chunk_size=2)]
+        self.assertEquals(len([line for line in lines if 'checkpoint' not in line]), 4)
+
+        response = self.client.get('/api/v2/marks/', {'stream': 'true'})
+        self.assertEquals(response['Content-Type'], 'application/x-ndjson')
+        self.assertEquals(len(b''.join(response.streaming_content).splitlines()), 7)
+        self.client.put('/api/v2/marks/', data={'operations': checkpoints[-1]['operations']}, format='json')
+        self.assertTrue(MarkingOperation.objects.get(pk=operations[1].pk).unloaded)
+
+        self.assertEquals(self.client.get('/api/v2/marks/', {'stream': 'true', 'after': 'e30='}).status_code, 400)
+
+        # марки операции заканчиваются ровно на границе порции
+        MarkingOperationMark.objects.filter(mark__endswith='2').delete()
+        MarkingOperation.objects.update(unloaded=False)
+        lines = [json.loads(line) for line in stream_marks_to_unload(chunk_size=2)]
+        self.assertEquals([line['operations'] for line in lines if 'checkpoint' in line],
+                          [[str(operations[0].guid)], [str(operations[1].guid)]])
+
+
+class WarehouseReadTests(BaseClassTest):
+    """ Количество запросов списков заданий не зависит от количества заданий """
+
+    def create_selection(self, index: int) -> None:
+        area = StorageArea.objects.create(name=f'Область {index}', external_key=str(uuid.uuid4()))
+        external_source = ExternalSource.objects.create(name='Отбор', external_key=str(uuid.uuid4()), number='01')
+        operation = SelectionOperation.objects.create(external_source=external_source)
+        for position in range(3):
+            cell_source = StorageCell.objects.create(name=f'{index}-{position}', storage_area=area,
+                                                     external_key=str(uuid.uuid4()))
+            cell_destination = StorageCell.objects.create(name=f'{index}-{position}-d', storage_area=area,
+                                                          external_key=str(uuid.uuid4()))
+            pallet = Pallet.objects.create(id=f'{index}-{position}', product=self.product_simple, content_count=1)
+            PalletSource.objects.create(pallet=pallet, pallet_source=pallet, product=self.product_simple, count=1)
+            StorageCellContentState.objects.create(cell=cell_source, pallet=pallet,
+                                                   status=StatusCellContent.PLACED)
+            OperationCell.objects.create(operation=operation.guid, type_operation=operation.type_task, pallet=pallet,
+                                         cell_source=cell_source, cell_destination=cell_destination)
+
+    def get_queries_count(self, url: str) -> int:
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEquals(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_selection_query_budget(self):
+        self.create_selection(0)
+        queries_count = self.get_queries_count('/api/v4/tasks/SELECTION/')
+        self.assertLessEqual(queries_count, 10)
+
+        for index in range(1, 5):
+            self.create_selection(index)
+        self.assertEquals(self.get_queries_count('/api/v4/tasks/SELECTION/'), queries_count)
+
+    def test_selection_without_pallet(self):
+        self.create_selection(0)
+        OperationCell.objects.filter(pallet__id='0-1').update(pallet=None)
+        response = self.client.get('/api/v4/tasks/SELECTION/')
+        self.assertEquals(response.status_code, 200)
+        pallets = [row['pallet'] for area in response.data[0]['storage_areas'] for row in area['pallets']]
+        self.assertEquals(sorted(pallet['id'] for pallet in pallets), ['', '0-0', '0-2'])
+
+    def test_pallet_list_serializer(self):
+        self.create_selection(0)
+        pallets = Pallet.objects.order_by('id')
+        with CaptureQueriesContext(connection) as context:
+            data = PalletReadSerializer(pallets, many=True).data
+        self.assertEquals(data, [PalletReadSerializer(pallet).data for pallet in pallets])
+        self.assertEquals([row['cell']['name'] for row in data], ['0-0', '0-1', '0-2'])
+        self.assertEquals([len(row['sources']) for row in data], [1, 1, 1])
+
+        self.create_selection(1)
+        with CaptureQueriesContext(connection) as context_more:
+            PalletReadSerializer(Pallet.objects.order_by('id'), many=True).data
+        self.assertEquals(len(context_more.captured_queries), len(context.captured_queries))
+
+    def test_shipment_query_budget(self):
+        def create_shipment():
+            external_source = ExternalSource.objects.create(name='Отгрузка', external_key=str(uuid.uuid4()),
+                                                            number='02')
+            ShipmentOperation.objects.create(external_source=external_source)
+
+        create_shipment()
+        queries_count = self.get_queries_count('/api/v4/tasks/SHIPMENT/')
+        self.assertLessEqual(queries_count, 5)
+
+        for _ in range(4):
+            create_shipment()
+        self.assertEquals(self.get_queries_count('/api/v4/tasks/SHIPMENT/'), queries_count)
+        self.assertEquals(self.get_queries_count('/api/v1/tasks/SHIPMENT/'), queries_count)
+
+    def create_collect(self, index: int) -> None:
+        operation = PalletCollectOperation.objects.create(user=self.user)
+        for position, status in enumerate((PalletStatus.WAITED, PalletStatus.COLLECTED, PalletStatus.ARCHIVED)):
+            pallet = Pallet.objects.create(id=f'{index}-{position}', product=self.product_simple, content_count=1,
+                                           status=status)
+            OperationPallet.objects.create(operation=operation.guid, type_operation=operation.type_task,
+                                           pallet=pallet)
+            pallet_product = PalletProduct.objects.create(pallet=pallet, product=self.product_simple, count=1)
+            SuitablePallets.objects.create(pallet_product=pallet_product, pallet=pallet, count=1, priority=1)
+            PalletSource.objects.create(pallet=pallet, pallet_source=pallet, product=self.product_simple, count=1)
+
+    def test_collect_query_budget(self):
+        urls = ('/api/v4/tasks/PALLET_COLLECT/', '/api/v4/tasks/PALLET_COLLECT_SHIPMENT/',
+                '/api/v1/tasks/PALLET_COLLECT_SHIPMENT/')
+        self.create_collect(0)
+        queries_counts = [self.get_queries_count(url) for url in urls]
+        for queries_count in queries_counts:
+            self.assertLessEqual(queries_count, 10)
+
+        for index in range(1, 5):
+            self.create_collect(index)
+        self.assertEquals([self.get_queries_count(url) for url in urls], queries_counts)
+
+
+class StorageCellsTests(BaseClassTest):
+    """ Размещение паллет в ячейках """
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.area = StorageArea.objects.create(name='Хранение', external_key=str(uuid.uuid4()),
+                                               use_for_automatic_placement=True)
+        self.cells = [StorageCell.objects.create(name=f'A-{position}', storage_area=self.area, rack_number=1,
+                                                 position=position, external_key=str(uuid.uuid4()))
+                      for position in range(3)]
+
+    def test_free_cells(self):
+        pallet = Pallet.objects.create(id='placed', product=self.product_simple, content_count=1)
+        StorageCellContentState.objects.create(cell=self.cells[0], pallet=pallet, status=StatusCellContent.PLACED)
+        inventory = InventoryOperation.objects.create()
+        OperationCell.objects.create(operation=inventory.guid, type_operation=inventory.type_task,
+                                     cell_source=self.cells[1])
+
+        response = self.client.get('/api/v4/cells/free/')
+        self.assertEquals([cell['guid'] for cell in response.data], [str(self.cells[2].guid)])
+        self.assertEquals(self.client.get('/api/v4/cells/free/', {'limit': 'x'}).status_code, 400)
+
+    def test_cell_occupancy(self):
+        pallet = Pallet.objects.create(id='moved', product=self.product_simple, content_count=1)
+        StorageCellContentState.objects.create(cell=self.cells[0], pallet=pallet)
+        change_cell_content_state({'cell_source': self.cells[0].guid, 'cell_destination': self.cells[1].guid}, pallet)
+        self.assertEquals(get_cell_state(pallet=pallet).cell, self.cells[1])
+
+        StorageCellContentState.objects.filter(pallet=pallet, cell=self.cells[1]).delete()
+        self.assertIsNone(get_cell_state(pallet=pallet))
+        StorageCellContentState.objects.filter(pallet=pallet, status=StatusCellContent.REMOVED).delete()
+        self.assertEquals(get_cell_state(pallet=pallet).cell, self.cells[0])
+
+        StorageCellOccupancy.objects.all().delete()
+        out = StringIO()
+        call_command('fill_cell_occupancy', stdout=out)
+        self.assertEquals(get_cell_state(pallet=pallet).cell, self.cells[0])
+        self.assertIn('1', out.getvalue())
+
+
+class OperationLinksTests(BaseClassTest):
+    """ Строки связей операции записываются заполненными, одним запросом на таблицу """
+
+    def test_fill_operation_links(self):
+        external_source = ExternalSource.objects.create(name='Отгрузка 05', external_key=str(uuid.uuid4()),
+                                                        number='05')
+        operation = ShipmentOperation.objects.create(external_source=external_source)
+        pallets = [Pallet.objects.create(id=f'link-{index}', product=self.product_simple) for index in range(3)]
+        cells = [StorageCell.objects.create(name=f'B-{index}', external_key=str(uuid.uuid4())) for index in range(3)]
+
+        with CaptureQueriesContext(connection) as context:
+            fill_operation_products(operation, [{'product': self.product_simple.external_key, 'count': 2},
+                                                {'product': self.product_weight.external_key, 'weight': 5}])
+            fill_operation_pallets(operation, [pallet.id for pallet in pallets])
+            fill_operation_cells(operation, [{'cell': cell.external_key, 'pallet': pallet.id}
+                                             for cell, pallet in zip(cells, pallets)])
+
+        statements = [query['sql'].split(' ', 3)[:3] for query in context.captured_queries]
+        for model in (OperationProduct, OperationPallet, OperationCell):
+            table = f'"{model._meta.db_table}"'
+            self.assertEquals(statements.count(['INSERT', 'INTO', table]), 1)
+            self.assertNotIn(['UPDATE', table, 'SET'], statements)
+            rows = model.objects.filter(operation=operation.guid)
+            self.assertEquals(len(rows), 2 if model is OperationProduct else 3)
+            for row in rows:
+                self.assertEquals((row.type_operation, row.number_operation, row.external_source),
+                                  (operation.type_task, str(operation.number), external_source.name))
+
+        self.assertEquals(
+            set(OperationCell.objects.filter(operation=operation.guid).values_list('cell_source', 'pallet')),
+            {(cell.guid, pallet.guid) for cell, pallet in zip(cells, pallets)}
+        )
+
+
+class ExternalSourceTests(BaseClassTest):
+    """ Повторная передача документов не создает и не переписывает внешние источники """
+
+    def get_row_location(self, external_source: ExternalSource) -> str:
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT ctid FROM {ExternalSource._meta.db_table} WHERE id = %s', [external_source.pk])
+            return cursor.fetchone()[0]
+
+    def test_resend_external_source(self):
+        data = {'external_source': {'external_key': str(uuid.uuid4()), 'name': 'Отгрузка', 'number': '01'}}
+        external_source = get_or_create_external_source(data)
+        operation = ShipmentOperation.objects.create(external_source=external_source)
+        location = self.get_row_location(external_source)
+
+        new_data = {'external_key': str(uuid.uuid4()), 'name': 'Отгрузка', 'number': '02'}
+        external_sources, tasks = resolve_external_sources([data['external_source'], new_data], ShipmentOperation)
+        self.assertEquals(external_sources[data['external_source']['external_key']].pk, external_source.pk)
+        self.assertEquals(tasks, {data['external_source']['external_key']: operation})
+        self.assertEquals(self.get_row_location(external_source), location)
+        self.assertEquals(ExternalSource.objects.filter(
+            external_key__in=[data['external_source']['external_key'], new_data['external_key']]).count(), 2)
+
+
+class NumberingTests(BaseClassTest):
+    """ Нумерация документов последовательностями базы данных """
+
+    def test_numbers(self):
+        first = PalletCollectOperation.objects.create()
+        numbers = PalletCollectOperation.reserve_numbers(3)
+        second = PalletCollectOperation.objects.create()
+        self.assertEquals(numbers, [first.number + 1, first.number + 2, first.number + 3])
+        self.assertEquals(second.number, first.number + 4)
+
+        shifts = [Shift.objects.create(production_date=datetime.date.today()) for _ in range(2)]
+        self.assertEquals(shifts[1].number, shifts[0].number + 1)
+
+    def test_numbers_continue_table(self):
+        ShipmentOperation.objects.bulk_create([ShipmentOperation(number=41)])
+        self.assertEquals(ShipmentOperation.objects.create().number, 42)
+
+    def test_number_series(self):
+        self.assertEquals(reserve_numbers('tests.series', 2, '20260101'), [1, 2])
+        self.assertEquals(reserve_numbers('tests.series', 1, '20260102'), [1])
+        self.assertEquals(reserve_numbers('tests.series', 1, '20260101'), [3])
+
+
+class NumberingConcurrencyTests(APITransactionTestCase):
+    """ Открытая транзакция, создавшая документ, не задерживает нумерацию других документов """
+
+    @mock.patch('tasks.task_services.get_redis_connection')
+    def test_numbers_without_lock(self, _):
+        created, release = threading.Event(), threading.Event()
+        numbers = []
+
+        def create_operation():
+            try:
+                with transaction.atomic():
+                    numbers.append(PalletCollectOperation.objects.create().number)
+                    created.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        PalletCollectOperation.objects.create()
+        thread = threading.Thread(target=create_operation)
+        thread.start()
+        created.wait(10)
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL lock_timeout = '1s'")
+                numbers.append(PalletCollectOperation.objects.create().number)
+        finally:
+            release.set()
+            thread.join()
+        self.assertEquals(len(set(numbers)), 2)
+
+
+class TaskEventsTests(BaseClassTest):
+    """ События о созданных заданиях публикуются и для пакетно созданных заданий """
+
+    def test_shipment_child_tasks_events(self):
+        data = [{'external_source': {'external_key': str(uuid.uuid4()), 'name': 'Отгрузка', 'number': '03'},
+                 'pallets': [{'id': f'shipment-{index}', 'product': self.product_simple.external_key}
+                             for index in range(2)],
+                 'cells': []}]
+        with mock.patch('tasks.task_services.get_redis_connection') as get_redis_connection:
+            with self.captureOnCommitCallbacks(execute=True):
+                guids = create_shipment_operation(data, self.user)
+
+        published = {}
+        for channel, message in (call.args for call in get_redis_connection.return_value.publish.call_args_list):
+            published.setdefault(channel, []).extend(json.loads(message))
+        child_guids = PalletCollectOperation.objects.filter(parent_task=guids[0]).values_list('guid', flat=True)
+        self.assertEquals(len(child_guids), 2)
+        self.assertEquals({(event['event'], event['guid'])
+                           for event in published[get_task_events_channel(PalletCollectOperation)]},
+                          {('created', str(guid)) for guid in child_guids})
+
+
+def create_pallets_row_by_row(serializer_data: list[dict], user: User, task: ShipmentOperation) -> list[Pallet]:
+    """ Построчная загрузка паллет до перевода на пакетную запись, эталон для сравнения результатов """
+    result = []
+    related_tables = ('codes', 'products')
+
+    for element in serializer_data:
+        search_field = 'id' if element.get('id') is not None else 'external_key'
+        search_value = element.get(search_field)
+        pallet = None
+
+        if search_value is not None:
+            pallet = Pallet.objects.filter(**{search_field: search_value}).first()
+
+        if pallet and pallet.product and pallet.product.variable_pallet_weight and element.get('weight'):
+            pallet.weight = element['weight']
+            pallet.save()
+
+        if not pallet:
+            product = element.get('product') or None
+            element['product'] = Product.objects.filter(Q(guid=product) | Q(external_key=product)).first()
+
+            if element['product'] and not element['product'].variable_pallet_weight:
+                unit = Unit.objects.filter(is_default=True, product=element['product']).first()
+
+                if unit and element.get('content_count'):
+                    element['weight'] = element['content_count'] * unit.weight
+
+            element['cell'] = StorageCell.objects.filter(guid=element.get('cell') or None).first()
+
+            production_shop = element.get('production_shop') or None
+            element['production_shop'] = Storage.objects.filter(
+                Q(guid=production_shop) | Q(external_key=production_shop)
+            ).first()
+
+            if element.get('code_offline') is not None:
+                element['marking_group'] = element['code_offline']
+
+            if element.get('shift') is not None:
+                shift = Shift.objects.filter(pk=element.get('shift')).first()
+                element['shift'] = shift
+                element['marking_group'] = shift.guid
+
+            if element.get('content_count'):
+                element['initial_count'] = element['content_count']
+
+            serializer_keys = set(element.keys()) - set(related_tables)
+            fields = {key: element[key] for key in (set(dir(Pallet)) & serializer_keys)}
+            pallet = Pallet.objects.create(**fields, collector=user)
+
+        if element.get('products') is not None and not PalletProduct.objects.filter(pallet=pallet).count():
+            suitable_pallets = None
+            for product in element['products']:
+                product['pallet'] = pallet
+                product['product'] = Product.objects.filter(external_key=product['product']).first()
+
+                if product.get('order_external_source') is not None:
+                    order = create_order_operation(product, user, task)
+                    product.pop('order_external_source')
+                    product['order'] = order
+
+                if product.get('suitable_pallets') is not None:
+                    suitable_pallets = product.pop('suitable_pallets')
+
+                pallet_product = PalletProduct.objects.create(**product)
+                for suitable_pallet_row in suitable_pallets or ():
+                    suitable_pallet = Pallet.objects.filter(id=suitable_pallet_row.pop('id')).first()
+                    SuitablePallets.objects.create(pallet_product=pallet_product, pallet=suitable_pallet,
+                                                   **suitable_pallet_row)
+
+        result.append(pallet)
+
+    return result
+
+
+class ShipmentIngestionTests(BaseClassTest):
+    """ Пакетная загрузка паллет отгрузки дает тот же результат, что и построчная """
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.task = ShipmentOperation.objects.create()
+        self.cell = StorageCell.objects.create(name='Ячейка отгрузки')
+        Unit.objects.create(name='Коробка', product=self.product_simple, is_default=True, weight=3)
+        product_variable = Product.objects.create(name='Сыр с переменным весом паллеты',
+                                                  external_key=str(uuid.uuid4()), variable_pallet_weight=True)
+        Pallet.objects.create(id='variable-pallet', product=product_variable, weight=1)
+
+        with open(settings.BASE_DIR.parent / 'fixtures' / 'shipment.json', encoding='utf-8') as file:
+            shipment = json.load(file)[0]
+        pallets = shipment['pallets']
+        for pallet in pallets:
+            for row in pallet['products']:
+                Product.objects.get_or_create(external_key=row['product'], defaults={'name': 'Сыр из 1С'})
+                order = row.pop('order')
+                row['order_external_source'] = {
+                    'name': order['name'], 'external_key': order['external_key'], 'number': order['number'],
+                    'date': '2022-12-12T00:00', 'client_presentation': order['client']
+                }
+                row['suitable_pallets'] = []
+        pallets.append({**pallets[0], 'weight': 5})
+        pallets.append({'id': 'variable-pallet', 'weight': 7})
+        pallets.append({'id': 'from-cell', 'product': self.product_simple.external_key, 'content_count': 4,
+                        'cell': str(self.cell.guid),
+                        'products': [{**pallets[0]['products'][0], 'external_key': 'from-cell-row',
+                                      'suitable_pallets': [{'id': pallets[0]['id'], 'count': 1, 'priority': 1}]}]})
+
+        serializer = PalletWriteSerializer(data=pallets, many=True)
+        serializer.is_valid(raise_exception=True)
+        self.pallets_data = serializer.validated_data
+
+    def test_create_pallets_matches_row_by_row(self):
+        with mock.patch('tasks.task_services.get_redis_connection'):
+            expected = self._ingest(create_pallets_row_by_row)
+            result = self._ingest(create_pallets)
+        self.assertEquals(result, expected)
+        self.assertEquals(expected['pallets'][2]['weight'], 7)
+        self.assertEquals(expected['pallets'][3]['weight'], 12)
+        self.assertEquals(len(expected['products'][3][0]['suitable_pallets']), 1)
+
+    def test_create_pallets_codes(self):
+        PalletContent.objects.create(pallet=Pallet.objects.get(id='variable-pallet'), aggregation_code='loaded')
+        pallets = create_pallets([{'id': 'coded', 'codes': ['code', 'code', 'loaded']}], self.user, self.task)
+        self.assertEquals(list(pallets[0].codes.values_list('aggregation_code', flat=True)), ['code'])
+
+    def _ingest(self, create_function) -> dict:
+        """ Загружает паллеты указанной функцией и описывает результат, затем откатывает загрузку """
+        savepoint = transaction.savepoint()
+        pallets = create_function(copy.deepcopy(self.pallets_data), self.user, self.task)
+        result = {'pallets': [], 'products': []}
+        for pallet in pallets:
+            pallet.refresh_from_db()
+            result['pallets'].append(model_to_dict(pallet))
+            products = []
+            for row in PalletProduct.objects.filter(pallet=pallet).order_by('pk'):
+                products.append({
+                    **model_to_dict(row, exclude=['id', 'pallet', 'order']),
+                    'order': row.order and (row.order.external_source.external_key, row.order.client_presentation,
+                                            row.order.parent_task_id),
+                    'suitable_pallets': [(suitable.pallet.id, suitable.count, suitable.priority)
+                                         for suitable in SuitablePallets.objects.filter(pallet_product=row)]
+                })
+            result['products'].append(products)
+        result['orders'] = OrderOperation.objects.count()
+        transaction.savepoint_rollback(savepoint)
+        return result
+
+
+class TaskFingerprintTests(BaseClassTest):
+    """ Повторно присланные документы отвечаются по сохраненным отпечаткам """
+
+    def get_document(self, pallets_count: int) -> dict:
+        return {'external_source': {'external_key': self.external_key, 'name': 'Отгрузка', 'number': '07'},
+                'pallets': [{'id': f'resend-{index}', 'product': self.product_simple.external_key}
+                            for index in range(pallets_count)],
+                'cells': []}
+
+    def create(self, document: dict) -> tuple[dict, list[str]]:
+        with mock.patch('tasks.task_services.get_redis_connection'):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post('/api/v4/tasks/SHIPMENT/', [document], format='json')
+        self.assertEquals(response.status_code, 200)
+        return response.json(), [query['sql'] for query in context.captured_queries]
+
+    def test_resend(self):
+        self.external_key = str(uuid.uuid4())
+        created, _ = self.create(self.get_document(2))
+        self.assertEquals(TaskFingerprint.objects.filter(external_key=self.external_key).count(), 1)
+
+        replayed, queries = self.create(self.get_document(2))
+        self.assertEquals(replayed['guids'], created['guids'])
+        self.assertNotIn('changed', replayed)
+        for table in (Pallet._meta.db_table, Product._meta.db_table, StorageCell._meta.db_table):
+            self.assertFalse([sql for sql in queries if f'"{table}"' in sql], table)
+
+        changed, _ = self.create(self.get_document(3))
+        self.assertEquals(changed['guids'], created['guids'])
+        self.assertEquals(changed['changed'], [self.external_key])
+        self.assertEquals(Pallet.objects.filter(id__startswith='resend-').count(), 2)
+
+        ShipmentOperation.objects.filter(guid=created['guids'][0]).delete()
+        recreated, _ = self.create(self.get_document(2))
+        self.assertNotEquals(recreated['guids'], created['guids'])
+        self.assertNotIn('changed', recreated)
+
+
+class TaskRouterRegistryTests(BaseClassTest):
+    """ Реестр роутеров строится один раз и пересобирается только после сброса кэша """
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.addCleanup(get_task_registry.cache_clear)
+
+    def test_registry_built_once(self):
+        registry = get_task_registry()
+        with mock.patch('api.v1.routers.get_task_router') as get_task_router:
+            self.assertEquals(self.client.get('/api/v4/tasks/SHIPMENT/').status_code, 200)
+            self.assertEquals(self.client.get('/api/v1/tasks/SHIPMENT/').status_code, 200)
+        get_task_router.assert_not_called()
+        self.assertIs(get_task_registry(), registry)
+        with self.assertRaises(TypeError):
+            registry['v4']['TEST'] = registry['v4']['SHIPMENT']
+
+    def test_registry_cache_clear(self):
+        shipment_router = get_task_routers('v4')['SHIPMENT']
+        with mock.patch('api.v4.routers.get_task_router', return_value={'TEST': shipment_router}):
+            get_task_registry.cache_clear()
+            self.assertEquals(self.client.get('/api/v4/tasks/TEST/').status_code, 200)
+        self.assertNotIn('TEST', get_task_routers('v3'))
+
+        get_task_registry.cache_clear()
+        self.assertNotIn('TEST', get_task_routers('v4'))
+
+    def test_model_filter(self):
+        model_filter = get_model_filter(ShipmentOperation, TASK_FILTER_FLAGS)
+        self.assertIs(get_model_filter(ShipmentOperation, TASK_FILTER_FLAGS), model_filter)
+        self.assertEquals(model_filter.types['closed'], 'BooleanField')
+
+        closed = ShipmentOperation.objects.create(closed=True)
+        ShipmentOperation.objects.create(closed=False)
+        queryset = get_task_queryset(ShipmentOperation, {'closed': 'true', 'user': self.user})
+        self.assertEquals([task.guid for task in queryset], [closed.guid])
+        with self.assertRaises(TaskException):
+            get_task_queryset(ShipmentOperation, {'unknown': 'true', 'user': self.user})
+
+
+class TaskChangesTests(BaseClassTest):
+    """ Синхронизация списков заданий по курсору изменений """
+
+    def test_task_changes(self):
+        changed, closed, unchanged, deleted = [PalletCollectOperation.objects.create() for _ in range(4)]
+        self.assertIsInstance(changed.change_id, int)
+        queryset = PalletCollectOperation.objects.exclude(status=TaskStatus.CLOSE)
+        cursor, tasks, removed = get_task_changes(PalletCollectOperation, queryset, '0')
+        self.assertEquals(len(tasks), 4)
+
+        # Курсор не больше номера текущей транзакции: все изменения теста видны после курсора
+        changed.user = self.user
+        changed.save()
+        closed.status = TaskStatus.CLOSE
+        closed.save()
+        deleted_guid = deleted.guid
+        deleted.delete()
+        created = PalletCollectOperation.objects.create()
+
+        _, tasks, removed = get_task_changes(PalletCollectOperation, queryset, str(cursor))
+        self.assertEquals({task.guid for task in tasks}, {changed.guid, created.guid, unchanged.guid})
+        self.assertEquals(set(removed), {closed.guid, deleted_guid})
+
+        with self.assertRaises(TaskException):
+            get_task_changes(PalletCollectOperation, queryset, 'abc')
+
+
+class TaskChangesInFlightTests(APITransactionTestCase):
+    """ Задание, записанное транзакцией, не зафиксированной к моменту чтения курсора, попадает в следующую выборку """
+
+    @mock.patch('tasks.task_services.get_redis_connection')
+    def test_task_changes_in_flight(self, _):
+        cursor, _, _ = get_task_changes(PalletCollectOperation, PalletCollectOperation.objects.all(), '0')
+        written, release = threading.Event(), threading.Event()
+        tasks = []
+
+        def write_task():
+            try:
+                with transaction.atomic():
+                    tasks.append(PalletCollectOperation.objects.create())
+                    written.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=write_task)
+        thread.start()
+        written.wait(10)
+        cursor, changed_tasks, _ = get_task_changes(PalletCollectOperation, PalletCollectOperation.objects.all(),
+                                                    str(cursor))
+        self.assertFalse(changed_tasks.exists())
+        release.set()
+        thread.join()
+
+        _, changed_tasks, _ = get_task_changes(PalletCollectOperation, PalletCollectOperation.objects.all(),
+                                               str(cursor))
+        self.assertEquals([task.guid for task in changed_tasks], [tasks[0].guid])
+
+
+class TaskJobTests(BaseClassTest):
+    """ Задание на создание, брошенное остановленным обработчиком, забирается повторно """
+
+    def test_claim_expired_job(self):
+        job = TaskJob.objects.create(type_task='SHIPMENT', api_version='v4', payload=[], user=self.user)
+        self.assertEquals(claim_task_job().pk, job.pk)
+        self.assertIsNone(claim_task_job())
+
+        TaskJob.objects.filter(pk=job.pk).update(lease_date=timezone.now() - datetime.timedelta(seconds=1))
+        job = claim_task_job()
+        self.assertEquals((job.status, job.attempts), (TaskJobStatus.WORK, 2))
+
+        TaskJob.objects.filter(pk=job.pk).update(lease_date=timezone.now() - datetime.timedelta(seconds=1),
+                                                 attempts=TASK_JOB_MAX_ATTEMPTS)
+        self.assertIsNone(claim_task_job())
+        self.assertEquals(TaskJob.objects.get(pk=job.pk).status, TaskJobStatus.ERROR)
+
+
+class TaskClaimTests(BaseClassTest):
+    """ Задание берется в работу только один раз """
+
+    def test_claim_next_task(self):
+        operations = [SelectionOperation.objects.create(external_source=ExternalSource.objects.create(
+            name='Отбор', external_key=str(uuid.uuid4()), number='01')) for _ in range(2)]
+
+        claimed = [self.client.post('/api/v4/tasks/SELECTION/claim/').data['guid'] for _ in operations]
+        self.assertEquals(claimed, [operation.guid for operation in operations])
+        self.assertEquals(self.client.post('/api/v4/tasks/SELECTION/claim/').status_code, 204)
+
+        response = self.client.patch(f'/api/v4/tasks/SELECTION/{operations[0].guid}/take/')
+        self.assertEquals(response.data['detail'], 'Задача уже в работе')
+
+
+class PalletPaginationTests(BaseClassTest):
+    """ Постраничная выдача паллет по курсору """
+
+    def test_keyset_pages(self):
+        for index in range(5):
+            Pallet.objects.create(id=str(index), product=self.product_simple, content_count=5 - index)
+
+        for url in ('/api/v1/pallets/', '/api/v2/pallets/'):
+            pallets, params = [], {'limit': 2}
+            while True:
+                response = self.client.get(url, params)
+                pallets.extend(pallet['id'] for pallet in response.data['results'])
+                if response.data['next'] is None:
+                    break
+                params['cursor'] = response.data['next']
+            self.assertEquals(pallets, ['0', '1', '2', '3', '4'])
+
+            response = self.client.get(url, {'stream': 'true'})
+            streamed = json.loads(b''.join(response.streaming_content))
+            self.assertEquals([pallet['id'] for pallet in streamed], pallets)
+
+            for payload in ({'date': 1}, ['2022-01-01T00:00:00+00:00', 'guid'], 'cursor'):
+                cursor = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+                self.assertEquals(self.client.get(url, {'cursor': cursor}).status_code, 400)
+            self.assertEquals(self.client.get(url, {'cursor': '%%%'}).status_code, 400)
+
+
+@mock.patch('tasks.task_services.get_redis_connection')
+class ConditionalGetTests(BaseTransactionClassTest):
+    """ Ответ 304 пока не изменились модели, из которых строится список. Отметка изменения - номер транзакции,
+    поэтому изменения выполняются вне общей транзакции теста """
+
+    def test_products_etag(self, _):
+        etag = self.client.get('/api/v1/products/')['ETag']
+        response = self.client.get('/api/v1/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 304)
+
+        self.product_simple.name = 'Новое наименование'
+        self.product_simple.save()
+        response = self.client.get('/api/v1/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 200)
+        self.assertNotEquals(response['ETag'], etag)
+
+        etag = response['ETag']
+        Unit.objects.create(product=self.product_weight, name='Коробка')
+        self.assertEquals(self.client.get('/api/v1/products/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_tasks_etag(self, _):
+        external_source = ExternalSource.objects.create(name='Отгрузка', external_key=str(uuid.uuid4()), number='02')
+        operation = ShipmentOperation.objects.create(external_source=external_source)
+        deleted = ShipmentOperation.objects.create(external_source=external_source)
+        url = '/api/v4/tasks/SHIPMENT/'
+        etag = self.client.get(url)['ETag']
+
+        MarkingOperation.objects.create(author=self.user, line=self.line, production_date=datetime.date.today())
+        StorageArea.objects.create(name='Область', external_key=str(uuid.uuid4()))
+        PalletCollectOperation.objects.create()
+        self.assertEquals(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        ShipmentOperation.objects.filter(pk=operation.pk).update(status=TaskStatus.WORK, change_id=current_change_id())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 200)
+
+        etag = response['ETag']
+        deleted.delete()
+        self.assertEquals(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_tasks_without_etag(self, _):
+        PalletCollectOperation.objects.create()
+        self.assertFalse(self.client.get('/api/v4/tasks/PALLET_COLLECT/').has_header('ETag'))
+
+    def test_etag_in_flight(self, _):
+        written, release = threading.Event(), threading.Event()
+
+        def write_product():
+            try:
+                with transaction.atomic():
+                    Product.objects.create(name='Сыр', gtin='4610046202380', external_key=str(uuid.uuid4()))
+                    written.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=write_product)
+        thread.start()
+        written.wait(10)
+        try:
+            Product.objects.create(name='Сыр весовой', gtin='4607104080790', external_key=str(uuid.uuid4()))
+            self.assertFalse(self.client.get('/api/v1/products/').has_header('ETag'))
+        finally:
+            release.set()
+            thread.join()
+        self.assertTrue(self.client.get('/api/v1/products/').has_header('ETag'))
+
+
+class CatalogChangesTests(BaseClassTest):
+    """ Изменения справочников по версии """
+
+    def test_catalog_changes(self):
+        version = self.client.get('/api/v4/catalog/changes/').data['version']
+        unit = Unit.objects.create(product=self.product_simple, name='Коробка')
+        expression = RegularExpression.objects.create(value='(01)')
+        expression_id = expression.pk
+        expression.delete()
+
+        response = self.client.get('/api/v4/catalog/changes/', {'since': version})
+        self.assertIn(str(unit.guid), [item['guid'] for item in response.data['units']])
+        self.assertIn(str(self.product_simple.guid), [item['guid'] for item in response.data['products']])
+        self.assertEquals(response.data['deleted']['regexps'], [str(expression_id)])
+
+    def test_catalog_changes_bad_version(self):
+        response = self.client.get('/api/v4/catalog/changes/', {'since': 'abc'})
+        self.assertEquals(response.status_code, 400)
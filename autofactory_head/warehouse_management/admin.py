@@ -4,13 +4,14 @@ from rangefilter.filters import DateRangeFilter
 from rest_framework.exceptions import APIException
 from django.contrib import messages
 
-from tasks.models import TaskStatus
+from tasks.models import TaskStatus, current_change_id
+from tasks.task_services import get_task_event, publish_task_events
 from warehouse_management.models import (
     AcceptanceOperation, Pallet, OperationPallet, OperationProduct, PalletCollectOperation, PlacementToCellsOperation,
     MovementBetweenCellsOperation, ShipmentOperation, PalletProduct, OrderOperation, PalletSource,
     ArrivalAtStockOperation, InventoryOperation, OperationCell, SelectionOperation, StorageCell, StorageArea,
     StorageCellContentState, RepackingOperation, SuitablePallets, WriteOffOperation, InventoryAddressWarehouseOperation,
-    InventoryAddressWarehouseContent, CancelShipmentOperation, MovementShipmentOperation
+    InventoryAddressWarehouseContent, CancelShipmentOperation, MovementShipmentOperation, StorageCellOccupancy
 )
 from warehouse_management.warehouse_services import (get_unused_cells_for_placement,
                                                      create_inventory_with_placement_operation)
@@ -29,16 +30,14 @@ def make_pallet_placed(model, request, queryset):
 @admin.action(description='Сгенерировать документы инвентаризации')
 @transaction.atomic
 def create_inventory_operations(model, request, queryset):
-    unused_cells = get_unused_cells_for_placement()
+    count = queryset.count()
+    unused_cells = list(get_unused_cells_for_placement(limit=count))
 
-    if len(unused_cells) < queryset.count():
+    if len(unused_cells) < count:
         messages.add_message(request, messages.ERROR, 'Свободных ячеек не хватит на выбранные паллеты')
         return
 
-    for pallet in queryset:
-        if not len(unused_cells):
-            break
-        cell = unused_cells.pop()
+    for pallet, cell in zip(queryset, unused_cells):
         data = {'cell': cell.external_key,
                 'pallet': pallet.guid,
                 'count': pallet.content_count,
@@ -57,17 +56,18 @@ def make_cells_placed(model, request, queryset):
 
 @admin.action(description='Пометить задание как выгруженное')
 def make_task_unloaded(model, request, queryset):
-    queryset.update(unloaded=True)
+    queryset.update(unloaded=True, change_id=current_change_id())
 
 
 @admin.action(description='Пометить задание как не выгруженное')
 def make_task_loaded(model, request, queryset):
-    queryset.update(unloaded=False)
+    queryset.update(unloaded=False, change_id=current_change_id())
 
 
 @admin.action(description='Пометить задание как закрытое')
 def make_task_closed(model, request, queryset):
-    queryset.update(closed=True, status=TaskStatus.CLOSE)
+    queryset.update(closed=True, status=TaskStatus.CLOSE, change_id=current_change_id())
+    publish_task_events(queryset.model, [get_task_event(instance, 'changed') for instance in queryset])
 
 
 @admin.register(Pallet)
@@ -211,6 +211,13 @@ class StorageCellContentStateAdmin(admin.ModelAdmin):
     list_filter = ('status', ('creating_date', DateRangeFilter),)
 
 
+@admin.register(StorageCellOccupancy)
+class StorageCellOccupancyAdmin(admin.ModelAdmin):
+    list_display = ('placed_date', 'cell', 'pallet')
+    search_fields = ('cell__name', 'pallet__id', 'pallet__guid')
+    list_filter = (('placed_date', DateRangeFilter),)
+
+
 @admin.register(RepackingOperation)
 class RepackingOperationAdmin(admin.ModelAdmin):
     list_display = (
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from warehouse_management.warehouse_services import rebuild_cell_occupancy
+
+
+class Command(BaseCommand):
+    help = 'Заполняет текущее размещение паллет в ячейках по журналу состояний ячеек'
+
+    def handle(self, *args, **options):
+        count = rebuild_cell_occupancy()
+        self.stdout.write(self.style.SUCCESS(f'Размещено паллет в ячейках: {count}'))
@@ -0,0 +1,27 @@
+# Generated by Django 4.0.4 on 2026-10-18 18:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse_management', '0077_merge_20231129_1038'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorageCellOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('placed_date', models.DateTimeField(verbose_name='Дата размещения')),
+                ('cell', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupancy', to='warehouse_management.storagecell', verbose_name='Ячейка')),
+                ('pallet', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='cell_occupancy', to='warehouse_management.pallet', verbose_name='Паллета')),
+            ],
+            options={
+                'verbose_name': 'Текущее размещение паллет',
+                'verbose_name_plural': 'Текущее размещение паллет',
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.4 on 2026-10-18 18:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse_management', '0078_storagecelloccupancy'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='storagecell',
+            index=models.Index(fields=['storage_area', 'rack_number', 'position'], name='storagecell_placement_index'),
+        ),
+    ]
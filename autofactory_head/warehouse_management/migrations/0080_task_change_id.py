@@ -0,0 +1,168 @@
+# Generated by Django 4.0.4 on 2026-10-18 19:18
+
+from django.db import migrations, models
+import tasks.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse_management', '0079_storagecell_placement_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='acceptanceoperation',
+            name='change_id',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False, verbose_name='Идентификатор изменения'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='arrivalatstockoperation',
+            name='change_id',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False, verbose_name='Идентификатор изменения'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='cancelshipmentoperation',
+            name='change_id',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False, verbose_name='Идентификатор изменения'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='inventoryaddresswarehouseoperation',
+            name='change_id',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False, verbose_name='Идентификатор изменения'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='inventoryoperation',
+            name='change_id',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False, verbose_name='Идентификатор изменения'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='movementbetweencellsoperation',
+            name='change_id',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False, verbose_name='Идентификатор изменения'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='movementshipmentoperation',
+            name='change_id',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False, verbose_name='Идентификатор изменения'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='orderoperation',
+            name='change_id',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False, verbose_name='Идентификатор изменения'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='palletcollectoperation',
+            name='change_id',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False, verbose_name='Идентификатор изменения'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='placementtocellsoperation',
+            name='change_id',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False, verbose_name='Идентификатор изменения'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='repackingoperation',
+            name='change_id',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False, verbose_name='Идентификатор изменения'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='selectionoperation',
+            name='change_id',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False, verbose_name='Идентификатор изменения'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='shipmentoperation',
+            name='change_id',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False, verbose_name='Идентификатор изменения'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='writeoffoperation',
+            name='change_id',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False, verbose_name='Идентификатор изменения'),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='acceptanceoperation',
+            name='change_id',
+            field=models.BigIntegerField(db_index=True, default=tasks.models.current_change_id, editable=False, verbose_name='Идентификатор изменения'),
+        ),
+        migrations.AlterField(
+            model_name='arrivalatstockoperation',
+            name='change_id',
+            field=models.BigIntegerField(db_index=True, default=tasks.models.current_change_id, editable=False, verbose_name='Идентификатор изменения'),
+        ),
+        migrations.AlterField(
+            model_name='cancelshipmentoperation',
+            name='change_id',
+            field=models.BigIntegerField(db_index=True, default=tasks.models.current_change_id, editable=False, verbose_name='Идентификатор изменения'),
+        ),
+        migrations.AlterField(
+            model_name='inventoryaddresswarehouseoperation',
+            name='change_id',
+            field=models.BigIntegerField(db_index=True, default=tasks.models.current_change_id, editable=False, verbose_name='Идентификатор изменения'),
+        ),
+        migrations.AlterField(
+            model_name='inventoryoperation',
+            name='change_id',
+            field=models.BigIntegerField(db_index=True, default=tasks.models.current_change_id, editable=False, verbose_name='Идентификатор изменения'),
+        ),
+        migrations.AlterField(
+            model_name='movementbetweencellsoperation',
+            name='change_id',
+            field=models.BigIntegerField(db_index=True, default=tasks.models.current_change_id, editable=False, verbose_name='Идентификатор изменения'),
+        ),
+        migrations.AlterField(
+            model_name='movementshipmentoperation',
+            name='change_id',
+            field=models.BigIntegerField(db_index=True, default=tasks.models.current_change_id, editable=False, verbose_name='Идентификатор изменения'),
+        ),
+        migrations.AlterField(
+            model_name='orderoperation',
+            name='change_id',
+            field=models.BigIntegerField(db_index=True, default=tasks.models.current_change_id, editable=False, verbose_name='Идентификатор изменения'),
+        ),
+        migrations.AlterField(
+            model_name='palletcollectoperation',
+            name='change_id',
+            field=models.BigIntegerField(db_index=True, default=tasks.models.current_change_id, editable=False, verbose_name='Идентификатор изменения'),
+        ),
+        migrations.AlterField(
+            model_name='placementtocellsoperation',
+            name='change_id',
+            field=models.BigIntegerField(db_index=True, default=tasks.models.current_change_id, editable=False, verbose_name='Идентификатор изменения'),
+        ),
+        migrations.AlterField(
+            model_name='repackingoperation',
+            name='change_id',
+            field=models.BigIntegerField(db_index=True, default=tasks.models.current_change_id, editable=False, verbose_name='Идентификатор изменения'),
+        ),
+        migrations.AlterField(
+            model_name='selectionoperation',
+            name='change_id',
+            field=models.BigIntegerField(db_index=True, default=tasks.models.current_change_id, editable=False, verbose_name='Идентификатор изменения'),
+        ),
+        migrations.AlterField(
+            model_name='shipmentoperation',
+            name='change_id',
+            field=models.BigIntegerField(db_index=True, default=tasks.models.current_change_id, editable=False, verbose_name='Идентификатор изменения'),
+        ),
+        migrations.AlterField(
+            model_name='writeoffoperation',
+            name='change_id',
+            field=models.BigIntegerField(db_index=True, default=tasks.models.current_change_id, editable=False, verbose_name='Идентификатор изменения'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.4 on 2026-10-18 19:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse_management', '0080_task_change_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pallet',
+            index=models.Index(fields=['creation_date', 'guid'], name='pallet_keyset_index'),
+        ),
+    ]
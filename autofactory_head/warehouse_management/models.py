@@ -1,9 +1,9 @@
 import datetime
 import uuid
-from typing import List, Optional
+from typing import Iterable, List, Optional
 
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
 from pydantic.dataclasses import dataclass
 
 from catalogs.models import Product, Storage, Direction, Client, BaseExternalModel
@@ -117,6 +117,7 @@ class StorageCell(BaseExternalModel):
     class Meta:
         verbose_name = 'Складская ячейка'
         verbose_name_plural = 'Складские ячейки'
+        indexes = [models.Index(fields=['storage_area', 'rack_number', 'position'], name='storagecell_placement_index')]
 
 
 class Pallet(models.Model):
@@ -153,6 +154,9 @@ class Pallet(models.Model):
     class Meta:
         verbose_name = 'Паллета'
         verbose_name_plural = 'Паллеты'
+        indexes = [
+            models.Index(fields=['creation_date', 'guid'], name='pallet_keyset_index'),
+        ]
 
     def __str__(self):
         if not self.name:
@@ -196,13 +200,33 @@ class ManyToManyOperationMixin(models.Model):
     class Meta:
         abstract = True
 
-    def fill_properties(self, operation: OperationBaseOperation) -> None:
+    def set_operation_properties(self, operation: OperationBaseOperation) -> None:
+        """ Заполняет свойства операции без записи в базу """
         self.operation = operation.guid
         self.type_operation = operation.type_task
         self.number_operation = operation.number
         self.external_source = None if operation.external_source is None else operation.external_source.name
+
+    def fill_properties(self, operation: OperationBaseOperation) -> None:
+        self.set_operation_properties(operation)
         self.save()
 
+    @classmethod
+    def from_operation(cls, operation: OperationBaseOperation, **kwargs) -> 'ManyToManyOperationMixin':
+        """ Возвращает новую (не записанную) строку, заполненную свойствами операции """
+        row = cls(**kwargs)
+        row.set_operation_properties(operation)
+        return row
+
+    @classmethod
+    def bulk_create_for_operation(cls, operation: OperationBaseOperation,
+                                  rows: Iterable['ManyToManyOperationMixin']) -> list['ManyToManyOperationMixin']:
+        """ Заполняет строки свойствами операции и записывает их одним запросом """
+        rows = list(rows)
+        for row in rows:
+            row.set_operation_properties(operation)
+        return cls.objects.bulk_create(rows)
+
 
 class OperationPallet(ManyToManyOperationMixin):
     pallet = models.ForeignKey(Pallet, on_delete=models.CASCADE, verbose_name='Паллета',
@@ -269,6 +293,38 @@ class StorageCellContentState(models.Model):
         verbose_name = 'Состояние складских ячеек'
         verbose_name_plural = 'Состояние складских ячеек'
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                StorageCellOccupancy.apply_state(self)
+
+
+class StorageCellOccupancy(models.Model):
+    """ Текущее размещение паллет в ячейках. Ведется по журналу StorageCellContentState """
+    pallet = models.OneToOneField(Pallet, verbose_name='Паллета', on_delete=models.CASCADE,
+                                  related_name='cell_occupancy')
+    cell = models.ForeignKey(StorageCell, verbose_name='Ячейка', on_delete=models.CASCADE,
+                             related_name='occupancy')
+    placed_date = models.DateTimeField('Дата размещения')
+
+    class Meta:
+        verbose_name = 'Текущее размещение паллет'
+        verbose_name_plural = 'Текущее размещение паллет'
+
+    def __str__(self):
+        return f'{self.cell} - {self.pallet}'
+
+    @classmethod
+    def apply_state(cls, state: StorageCellContentState) -> None:
+        """ Переносит запись журнала состояний в текущее размещение паллеты """
+        if state.status == StatusCellContent.PLACED:
+            cls.objects.update_or_create(pallet_id=state.pallet_id,
+                                         defaults={'cell_id': state.cell_id, 'placed_date': state.creating_date})
+        else:
+            cls.objects.filter(pallet_id=state.pallet_id).delete()
+
 
 class PlacementToCellsOperation(OperationBaseOperation):
     type_task = 'PLACEMENT_TO_CELLS'
@@ -1,6 +1,6 @@
 from datetime import datetime as dt
 
-from django.db import transaction
+from django.db import models, transaction
 from rest_framework import serializers
 from rest_framework.exceptions import APIException
 
@@ -14,7 +14,8 @@ from warehouse_management.models import (
     InventoryAddressWarehouseOperation, TypeCollect
 )
 from warehouse_management.warehouse_services import (
-    check_and_collect_orders, enrich_pallet_info, get_cell_state
+    check_and_collect_orders, enrich_pallet_info, get_cell_state, get_pallets_cells, get_pallets_sources,
+    get_operations_pallets, group_collect_pallets
 )
 
 
@@ -35,6 +36,7 @@ class OrderOperationWriteSerializer(serializers.ModelSerializer):
     class Meta:
         fields = ('name', 'external_key', 'number', 'date', 'client_presentation')
         model = ExternalSource
+        extra_kwargs = {'external_key': {'validators': []}}
 
 
 class SuitablePalletSerializer(serializers.Serializer):
@@ -130,6 +132,57 @@ class PalletWriteSerializer(serializers.Serializer):
     group = serializers.CharField(required=False, allow_null=True)
 
 
+class PalletReadListSerializer(serializers.ListSerializer):
+    """ Получает ячейки и источники всех паллет списка пакетными запросами и передает их дочернему сериализатору """
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        if isinstance(iterable, models.QuerySet):
+            iterable = iterable.select_related('product', 'production_shop')
+
+        pallets = list(iterable)
+        self.cells = get_pallets_cells(pallets)
+        self.sources = get_pallets_sources(pallets)
+
+        return [self.child.to_representation(item) for item in pallets]
+
+
+class OperationReadListSerializer(serializers.ListSerializer):
+    """ Загружает внешние источники и пользователей операций списка одним запросом с операциями """
+    related_fields = ('external_source', 'user')
+
+    def get_operations(self, data) -> list:
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        if isinstance(iterable, models.QuerySet):
+            iterable = iterable.select_related(*self.related_fields)
+        return list(iterable)
+
+    def to_representation(self, data):
+        return [self.child.to_representation(item) for item in self.get_operations(data)]
+
+
+class OperationPalletsListSerializer(OperationReadListSerializer):
+    """ Получает паллеты всех операций списка одним запросом. Отбор паллет задает дочерний сериализатор """
+
+    def to_representation(self, data):
+        operations = self.get_operations(data)
+        self.operations_pallets = get_operations_pallets(operations, self.child.get_pallets_queryset())
+        return [self.child.to_representation(item) for item in operations]
+
+
+class OperationPalletsMixin:
+    """ Паллеты операции из пакетной загрузки списка либо отдельным запросом для одной операции """
+
+    @staticmethod
+    def get_pallets_queryset():
+        return Pallet.objects.all()
+
+    def get_operation_pallets(self, obj) -> list[Pallet]:
+        if isinstance(self.parent, OperationPalletsListSerializer):
+            return self.parent.operations_pallets.get(obj.guid, [])
+        return get_operations_pallets([obj], self.get_pallets_queryset())[obj.guid]
+
+
 class PalletReadSerializer(serializers.Serializer):
     id = serializers.CharField()
     product_name = serializers.SlugRelatedField(many=False, read_only=True, slug_field='name', source='product')
@@ -149,19 +202,28 @@ class PalletReadSerializer(serializers.Serializer):
     name = serializers.CharField(required=False)
     consignee = serializers.CharField(required=False)
 
-    @staticmethod
-    def get_sources(obj):
-        sources = PalletSource.objects.filter(pallet=obj)
+    class Meta:
+        list_serializer_class = PalletReadListSerializer
+
+    def get_sources(self, obj):
+        if isinstance(self.parent, PalletReadListSerializer):
+            sources = self.parent.sources.get(obj.pk, [])
+        else:
+            sources = PalletSource.objects.filter(pallet=obj)
         serializer = PalletSourceReadSerializer(sources, many=True)
         return serializer.data
 
-    @staticmethod
-    def get_cell(obj):
-        change_state_row = get_cell_state(pallet=obj)
-        if change_state_row is None:
+    def get_cell(self, obj):
+        if isinstance(self.parent, PalletReadListSerializer):
+            cell = self.parent.cells.get(obj.pk)
+        else:
+            change_state_row = get_cell_state(pallet=obj)
+            cell = None if change_state_row is None else change_state_row.cell
+
+        if cell is None:
             return None
 
-        serializer = StorageCellsSerializer(change_state_row.cell)
+        serializer = StorageCellsSerializer(cell)
         return serializer.data
 
 
@@ -250,7 +312,7 @@ class PalletShortSerializer(serializers.ModelSerializer):
         return None
 
 
-class PalletCollectOperationReadSerializer(serializers.ModelSerializer):
+class PalletCollectOperationReadSerializer(OperationPalletsMixin, serializers.ModelSerializer):
     pallets_semi = serializers.SerializerMethodField()
     pallets_complete = serializers.SerializerMethodField()
     pallets_not_marked = serializers.SerializerMethodField()
@@ -258,27 +320,24 @@ class PalletCollectOperationReadSerializer(serializers.ModelSerializer):
     class Meta:
         model = PalletCollectOperation
         fields = ('guid', 'pallets_semi', 'pallets_complete', 'pallets_not_marked')
+        list_serializer_class = OperationPalletsListSerializer
 
-    @staticmethod
-    def get_pallets_not_marked(obj):
-        return PalletCollectOperationReadSerializer.get_pallets_data({'operation': obj.guid,
-                                                                      'pallet__product__not_marked': True})
+    def get_pallets_not_marked(self, obj):
+        return self.get_pallets_data(obj, 'not_marked')
 
-    @staticmethod
-    def get_pallets_complete(obj):
-        return PalletCollectOperationReadSerializer.get_pallets_data({'operation': obj.guid,
-                                                                      'pallet__product__semi_product': False,
-                                                                      'pallet__product__not_marked': False})
+    def get_pallets_complete(self, obj):
+        return self.get_pallets_data(obj, 'complete')
 
-    @staticmethod
-    def get_pallets_semi(obj):
-        return PalletCollectOperationReadSerializer.get_pallets_data({'operation': obj.guid,
-                                                                      'pallet__product__semi_product': True})
+    def get_pallets_semi(self, obj):
+        return self.get_pallets_data(obj, 'semi')
 
     @staticmethod
-    def get_pallets_data(product_filter):
-        pallets_ids = OperationPallet.objects.filter(**product_filter).values_list('pallet', flat=True)
-        pallets = Pallet.objects.filter(guid__in=pallets_ids).exclude(status=PalletStatus.ARCHIVED)
+    def get_pallets_queryset():
+        return (Pallet.objects.exclude(status=PalletStatus.ARCHIVED)
+                .select_related('product', 'production_shop', 'shift__line__department'))
+
+    def get_pallets_data(self, obj, group):
+        pallets = group_collect_pallets(self.get_operation_pallets(obj))[group]
         serializer = PalletShortSerializer(pallets, many=True)
         return serializer.data
 
@@ -535,6 +594,15 @@ class InventoryOperationReadSerializer(serializers.ModelSerializer):
         return serializer.data
 
 
+class SelectionOperationReadListSerializer(OperationReadListSerializer):
+    """ Получает ячейки и паллеты всех операций отбора списка пакетными запросами """
+
+    def to_representation(self, data):
+        operations = self.get_operations(data)
+        self.storage_areas = get_selection_storage_areas(operations)
+        return [self.child.to_representation(item) for item in operations]
+
+
 class SelectionOperationReadSerializer(serializers.ModelSerializer):
     date = serializers.SerializerMethodField()
     number = serializers.SerializerMethodField()
@@ -546,6 +614,7 @@ class SelectionOperationReadSerializer(serializers.ModelSerializer):
     class Meta:
         model = SelectionOperation
         fields = ('status', 'date', 'number', 'guid', 'external_key', 'user', 'storage_areas', 'modified')
+        list_serializer_class = SelectionOperationReadListSerializer
 
     @staticmethod
     def get_number(obj):
@@ -560,25 +629,37 @@ class SelectionOperationReadSerializer(serializers.ModelSerializer):
             date = obj.date.strftime('%d.%m.%Y')
         return date
 
-    @staticmethod
-    def get_storage_areas(obj):
-        operation_cells = OperationCell.objects.filter(operation=obj.guid).order_by('cell_source__rack_number',
-                                                                                    'cell_source__position')
-        storage_areas = {key: [] for key in
-                         list(
-                             operation_cells.values_list('cell_destination__storage_area__name', flat=True).distinct())}
-
-        for row in operation_cells:
-            area = storage_areas.get(row.cell_destination.storage_area.name)
-            cell_source = StorageCellsSerializer(row.cell_source)
-            cell_destination = StorageCellsSerializer(row.cell_destination)
-            pallet = PalletReadSerializer(row.pallet)
-            pallet_in_area = {'cell_source': cell_source.data,
-                              'cell_destination': cell_destination.data,
-                              'pallet': pallet.data}
-            area.append(pallet_in_area)
-
-        return [{'name': key, 'pallets': value} for key, value in storage_areas.items()]
+    def get_storage_areas(self, obj):
+        if isinstance(self.parent, SelectionOperationReadListSerializer):
+            return self.parent.storage_areas.get(obj.guid, [])
+        return get_selection_storage_areas([obj]).get(obj.guid, [])
+
+
+def get_selection_storage_areas(operations: list[SelectionOperation]) -> dict[str, list]:
+    """ Ячейки и паллеты операций отбора, сгруппированные по областям хранения ячеек назначения """
+    operation_cells = list(
+        OperationCell.objects.filter(operation__in=[operation.guid for operation in operations])
+        .order_by('cell_source__rack_number', 'cell_source__position')
+        .select_related('cell_source__storage_area', 'cell_destination__storage_area', 'pallet__product',
+                        'pallet__production_shop')
+    )
+    pallets = iter(PalletReadSerializer([row.pallet for row in operation_cells if row.pallet is not None],
+                                        many=True).data)
+
+    storage_areas = {operation.guid: {} for operation in operations}
+    for row in operation_cells:
+        # у строки без паллеты данные паллеты пустые
+        pallet = PalletReadSerializer(None).data if row.pallet is None else next(pallets)
+        area = storage_areas[row.operation].setdefault(row.cell_destination.storage_area.name, [])
+        cell_source = StorageCellsSerializer(row.cell_source)
+        cell_destination = StorageCellsSerializer(row.cell_destination)
+        pallet_in_area = {'cell_source': cell_source.data,
+                          'cell_destination': cell_destination.data,
+                          'pallet': pallet}
+        area.append(pallet_in_area)
+
+    return {guid: [{'name': key, 'pallets': value} for key, value in areas.items()]
+            for guid, areas in storage_areas.items()}
 
 
 class SelectionOperationWriteSerializer(serializers.ModelSerializer):
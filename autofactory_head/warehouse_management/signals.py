@@ -1,4 +1,4 @@
-from django.db.models.signals import pre_delete
+from django.db.models.signals import pre_delete, post_delete
 from django.dispatch import receiver
 
 from factory_core.signals import operation_pre_close
@@ -6,7 +6,7 @@ from .models import (
     InventoryOperation, OperationCell, StorageCellContentState, StatusCellContent, ShipmentOperation,
     PalletCollectOperation, OperationPallet, SelectionOperation, WriteOffOperation, MovementShipmentOperation
 )
-from .warehouse_services import movement_shipment_close
+from .warehouse_services import movement_shipment_close, rebuild_cell_occupancy
 
 
 def remove_cell_and_state(operation_guid):
@@ -22,6 +22,11 @@ def remove_cell_and_state(operation_guid):
     cells.delete()
 
 
+@receiver(post_delete, sender=StorageCellContentState)
+def post_delete_cell_state(sender, **kwargs):
+    rebuild_cell_occupancy(pallets=[kwargs['instance'].pallet_id])
+
+
 @receiver(pre_delete, sender=InventoryOperation)
 def pre_delete_inventory(sender, **kwargs):
     remove_cell_and_state(kwargs['instance'].guid)
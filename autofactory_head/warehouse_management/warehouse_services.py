@@ -1,8 +1,10 @@
+import uuid
+from collections import defaultdict
 from typing import Iterable
 
 from django.contrib.auth import get_user_model
-from django.db import transaction
-from django.db.models import Q, Sum
+from django.db import connection, models, transaction
+from django.db.models import Exists, F, OuterRef, Q, QuerySet, Sum
 from dateutil import parser
 from rest_framework.exceptions import APIException
 
@@ -15,7 +17,7 @@ from warehouse_management.models import (
     PlacementToCellsOperation, OperationCell, MovementBetweenCellsOperation, ShipmentOperation, OrderOperation,
     PalletContent, PalletProduct, PalletSource, ArrivalAtStockOperation, InventoryOperation, PalletStatus, TypeCollect,
     SelectionOperation, StorageCell, StorageCellContentState, StatusCellContent, RepackingOperation, SuitablePallets,
-    MovementShipmentOperation
+    MovementShipmentOperation, StorageCellOccupancy
 )
 
 User = get_user_model()
@@ -65,7 +67,7 @@ def remove_boxes_from_pallet(pallet: Pallet, count: int, weight: int | None = No
     if pallet.content_count == 0:
         pallet.status = PalletStatus.ARCHIVED
         cell_state = get_cell_state(pallet=pallet)
-        if cell_state is not None and cell_state.status == StatusCellContent.PLACED:
+        if cell_state is not None:
             StorageCellContentState.objects.create(cell=cell_state.cell, pallet=pallet,
                                                    status=StatusCellContent.REMOVED)
 
@@ -103,8 +105,7 @@ def create_inventory_with_placement_operation(serializer_data: dict[str: str], u
     pallet.save()
 
     cell = StorageCell.objects.get(external_key=serializer_data['cell'])
-    operation_pallets = OperationCell.objects.create(pallet=pallet, cell_source=cell)
-    operation_pallets.fill_properties(instance)
+    OperationCell.from_operation(instance, pallet=pallet, cell_source=cell).save()
 
     return instance.guid
 
@@ -113,9 +114,13 @@ def create_inventory_with_placement_operation(serializer_data: dict[str: str], u
 def create_shipment_operation(serializer_data: Iterable[dict[str: str]], user: User) -> Iterable[str]:
     """ Создает операцию отгрузки со склада"""
     result = []
+    serializer_data = list(serializer_data)
+    external_sources, tasks = resolve_external_sources(
+        (element['external_source'] for element in serializer_data), ShipmentOperation
+    )
     for element in serializer_data:
-        external_source = get_or_create_external_source(element)
-        task = ShipmentOperation.objects.filter(external_source=external_source).first()
+        key = element['external_source']['external_key']
+        task = tasks.get(key)
         if task is not None:
             result.append(task.guid)
             continue
@@ -124,7 +129,8 @@ def create_shipment_operation(serializer_data: Iterable[dict[str: str]], user: U
         cells = element.pop('cells')
         element.pop('external_source')
 
-        operation = ShipmentOperation.objects.create(external_source=external_source, **element)
+        operation = ShipmentOperation.objects.create(external_source=external_sources[key], **element)
+        tasks[key] = operation
 
         _create_child_task_shipment(pallets, user, operation, TypeCollect.SHIPMENT)
         fill_operation_cells(operation, cells)
@@ -136,13 +142,18 @@ def create_shipment_operation(serializer_data: Iterable[dict[str: str]], user: U
 def create_selection_operation(serializer_data: Iterable[dict[str: str]], user: User) -> Iterable[str]:
     """ Создает операцию отбора со склада"""
     result = []
+    serializer_data = list(serializer_data)
+    external_sources, tasks = resolve_external_sources(
+        (element['external_source'] for element in serializer_data), SelectionOperation
+    )
     for element in serializer_data:
-        external_source = get_or_create_external_source(element)
-        task = SelectionOperation.objects.filter(external_source=external_source).first()
+        key = element['external_source']['external_key']
+        task = tasks.get(key)
         if task is not None:
             result.append(task.guid)
             continue
-        operation = SelectionOperation.objects.create(external_source=external_source)
+        operation = SelectionOperation.objects.create(external_source=external_sources[key])
+        tasks[key] = operation
 
         fill_operation_cells(operation, element['cells'])
         result.append(operation.guid)
@@ -153,24 +164,35 @@ def create_selection_operation(serializer_data: Iterable[dict[str: str]], user:
 def create_repacking_operation(serializer_data: Iterable[dict[str: str]], user: User) -> Iterable[str]:
     """ Создает операцию переупаковки"""
     result = []
+    serializer_data = list(serializer_data)
+    external_sources, tasks = resolve_external_sources(
+        (row['external_source'] for row in serializer_data), RepackingOperation
+    )
     for row in serializer_data:
-        external_source = get_or_create_external_source(row)
-        task = RepackingOperation.objects.filter(external_source=external_source).first()
+        key = row['external_source']['external_key']
+        task = tasks.get(key)
         if task is not None:
             result.append(task.guid)
             continue
-        operation = RepackingOperation.objects.create(external_source=external_source)
+        operation = RepackingOperation.objects.create(external_source=external_sources[key])
+        tasks[key] = operation
         result.append(operation.guid)
+
+        dependent_pallets = first_rows_by_keys(
+            Pallet.objects.filter(id__in=[pallet_data['pallet'] for pallet_data in row['pallets']]), 'id')
+        pallets = []
+        operation_pallets = []
         for pallet_data in row['pallets']:
-            dependent_pallet = Pallet.objects.filter(id=pallet_data['pallet']).first()
+            dependent_pallet = dependent_pallets.get(('id', pallet_data['pallet']))
             if not dependent_pallet:
                 raise APIException(f'Не найдена зависимая паллета {pallet_data["pallet"]}')
-            pallet = Pallet.objects.create(product=dependent_pallet.product,
-                                           batch_number=dependent_pallet.batch_number,
-                                           production_date=dependent_pallet.production_date)
-            operation_pallets = OperationPallet.objects.create(pallet=pallet, dependent_pallet=dependent_pallet,
-                                                               count=pallet_data['count'])
-            operation_pallets.fill_properties(operation)
+            pallet = Pallet(product_id=dependent_pallet.product_id, batch_number=dependent_pallet.batch_number,
+                            production_date=dependent_pallet.production_date)
+            pallets.append(pallet)
+            operation_pallets.append(OperationPallet(pallet=pallet, dependent_pallet=dependent_pallet,
+                                                     count=pallet_data['count']))
+        Pallet.objects.bulk_create(pallets)
+        OperationPallet.bulk_create_for_operation(operation, operation_pallets)
     return result
 
 
@@ -232,13 +254,17 @@ def create_movement_cell_operation(serializer_data: dict[str: str], user: User)
 def create_placement_operation(serializer_data: Iterable[dict[str: str]], user: User) -> Iterable[str]:
     """ Создает операцию размещение в ячейках"""
     result = []
+    serializer_data = list(serializer_data)
+    external_sources, tasks = resolve_external_sources(
+        (element['external_source'] for element in serializer_data), PlacementToCellsOperation
+    )
     for element in serializer_data:
-        external_source = get_or_create_external_source(element)
-        task = PlacementToCellsOperation.objects.filter(external_source=external_source).first()
-        if task is not None:
+        key = element['external_source']['external_key']
+        if key in tasks:
             continue
         storage = Storage.objects.filter(external_key=element['storage']).first()
-        operation = PlacementToCellsOperation.objects.create(storage=storage, external_source=external_source)
+        operation = PlacementToCellsOperation.objects.create(storage=storage, external_source=external_sources[key])
+        tasks[key] = operation
         fill_operation_cells(operation, element['cells'])
 
         result.append(operation.guid)
@@ -266,19 +292,23 @@ def create_acceptance_operation(serializer_data: Iterable[dict[str: str]], user:
     """ Создает операцию перемещения. Возвращает идентификаторы внешнего источника """
 
     result = []
+    serializer_data = list(serializer_data)
+    external_sources, operations = resolve_external_sources(
+        (element['external_source'] for element in serializer_data), AcceptanceOperation
+    )
     for element in serializer_data:
-        external_source = get_or_create_external_source(element)
-        result.append(external_source.external_key)
-        operation = AcceptanceOperation.objects.filter(external_source=external_source).first()
-        if operation is not None:
+        key = element['external_source']['external_key']
+        result.append(key)
+        if key in operations:
             continue
 
         storage = Storage.objects.filter(external_key=element['storage']).first()
-        operation = AcceptanceOperation.objects.create(external_source=external_source, storage=storage,
+        operation = AcceptanceOperation.objects.create(external_source=external_sources[key], storage=storage,
                                                        batch_number=element['batch_number'],
                                                        production_date=parser.parse(element['production_date']))
         fill_operation_pallets(operation, element['pallets'])
         fill_operation_products(operation, element['products'])
+        operations[key] = operation
 
     return result
 
@@ -288,15 +318,19 @@ def create_arrival_operation(serializer_data: Iterable[dict[str: str]], user: Us
     """ Создает операцию приемки товаров. Возвращает идентификаторы внешнего источника """
 
     result = []
+    serializer_data = list(serializer_data)
+    external_sources, operations = resolve_external_sources(
+        (element['external_source'] for element in serializer_data), ArrivalAtStockOperation
+    )
     for element in serializer_data:
-        external_source = get_or_create_external_source(element)
-        result.append(external_source.external_key)
-        operation = ArrivalAtStockOperation.objects.filter(external_source=external_source).first()
-        if operation is not None:
+        key = element['external_source']['external_key']
+        result.append(key)
+        if key in operations:
             continue
 
         storage = Storage.objects.filter(external_key=element['storage']).first()
-        operation = ArrivalAtStockOperation.objects.create(external_source=external_source, storage=storage)
+        operation = ArrivalAtStockOperation.objects.create(external_source=external_sources[key], storage=storage)
+        operations[key] = operation
         fill_operation_products(operation, element['products'])
 
     return result
@@ -307,74 +341,187 @@ def create_inventory_operation(serializer_data: Iterable[dict[str: str]], user:
     """ Создает операцию инвентаризации товаров. Возвращает идентификаторы внешнего источника """
 
     result = []
+    serializer_data = list(serializer_data)
+    external_sources, operations = resolve_external_sources(
+        (element['external_source'] for element in serializer_data), InventoryOperation
+    )
     for element in serializer_data:
-        external_source = get_or_create_external_source(element)
-        result.append(external_source.external_key)
-        operation = InventoryOperation.objects.filter(external_source=external_source).first()
-        if operation is not None:
+        key = element['external_source']['external_key']
+        result.append(key)
+        if key in operations:
             continue
 
-        operation = InventoryOperation.objects.create(external_source=external_source)
+        operation = InventoryOperation.objects.create(external_source=external_sources[key])
+        operations[key] = operation
         fill_operation_products(operation, element['products'])
 
     return result
 
 
+def _get_uuid(value) -> uuid.UUID | None:
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+
+def first_rows_by_keys(queryset: QuerySet, *fields: str) -> dict:
+    """ Возвращает строки выборки с наименьшим pk для каждого значения указанных полей (аналог .first()) """
+    result = {}
+    for row in queryset.order_by('pk'):
+        for field in fields:
+            value = getattr(row, field)
+            if value is not None:
+                result.setdefault((field, str(value)), row)
+    return result
+
+
+def _find_by_guid_or_key(rows: dict, value) -> models.Model | None:
+    """ Аналог выборки Q(guid=value) | Q(external_key=value) с .first() по результату first_rows_by_keys """
+    if value is None:
+        return None
+
+    guid = _get_uuid(value)
+    candidates = [rows.get(('external_key', str(value))), rows.get(('guid', str(guid)))]
+    candidates = [row for row in candidates if row is not None]
+    return min(candidates, key=lambda row: row.pk) if candidates else None
+
+
+class _PalletsIndex:
+    """ Паллеты пакета по ключам поиска (id, external_key). Учитывает паллеты базы и созданные в пакете
+    с позицией элемента, чтобы поиск возвращал то же, что .first() в момент обработки элемента """
+
+    def __init__(self, ids: set, external_keys: set):
+        self._candidates = defaultdict(list)
+        pallets = Pallet.objects.filter(Q(id__in=ids) | Q(external_key__in=external_keys)).select_related('product')
+        for pallet in pallets:
+            self.add(pallet, -1)
+
+    def add(self, pallet: Pallet, position: int) -> None:
+        for field in ('id', 'external_key'):
+            value = getattr(pallet, field)
+            if value is not None:
+                self._candidates[(field, value)].append((position, pallet))
+
+    def get(self, field: str, value: str, position: int) -> Pallet | None:
+        candidates = [pallet for pallet_position, pallet in self._candidates.get((field, value), ())
+                      if pallet_position <= position]
+        return min(candidates, key=lambda pallet: pallet.pk) if candidates else None
+
+
+def _get_or_create_orders(products: list[dict], user: User | None, task: Task | None) -> dict:
+    """ Находит либо создает заказы клиентов для строк товаров паллет пакетно.
+    Возвращает заказы по внешнему ключу """
+
+    orders_data = {}
+    for product in products:
+        order_data = product['order_external_source']
+        client_presentation = order_data.pop('client_presentation')
+        orders_data.setdefault(order_data['external_key'], (order_data, client_presentation))
+
+    if not orders_data:
+        return {}
+
+    external_sources, orders = resolve_external_sources(
+        (order_data for order_data, _ in orders_data.values()), OrderOperation
+    )
+
+    for key, (_, client_presentation) in orders_data.items():
+        if key not in orders:
+            orders[key] = OrderOperation.objects.create(user=user, client_presentation=client_presentation,
+                                                        external_source=external_sources[key], parent_task=task)
+
+    return orders
+
+
 @transaction.atomic
 def create_pallets(
         serializer_data: Iterable[dict[str: str]],
         user: User | None = None,
         task: Task | None = None
 ) -> list[Pallet]:
-    """ Создает паллету и наполняет ее кодами агрегации"""
-    result = []
+    """ Создает паллеты и наполняет их кодами агрегации.
+    Все ссылки пакета разрешаются заранее запросами IN, новые строки записываются пакетно """
+    serializer_data = list(serializer_data)
     related_tables = ('codes', 'products')
+    class_keys = set(dir(Pallet))
 
+    search_values = {'id': set(), 'external_key': set()}
+    products_keys, cells_keys, shops_keys, shifts_keys, codes = set(), set(), set(), set(), set()
     for element in serializer_data:
+        search_field = 'id' if element.get('id') is not None else 'external_key'
+        if element.get(search_field) is not None:
+            search_values[search_field].add(element[search_field])
+        if element.get('product'):
+            products_keys.add(element['product'])
+        if element.get('cell'):
+            cells_keys.add(element['cell'])
+        if element.get('production_shop'):
+            shops_keys.add(element['production_shop'])
+        if element.get('shift') is not None:
+            shifts_keys.add(element['shift'])
+        for product in element.get('products') or ():
+            for suitable_pallet_row in product.get('suitable_pallets') or ():
+                search_values['id'].add(suitable_pallet_row['id'])
+        codes.update(element.get('codes') or ())
+
+    pallets_index = _PalletsIndex(search_values['id'], search_values['external_key'])
+
+    products_guids = {guid for guid in map(_get_uuid, products_keys) if guid is not None}
+    products = first_rows_by_keys(
+        Product.objects.filter(Q(guid__in=products_guids) | Q(external_key__in=products_keys)), 'guid', 'external_key')
+    units = {}
+    for unit in Unit.objects.filter(is_default=True, product__in=[row.pk for row in products.values()]).order_by('pk'):
+        units.setdefault(unit.product_id, unit)
+
+    cells_guids = {guid for guid in map(_get_uuid, cells_keys) if guid is not None}
+    cells = {cell.guid: cell for cell in StorageCell.objects.filter(guid__in=cells_guids)}
+
+    shops_guids = {guid for guid in map(_get_uuid, shops_keys) if guid is not None}
+    shops = first_rows_by_keys(
+        Storage.objects.filter(Q(guid__in=shops_guids) | Q(external_key__in=shops_keys)), 'guid', 'external_key')
+
+    shifts_guids = {guid for guid in map(_get_uuid, shifts_keys) if guid is not None}
+    shifts = {str(shift.pk): shift for shift in Shift.objects.filter(pk__in=shifts_guids)}
+
+    result = []
+    new_pallets = []
+    changed_pallets = {}
+    filled_pallets = []
+    for position, element in enumerate(serializer_data):
         search_field = 'id' if element.get('id') is not None else 'external_key'
         search_value = element.get(search_field)
         pallet = None
 
         if search_value is not None:
-            pallet_filter = {search_field: search_value}
-            pallet = Pallet.objects.filter(**pallet_filter).first()
+            pallet = pallets_index.get(search_field, search_value, position - 1)
 
         if pallet and pallet.product and pallet.product.variable_pallet_weight and element.get('weight'):
             pallet.weight = element['weight']
-            pallet.save()
+            if not pallet._state.adding:
+                changed_pallets[pallet.pk] = pallet
 
         if not pallet:
-            if not element.get('product'):
-                product = None
-            else:
-                product = element['product']
-            element['product'] = Product.objects.filter(Q(guid=product) | Q(external_key=product)).first()
+            element['product'] = _find_by_guid_or_key(products, element.get('product') or None)
 
             if element['product'] and not element['product'].variable_pallet_weight:
-                unit = Unit.objects.filter(is_default=True, product=element['product']).first()
+                unit = units.get(element['product'].pk)
 
                 if unit and element.get('content_count'):
                     element['weight'] = element['content_count'] * unit.weight
 
-            if not element.get('cell'):
-                cell = None
-            else:
-                cell = element['cell']
-            element['cell'] = StorageCell.objects.filter(guid=cell).first()
+            cell_guid = StorageCell._meta.get_field('guid').to_python(element['cell']) if element.get('cell') else None
+            element['cell'] = cells.get(cell_guid)
 
-            if not element.get('production_shop'):
-                production_shop = None
-            else:
-                production_shop = element['production_shop']
-            element['production_shop'] = Storage.objects.filter(
-                Q(guid=production_shop) | Q(external_key=production_shop)
-            ).first()
+            element['production_shop'] = _find_by_guid_or_key(shops, element.get('production_shop') or None)
 
             if element.get('code_offline') is not None:
                 element['marking_group'] = element['code_offline']
 
             if element.get('shift') is not None:
-                shift = Shift.objects.filter(pk=element.get('shift')).first()
+                shift = shifts.get(str(_get_uuid(element['shift'])))
+                if shift is None:
+                    raise APIException(f'Не найдена смена {element["shift"]}')
                 element['shift'] = shift
                 element['marking_group'] = shift.guid
 
@@ -382,112 +529,229 @@ def create_pallets(
                 element['initial_count'] = element['content_count']
 
             serializer_keys = set(element.keys())
-            class_keys = set(dir(Pallet))
             [serializer_keys.discard(field) for field in related_tables]
             fields = {key: element[key] for key in (class_keys & serializer_keys)}
-            pallet = Pallet.objects.create(**fields, collector=user)
-
-        if element.get('products') is not None:
-            products_count = PalletProduct.objects.filter(pallet=pallet).count()
-            if not products_count:
-                suitable_pallets = None
-                for product in element['products']:
-                    product['pallet'] = pallet
-                    product['product'] = Product.objects.filter(external_key=product['product']).first()
-
-                    if product.get('order_external_source') is not None:
-                        order = create_order_operation(product, user, task)
-                        product.pop('order_external_source')
-                        product['order'] = order
-
-                    if product.get('suitable_pallets') is not None:
-                        suitable_pallets = product.pop('suitable_pallets')
-
-                    pallet_product = PalletProduct.objects.create(**product)
-                    if suitable_pallets is not None:
-                        for suitable_pallet_row in suitable_pallets:
-                            pallet_id = suitable_pallet_row.pop('id')
-                            suitable_pallet = Pallet.objects.filter(id=pallet_id).first()
-                            if suitable_pallet is None:
-                                raise APIException(f'Не найдена паллета {pallet_id} в блоке построчной выгрузке')
-                            SuitablePallets.objects.create(pallet_product=pallet_product, pallet=suitable_pallet,
-                                                           **suitable_pallet_row)
-
-        if element.get('codes') is not None:
-            for code in element['codes']:
-                aggregation_code = PalletContent.objects.filter(aggregation_code=code).first()
-                if aggregation_code is not None:
-                    continue
-                PalletContent.objects.create(pallet=pallet, aggregation_code=aggregation_code, product=pallet.product)
+            pallet = Pallet(**fields, collector=user)
+            pallets_index.add(pallet, position)
+            new_pallets.append(pallet)
 
+        filled_pallets.append((position, element, pallet))
         result.append(pallet)
 
+    Pallet.objects.bulk_create(new_pallets)
+    Pallet.objects.bulk_update(changed_pallets.values(), ['weight'])
+
+    _fill_pallets_content(filled_pallets, pallets_index, codes, user, task)
+
     return result
 
 
+def _fill_pallets_content(filled_pallets: list[tuple[int, dict, Pallet]], pallets_index: _PalletsIndex,
+                          codes: set, user: User | None, task: Task | None) -> None:
+    """ Пакетно создает товары, подходящие паллеты и коды агрегации созданных паллет """
+
+    pallets_with_products = set(
+        PalletProduct.objects.filter(
+            pallet__in=[pallet.pk for _, element, pallet in filled_pallets if element.get('products') is not None]
+        ).values_list('pallet', flat=True).distinct()
+    )
+    pallets_products = []
+    for position, element, pallet in filled_pallets:
+        if element.get('products') is None or pallet.pk in pallets_with_products:
+            continue
+        for product in element['products']:
+            pallets_products.append((position, pallet, product))
+        if element['products']:
+            pallets_with_products.add(pallet.pk)
+
+    products = first_rows_by_keys(
+        Product.objects.filter(external_key__in={str(product['product']) for _, _, product in pallets_products}),
+        'external_key'
+    )
+    orders = _get_or_create_orders(
+        [product for _, _, product in pallets_products if product.get('order_external_source') is not None], user,
+        task
+    )
+
+    new_products = []
+    new_suitable_pallets = []
+    for position, pallet, product in pallets_products:
+        product['pallet'] = pallet
+        product['product'] = products.get(('external_key', str(product['product'])))
+
+        if product.get('order_external_source') is not None:
+            order_external_source = product.pop('order_external_source')
+            product['order'] = orders[order_external_source['external_key']]
+
+        suitable_pallets = product.pop('suitable_pallets', None)
+
+        pallet_product = PalletProduct(**product)
+        new_products.append(pallet_product)
+        for suitable_pallet_row in suitable_pallets or ():
+            pallet_id = suitable_pallet_row.pop('id')
+            suitable_pallet = pallets_index.get('id', pallet_id, position)
+            if suitable_pallet is None:
+                raise APIException(f'Не найдена паллета {pallet_id} в блоке построчной выгрузке')
+            new_suitable_pallets.append(SuitablePallets(pallet_product=pallet_product, pallet=suitable_pallet,
+                                                        **suitable_pallet_row))
+
+    PalletProduct.objects.bulk_create(new_products)
+    SuitablePallets.objects.bulk_create(new_suitable_pallets)
+
+    existing_codes = set(PalletContent.objects.filter(aggregation_code__in=codes).values_list('aggregation_code',
+                                                                                              flat=True))
+    new_codes = []
+    for _, element, pallet in filled_pallets:
+        for code in element.get('codes') or ():
+            if code in existing_codes:
+                continue
+            existing_codes.add(code)
+            new_codes.append(PalletContent(pallet=pallet, aggregation_code=code, product=pallet.product))
+    PalletContent.objects.bulk_create(new_codes)
+
+
 def fill_operation_products(operation: OperationBaseOperation, raw_data: Iterable[dict[str: str]]) -> None:
     """ Заполняет товары абстрактной операции """
 
+    raw_data = list(raw_data)
+    products = first_rows_by_keys(
+        Product.objects.filter(external_key__in=[task_product['product'] for task_product in raw_data]),
+        'external_key'
+    )
+
+    rows = []
     for task_product in raw_data:
-        product = Product.objects.filter(external_key=task_product['product']).first()
+        product = products.get(('external_key', str(task_product['product'])))
         if product is None:
             continue
 
         weight = 0 if task_product.get('weight') is None else task_product['weight']
         count = 0 if task_product.get('count') is None else task_product['count']
-        operation_products = OperationProduct.objects.create(product=product, weight=weight, count=count)
-        operation_products.fill_properties(operation)
+        rows.append(OperationProduct(product=product, weight=weight, count=count))
+
+    OperationProduct.bulk_create_for_operation(operation, rows)
 
 
 def fill_operation_pallets(operation: OperationBaseOperation, raw_data: Iterable[str | Pallet]) -> None:
     """ Заполняет информацию о паллетах абстрактной операции """
 
+    raw_data = list(raw_data)
+    pallets = first_rows_by_keys(
+        Pallet.objects.filter(id__in=[row for row in raw_data if not isinstance(row, Pallet)]), 'id'
+    )
+
+    rows = []
     for pallet_instance in raw_data:
         if isinstance(pallet_instance, Pallet):
             pallet = pallet_instance
         else:
-            pallet = Pallet.objects.filter(id=pallet_instance).first()
+            pallet = pallets.get(('id', pallet_instance))
         if pallet is None:
             continue
-        operation_pallets = OperationPallet.objects.create(pallet=pallet)
-        operation_pallets.fill_properties(operation)
+        rows.append(OperationPallet(pallet=pallet))
+
+    OperationPallet.bulk_create_for_operation(operation, rows)
 
 
 def fill_operation_cells(operation: OperationBaseOperation, raw_data: Iterable[dict[str: str]]) -> None:
     """ Заполняет ячейки абстрактной операции """
 
+    raw_data = list(raw_data)
+    cells_keys = set()
+    pallets_ids = set()
+    for element in raw_data:
+        cells_keys.add(element['cell'])
+        if element.get('cell_destination') is not None:
+            cells_keys.add(element['cell_destination'])
+        if element.get('pallet') is not None:
+            pallets_ids.add(element['pallet'])
+
+    cells_guids = {guid for guid in map(_get_uuid, cells_keys) if guid is not None}
+    cells = first_rows_by_keys(
+        StorageCell.objects.filter(Q(external_key__in=cells_keys) | Q(guid__in=cells_guids)), 'guid', 'external_key'
+    )
+    pallets = first_rows_by_keys(Pallet.objects.filter(id__in=pallets_ids), 'id')
+
+    rows = []
+    changed_pallets = {}
     for element in raw_data:
-        cell = StorageCell.objects.filter(Q(external_key=element['cell']) | Q(guid=element['cell'])).first()
+        cell = _find_by_guid_or_key(cells, element['cell'])
         if cell is None:
             continue
 
         if element.get('cell_destination') is not None:
-            cell_destination = StorageCell.objects.filter(
-                Q(external_key=element['cell_destination']) | Q(guid=element['cell_destination'])).first()
+            cell_destination = _find_by_guid_or_key(cells, element['cell_destination'])
         else:
             cell_destination = None
 
         if element.get('pallet') is not None:
-            pallet = Pallet.objects.filter(id=element['pallet']).first()
+            pallet = pallets.get(('id', element['pallet']))
 
             if pallet is not None and not pallet.series and element.get('series') is not None:
                 pallet.series = element.get('series')
-                pallet.save()
+                changed_pallets[pallet.pk] = pallet
         else:
             pallet = None
-        operation_cell = OperationCell.objects.create(cell_source=cell, cell_destination=cell_destination,
-                                                      pallet=pallet)
-        operation_cell.fill_properties(operation)
+        rows.append(OperationCell(cell_source=cell, cell_destination=cell_destination, pallet=pallet))
+
+    Pallet.objects.bulk_update(changed_pallets.values(), ['series'])
+    OperationCell.bulk_create_for_operation(operation, rows)
 
 
 def get_or_create_external_source(raw_data: dict[str: str], field_name='external_source') -> ExternalSource:
     """ Создает либо находит элемент таблицы внешнего источника """
 
-    external_source = ExternalSource.objects.filter(
-        external_key=raw_data[field_name]['external_key']).first()
-    if external_source is None:
-        external_source = ExternalSource.objects.create(**raw_data[field_name])
-    return external_source
+    external_sources, _ = resolve_external_sources((raw_data[field_name],))
+    return external_sources[raw_data[field_name]['external_key']]
+
+
+def resolve_external_sources(
+        sources_data: Iterable[dict[str: str]],
+        task_model: type[Task] | None = None
+) -> tuple[dict[str, ExternalSource], dict[str, Task]]:
+    """ Находит либо создает одним запросом внешние источники пакета документов.
+    Возвращает внешние источники по внешнему ключу и уже созданные по ним задания task_model """
+
+    unique_sources_data = {}
+    for source_data in sources_data:
+        unique_sources_data.setdefault(source_data['external_key'], source_data)
+    if not unique_sources_data:
+        return {}, {}
+
+    table = ExternalSource._meta.db_table
+    fields = [field for field in ExternalSource._meta.concrete_fields if not field.primary_key]
+    columns = [field.column for field in fields]
+    params = []
+    for source_data in unique_sources_data.values():
+        instance = ExternalSource(**source_data)
+        params += [field.get_db_prep_save(field.pre_save(instance, True), connection) for field in fields]
+
+    placeholders = ', '.join([f'({", ".join(["%s"] * len(fields))})'] * len(unique_sources_data))
+    # Существующие строки не переписываются: RETURNING вернет только новые, остальные читаются отдельно
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO {table} ({", ".join(columns)}) VALUES {placeholders}
+            ON CONFLICT (external_key) DO NOTHING
+            RETURNING id, {", ".join(columns)}
+        """, params)
+        field_names = ['id'] + [field.attname for field in fields]
+        external_sources = {}
+        for row in cursor.fetchall():
+            external_source = ExternalSource.from_db(None, field_names, row)
+            external_sources[external_source.external_key] = external_source
+
+    existing_keys = unique_sources_data.keys() - external_sources.keys()
+    if existing_keys:
+        external_sources.update((external_source.external_key, external_source)
+                                for external_source in ExternalSource.objects.filter(external_key__in=existing_keys))
+
+    tasks = {}
+    if task_model is not None:
+        sources_keys = {external_source.pk: key for key, external_source in external_sources.items()}
+        for task in task_model.objects.filter(external_source__in=sources_keys).order_by('pk'):
+            tasks.setdefault(sources_keys[task.external_source_id], task)
+
+    return external_sources, tasks
 
 
 @transaction.atomic
@@ -542,20 +806,76 @@ def change_cell_content_state(content: dict[str: str], pallet: Pallet) -> str:
     return new_status
 
 
-def get_cell_state(**kwargs) -> StorageCellContentState | None:
-    filter_kwargs = kwargs.copy()
-    filter_kwargs['status'] = StatusCellContent.PLACED
+def get_cell_state(**kwargs) -> StorageCellOccupancy | None:
+    """ Возвращает текущее размещение паллеты в ячейке по отбору (pallet=, cell=) """
+    return StorageCellOccupancy.objects.filter(**kwargs).select_related('cell', 'pallet').order_by(
+        '-placed_date').first()
 
-    if not StorageCellContentState.objects.filter(**filter_kwargs).exists():
-        return None
 
-    change_state_row = StorageCellContentState.objects.filter(**filter_kwargs).latest('creating_date')
-    filter_kwargs.pop('status')
-    last_state_row = StorageCellContentState.objects.filter(**filter_kwargs).latest('creating_date')
-    if change_state_row.pk != last_state_row.pk:
-        return None
+def get_pallets_cells(pallets: Iterable[Pallet]) -> dict:
+    """ Возвращает текущие ячейки паллет одним запросом в виде {guid паллеты: ячейка} """
+    occupancy = StorageCellOccupancy.objects.filter(pallet__in=pallets).select_related('cell__storage_area')
+    return {row.pallet_id: row.cell for row in occupancy}
+
+
+def get_pallets_sources(pallets: Iterable[Pallet]) -> dict:
+    """ Возвращает источники паллет одним запросом в виде {guid паллеты: [источники]} """
+    result = defaultdict(list)
+    sources = PalletSource.objects.filter(pallet__in=pallets).select_related('pallet_source', 'product', 'user')
+    for source in sources:
+        result[source.pallet_id].append(source)
+    return result
 
-    return last_state_row
+
+def get_operations_pallets(operations: Iterable[OperationBaseOperation],
+                           pallets: QuerySet | None = None) -> dict[uuid.UUID, list[Pallet]]:
+    """ Получает паллеты операций одним запросом в виде {guid операции: [паллеты]}.
+    В pallets передается выборка паллет с отбором и связанными объектами """
+    guids = [operation.guid for operation in operations]
+    if pallets is None:
+        pallets = Pallet.objects.all()
+
+    result = {guid: [] for guid in guids}
+    pallets = (pallets.filter(operation_pallets__operation__in=guids)
+               .annotate(operation_guid=F('operation_pallets__operation'))
+               .distinct()
+               .order_by('creation_date', 'pk'))
+    for pallet in pallets:
+        result[pallet.operation_guid].append(pallet)
+    return result
+
+
+def group_collect_pallets(pallets: Iterable[Pallet]) -> dict[str, list[Pallet]]:
+    """ Делит паллеты сборки на полуфабрикаты, готовую продукцию и немаркируемую продукцию """
+    groups = {'semi': [], 'complete': [], 'not_marked': []}
+    for pallet in pallets:
+        if pallet.product is None:
+            continue
+        if pallet.product.semi_product:
+            groups['semi'].append(pallet)
+        if pallet.product.not_marked:
+            groups['not_marked'].append(pallet)
+        if not pallet.product.semi_product and not pallet.product.not_marked:
+            groups['complete'].append(pallet)
+    return groups
+
+
+def rebuild_cell_occupancy(pallets: Iterable | None = None) -> int:
+    """ Пересчитывает текущее размещение паллет по журналу состояний ячеек.
+    Если паллеты не переданы, пересчитывается размещение всех паллет """
+    states = StorageCellContentState.objects.order_by('pallet', '-creating_date', '-pk').distinct('pallet')
+    occupancy = StorageCellOccupancy.objects.all()
+    if pallets is not None:
+        states = states.filter(pallet__in=pallets)
+        occupancy = occupancy.filter(pallet__in=pallets)
+
+    with transaction.atomic():
+        occupancy.delete()
+        rows = [StorageCellOccupancy(pallet_id=state.pallet_id, cell_id=state.cell_id, placed_date=state.creating_date)
+                for state in states.iterator() if state.status == StatusCellContent.PLACED]
+        StorageCellOccupancy.objects.bulk_create(rows, batch_size=1000)
+
+    return len(rows)
 
 
 def get_pallet_filter_from_shipment(shipment_external_key: str) -> dict[str, list] | None:
@@ -571,20 +891,25 @@ def get_pallet_filter_from_shipment(shipment_external_key: str) -> dict[str, lis
     return {'guid__in': list(cells)}
 
 
-def get_unused_cells_for_placement() -> list[StorageCell]:
-    """ Возвращает список не занятых ячеек для автоматического размещения """
+def get_unused_cells_for_placement(limit: int | None = None, storage_area: str | None = None) -> QuerySet:
+    """ Возвращает не занятые ячейки для автоматического размещения, упорядоченные по стеллажу и позиции.
+    Ячейки, указанные в инвентаризациях, считаются занятыми """
 
-    inventory_ids = list(InventoryOperation.objects.all().values_list('guid', flat=True))
-    used_cells = OperationCell.objects.filter(operation__in=inventory_ids).values_list('cell_source__guid', flat=True)
-    cells = StorageCell.objects.filter(storage_area__use_for_automatic_placement=True).exclude(guid__in=used_cells)
+    occupied = StorageCellOccupancy.objects.filter(cell=OuterRef('pk'))
+    used_in_inventory = OperationCell.objects.filter(cell_source=OuterRef('pk'),
+                                                     type_operation=InventoryOperation.type_task)
 
-    result = []
-    for cell in cells:
-        state = get_cell_state(cell=cell)
-        if not state or state.status == StatusCellContent.REMOVED:
-            result.append(cell)
+    cells = StorageCell.objects.filter(storage_area__use_for_automatic_placement=True).filter(
+        ~Exists(occupied), ~Exists(used_in_inventory)).select_related('storage_area').order_by(
+        'rack_number', 'position', 'name')
 
-    return result
+    if storage_area is not None:
+        cells = cells.filter(storage_area__external_key=storage_area)
+
+    if limit is not None:
+        cells = cells[:limit]
+
+    return cells
 
 
 def get_pallets_in_acceptance(value: str) -> dict[str, list] | None: